@@ -5,6 +5,7 @@ import sys
 import shutil
 import PySide2.QtCore as QtCore
 from ..lib import driver_database
+from ..lib.driver_journal import DriverJournal
 
 # generate altai config dir if if does not exist;
 # under Unix '~/.local/share/data/altai'
@@ -25,4 +26,6 @@ if not os.path.isfile(local_db_fname):
     shutil.copy(included_db_fname, local_db_fname)
 
 # load driver database
-driver_db = driver_database.DriverDB.from_file(local_db_fname)
+driver_db = driver_database.DriverDB.from_file(local_db_fname, cache=True)
+# changes are appended to a journal, which is compacted on exit
+driver_journal = DriverJournal(driver_db, local_db_fname, cache=True)
@@ -5,63 +5,118 @@ import PySide2.QtCore as QtCore
 import PySide2.QtGui as QtGui
 from . import config
 from ..lib.driver import Driver
+from ..lib.driver_import import import_drivers
+from .driver_table_model import DriverTableModel
 
 
 class DriverDatabaseFrame(QtWidgets.QWidget):
     """Display, sort, filter, etc the database of availabe drive units."""
 
-    new_manufacturer_added = QtCore.Signal(set)
+    new_manufacturer_added = QtCore.Signal(list)
+
+    #: Parameters that can be searched: label, column and unit factor
+    search_fields = [("d [in]", "diameter", 1.0),
+                     ("Fs [Hz]", "fs", 1.0),
+                     ("Qts", "Qts", 1.0),
+                     (u"Vas [l]", "Vas", 1e-3),
+                     ("xmax [mm]", "xmax", 1e-3)]
 
     def __init__(self):
         """Initialize database frame."""
         QtWidgets.QWidget.__init__(self)
 
-        self.table_widget = QtWidgets.QTableWidget(self)
-        self.table_widget.setSortingEnabled(True)
-        labels = ["Manufacturer", "Model", "d [in]", "Fs [Hz]", u"Vas [m³]",
-                  u"Sd [m²]", "Qts", "Qes", "xmax [mm]", "m [kg]", 
-                  "P (AES) [W]"]
-        self.table_widget.setColumnCount(len(labels))
-        self.table_widget.setHorizontalHeaderLabels(labels)
-
-        # populate table
-        for driver in config.driver_db:
-            self.add_driver_entry(driver)
+        # cells are only formatted when shown, so the table is cheap to
+        # create for any size of database
+        self.table_model = DriverTableModel(config.driver_db, self)
+        self.table_view = QtWidgets.QTableView(self)
+        self.table_view.setModel(self.table_model)
+        self.table_view.setSortingEnabled(True)
+
+        # range search; the query is cheap enough to rerun on every key
+        search_group = QtWidgets.QGroupBox("Search")
+        search_grid = QtWidgets.QGridLayout()
+        self.search_lines = []
+        validator = QtGui.QDoubleValidator(self)
+        for column, (label, name, factor) in enumerate(self.search_fields):
+            search_grid.addWidget(QtWidgets.QLabel(label), 0, column)
+            lines = []
+            for row, text in [(1, "min"), (2, "max")]:
+                line = QtWidgets.QLineEdit(self)
+                line.setPlaceholderText(text)
+                line.setValidator(validator)
+                line.textChanged.connect(self.apply_search)
+                search_grid.addWidget(line, row, column)
+                lines.append(line)
+            self.search_lines.append(lines)
+        search_group.setLayout(search_grid)
 
         add_driver_button = QtWidgets.QPushButton(self)
         add_driver_button.setIcon(QtGui.QIcon.fromTheme('list-add'))
         add_driver_button.setText("Add new driver")
         add_driver_button.clicked.connect(self.add_driver)
+        import_button = QtWidgets.QPushButton(self)
+        import_button.setIcon(QtGui.QIcon.fromTheme('document-import'))
+        import_button.setText("Import catalog")
+        import_button.clicked.connect(self.import_catalog)
+        buttons_hbox = QtWidgets.QHBoxLayout()
+        buttons_hbox.addWidget(add_driver_button)
+        buttons_hbox.addWidget(import_button)
         vbox = QtWidgets.QVBoxLayout()
-        vbox.addWidget(add_driver_button, stretch=0)
-        vbox.addWidget(self.table_widget)
+        vbox.addLayout(buttons_hbox, stretch=0)
+        vbox.addWidget(search_group, stretch=0)
+        vbox.addWidget(self.table_view)
         self.setLayout(vbox)
 
-    def add_driver_entry(self, driver):
-        """Add a new driver entry to the QTableWidget.
-
-        Args:
-            driver : driver to add to the table
-        """
-        rows = self.table_widget.rowCount()
-        self.table_widget.setRowCount(rows+1)
-
-        items = []
-        items.append(QtWidgets.QTableWidgetItem(driver.manufacturer))
-        items.append(QtWidgets.QTableWidgetItem(driver.model))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.diameter)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.fs)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.Vas)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.Sd)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.Qts)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.Qes)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(1e3*driver.xmax)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.weight)))
-        items.append(QtWidgets.QTableWidgetItem("{0:4g}".format(driver.power)))
-
-        for i, item in enumerate(items):
-            item.setFlags(item.flags() ^ QtCore.Qt.ItemIsEditable)
-            self.table_widget.setItem(rows, i, item)
+    def reload(self):
+        """Show the database again, after it was changed by another
+        process."""
+        self.table_model.reload()
+
+    def apply_search(self):
+        """Show only the drivers within the ranges of the search fields."""
+        ranges = {}
+        for (label, name, factor), lines in zip(self.search_fields,
+                                                self.search_lines):
+            bounds = []
+            for line in lines:
+                try:
+                    bounds.append(factor * float(line.text()))
+                except ValueError:
+                    bounds.append(None)
+            if bounds != [None, None]:
+                ranges[name] = tuple(bounds)
+        self.table_model.set_ranges(ranges)
+
+    def import_catalog(self):
+        """Import drivers from a CSV or JSON vendor catalog."""
+        fname, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Import catalog", "", "Catalogs (*.csv *.json)")
+        if not fname:
+            return
+        manufacturers = set(config.driver_db.manufacturers)
+        generation = config.driver_journal.generation
+        try:
+            report = import_drivers(config.driver_db, fname,
+                                    journal=config.driver_journal)
+        except (OSError, ValueError) as error:
+            QtWidgets.QMessageBox.warning(self, "Import catalog", str(error))
+            return
+
+        if config.driver_journal.generation > generation + 1:
+            # changes by other processes were picked up as well
+            self.reload()
+        else:
+            self.table_model.drivers_appended(len(report.added))
+        if set(config.driver_db.manufacturers) != manufacturers:
+            self.new_manufacturer_added.emit(
+                config.driver_db.sorted_manufacturers)
+
+        message = "{0} drivers added, {1} already in the database.".format(
+            len(report.added), len(report.duplicates))
+        if report.errors:
+            message += "\n\n{0} rows skipped:\n".format(len(report.errors))
+            message += "\n".join(str(error) for error in report.errors[:20])
+        QtWidgets.QMessageBox.information(self, "Import catalog", message)
 
     def add_driver(self):
         """Dialog for adding a new driver to the database."""
@@ -178,11 +233,18 @@ class DriverDatabaseFrame(QtWidgets.QWidget):
         new_driver.Sd = self.Sd_box.value()/1e4  # cm² to m²
         new_driver.xmax = self.xmax_box.value()/1e3  # mm to m
 
-        config.driver_db.append(new_driver)
-        config.driver_db.write_to_disk(config.local_db_fname)
-        self.add_driver_entry(new_driver)
-
-        if new_driver.manufacturer not in config.driver_db.manufacturers:
-            config.driver_db.manufacturers.add(new_driver.manufacturer)
-            self.new_manufacturer_added.emit(config.driver_db.manufacturers)
+        new_manufacturer = (new_driver.manufacturer not in
+                            config.driver_db.manufacturers)
+        generation = config.driver_journal.generation
+        config.driver_journal.add(new_driver)
+        # changes by other processes may have been picked up as well
+        reloaded = config.driver_journal.generation > generation + 1
+        if reloaded:
+            self.reload()
+        else:
+            self.table_model.drivers_appended(1)
+
+        if new_manufacturer or reloaded:
+            self.new_manufacturer_added.emit(
+                config.driver_db.sorted_manufacturers)
         self.add_driver_dialog.accept()
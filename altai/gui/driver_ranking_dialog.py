@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+""" Dialog ranking all drivers of the database for the current box """
+import PySide2.QtCore as QtCore
+import PySide2.QtWidgets as QtWidgets
+from . import config
+from ..lib.ranking import rank_drivers
+
+
+class DriverRankingDialog(QtWidgets.QDialog):
+    """ Show the best drivers of the database for a given box
+
+    The drivers can be ranked by f3, reference efficiency, displacement
+    limited output or passband flatness.
+    """
+
+    metrics = [("Lowest f3", "f_3"),
+               ("Highest reference efficiency", "reference_efficiency"),
+               ("Highest displacement limited output",
+                "displacement_limited_output"),
+               ("Flattest passband", "ripple")]
+
+    def __init__(self, box, parent=None):
+        QtWidgets.QDialog.__init__(self, parent)
+        self.box = box
+        self.setWindowTitle("Rank Drivers")
+
+        form = QtWidgets.QFormLayout()
+        self.metric_box = QtWidgets.QComboBox(self)
+        for text, _ in self.metrics:
+            self.metric_box.addItem(text)
+        self.metric_box.activated.connect(self.update_ranking)
+        self.count_box = QtWidgets.QSpinBox(self)
+        self.count_box.setRange(1, 1000)
+        self.count_box.setValue(20)
+        self.count_box.valueChanged.connect(self.update_ranking)
+        form.addRow("Rank by", self.metric_box)
+        form.addRow("Number of drivers", self.count_box)
+
+        self.table_widget = QtWidgets.QTableWidget(self)
+        labels = ["Manufacturer", "Model", "f3 [Hz]", u"η0 [%]",
+                  "Displ. limited output [dB]", "Ripple [dB]"]
+        self.table_widget.setColumnCount(len(labels))
+        self.table_widget.setHorizontalHeaderLabels(labels)
+
+        close_button = QtWidgets.QPushButton("Close", self)
+        close_button.clicked.connect(self.accept)
+
+        vbox = QtWidgets.QVBoxLayout()
+        vbox.addLayout(form)
+        vbox.addWidget(self.table_widget)
+        vbox.addWidget(close_button, alignment=QtCore.Qt.AlignRight)
+        self.setLayout(vbox)
+        self.update_ranking()
+
+    def update_ranking(self):
+        """ Rank the database and refill the table """
+        metric = self.metrics[self.metric_box.currentIndex()][1]
+        scores = rank_drivers(config.driver_db, self.box, by=metric,
+                              k=self.count_box.value())
+        self.table_widget.setRowCount(len(scores))
+        for row, score in enumerate(scores):
+            texts = [score.driver.manufacturer,
+                     score.driver.model,
+                     "{0:4g}".format(score.f_3),
+                     "{0:4g}".format(1e2 * score.reference_efficiency),
+                     "{0:4g}".format(score.displacement_limited_output),
+                     "{0:.2f}".format(score.ripple)]
+            for column, text in enumerate(texts):
+                item = QtWidgets.QTableWidgetItem(text)
+                item.setFlags(item.flags() ^ QtCore.Qt.ItemIsEditable)
+                self.table_widget.setItem(row, column, item)
+        self.table_widget.resizeColumnsToContents()
@@ -27,17 +27,13 @@ class DriverSelectionGroup(QtWidgets.QGroupBox):
         self.driver_model_box = QtWidgets.QComboBox(self)
         self.driver_model_box.activated.connect(self.change_driver)
 
-        for manufacturer in config.driver_db.manufacturers:
-            self.driver_manuf_box.addItem(manufacturer)
+        self.driver_manuf_box.addItems(config.driver_db.sorted_manufacturers)
         self.current_manuf = self.driver_manuf_box.currentText()
-        for driver in config.driver_db:
-            if driver.manufacturer == self.current_manuf:
-                self.driver_model_box.addItem(driver.model)
+        for driver in config.driver_db.drivers_of(self.current_manuf):
+            self.driver_model_box.addItem(driver.model)
         self.current_model = self.driver_model_box.currentText()
-        for driver in config.driver_db:
-            if ((self.current_model == driver.model) and
-                    (self.current_manuf == driver.manufacturer)):
-                self.current_driver = driver
+        self.current_driver = config.driver_db.get(self.current_manuf,
+                                                   self.current_model)
 
         driver_selection_form.addRow(driver_manuf_label, self.driver_manuf_box)
         driver_selection_form.addRow(driver_model_label, self.driver_model_box)
@@ -45,20 +41,25 @@ class DriverSelectionGroup(QtWidgets.QGroupBox):
 
     def update_drivers(self, manufacturers):
         """ When manufacturer is added to DB, update the comboboxes in this
-        group """
+        group; keep the selected driver if it is still there """
+        manuf, model = self.current_manuf, self.current_model
         self.driver_manuf_box.clear()
-        for manufacturer in manufacturers:
-            self.driver_manuf_box.addItem(manufacturer)
-        self.set_manufacturer(0)
+        self.driver_manuf_box.addItems(manufacturers)
+        index = max(self.driver_manuf_box.findText(manuf), 0)
+        self.driver_manuf_box.setCurrentIndex(index)
+        self.set_manufacturer(index)
+        index = self.driver_model_box.findText(model)
+        if index > 0:
+            self.driver_model_box.setCurrentIndex(index)
+            self.change_driver()
 
     def set_manufacturer(self, index):
         """ Change manufacturer, repopulate model box and emit driver change
             signal"""
         self.current_manuf = self.driver_manuf_box.itemText(index)
         self.driver_model_box.clear()
-        for driver in config.driver_db:
-            if driver.manufacturer == self.current_manuf:
-                self.driver_model_box.addItem(driver.model)
+        for driver in config.driver_db.drivers_of(self.current_manuf):
+            self.driver_model_box.addItem(driver.model)
         self.change_driver()
 
     def change_driver(self):
@@ -66,8 +67,6 @@ class DriverSelectionGroup(QtWidgets.QGroupBox):
         selected driver """
         self.current_manuf = self.driver_manuf_box.currentText()
         self.current_model = self.driver_model_box.currentText()
-        for driver in config.driver_db:
-            if ((self.current_model == driver.model) and
-                    (self.current_manuf == driver.manufacturer)):
-                self.current_driver = driver
+        self.current_driver = config.driver_db.get(self.current_manuf,
+                                                   self.current_model)
         self.driver_changed.emit(self.current_driver)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Table model presenting the driver database to a QTableView."""
+import numpy as np
+import PySide2.QtCore as QtCore
+
+# label, driver attribute and factor for display; strings have no factor
+COLUMNS = [("Manufacturer", "manufacturer", None),
+           ("Model", "model", None),
+           ("d [in]", "diameter", 1.0),
+           ("Fs [Hz]", "fs", 1.0),
+           (u"Vas [m³]", "Vas", 1.0),
+           (u"Sd [m²]", "Sd", 1.0),
+           ("Qts", "Qts", 1.0),
+           ("Qes", "Qes", 1.0),
+           ("xmax [mm]", "xmax", 1e3),
+           ("m [kg]", "weight", 1.0),
+           ("P (AES) [W]", "power", 1.0)]
+
+#: Newly added drivers are inserted one by one into a sorted table up to
+#: this many; more are merged in by sorting again
+MAX_SORTED_INSERTS = 64
+
+
+class DriverTableModel(QtCore.QAbstractTableModel):
+    """The drivers of a database, filtered and sorted, as table.
+
+    The model only holds the positions of the shown drivers in the
+    database, in display order. Cells are formatted when the view asks for
+    them, numbers straight from the columns of the database, so drivers
+    that are never shown are never touched. Sorting and filtering permute
+    the positions.
+    """
+
+    def __init__(self, driver_db, parent=None):
+        """Create a model showing all drivers.
+
+        Args:
+            driver_db : the :class:`~altai.lib.driver_database.DriverDB`
+            parent : parent object
+        """
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.driver_db = driver_db
+        #: Parameter ranges the shown drivers lie in, see
+        #: :meth:`~altai.lib.driver_database.DriverDB.query`
+        self.ranges = {}
+        self.sort_column = None
+        self.sort_order = QtCore.Qt.AscendingOrder
+        self.rows = np.arange(len(driver_db))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return COLUMNS[section][0]
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation,
+                                                     role)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Format a cell; the ``UserRole`` is the position of the driver in
+        the database."""
+        if not index.isValid():
+            return None
+        position = int(self.rows[index.row()])
+        if role == QtCore.Qt.UserRole:
+            return position
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        _, name, factor = COLUMNS[index.column()]
+        if factor is None:
+            return getattr(self.driver_db[position], name)
+        return "{0:4g}".format(factor * self.driver_db.columns[name][position])
+
+    def driver(self, row):
+        """Return the driver shown in a row.
+
+        Args:
+            row : row of the table
+        """
+        return self.driver_db[int(self.rows[row])]
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """Sort the rows by a column, keeping the selection."""
+        self.sort_column = column if column >= 0 else None
+        self.sort_order = order
+        self._permute(self._sorted(self.rows))
+
+    def set_ranges(self, ranges):
+        """Show only the drivers whose parameters lie within ranges.
+
+        Args:
+            ranges : see :meth:`~altai.lib.driver_database.DriverDB.query`
+        """
+        self.beginResetModel()
+        self.ranges = dict(ranges)
+        self.rows = self._sorted(self.driver_db.query(**self.ranges).indexes)
+        self.endResetModel()
+
+    def reload(self):
+        """Show the database again, e.g. after it was loaded anew."""
+        self.set_ranges(self.ranges)
+
+    def drivers_appended(self, count):
+        """Show drivers that were appended to the database.
+
+        Args:
+            count : number of drivers appended at the end of the database
+        """
+        n = len(self.driver_db)
+        positions = np.arange(n - count, n)
+        positions = positions[self._matches(positions)]
+        if len(positions) == 0:
+            return
+        if self.sort_column is not None and len(positions) <= MAX_SORTED_INSERTS:
+            keys = self._keys()
+            for position in positions:
+                row = self._insertion_row(keys, position)
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self.rows = np.insert(self.rows, row, position)
+                self.endInsertRows()
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QtCore.QModelIndex(), first,
+                             first + len(positions) - 1)
+        self.rows = np.concatenate([self.rows, positions])
+        self.endInsertRows()
+        if self.sort_column is not None:
+            self._permute(self._sorted(self.rows))
+
+    def _permute(self, rows):
+        """Show the same drivers in another order, keeping the selection."""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        positions = [int(self.rows[index.row()]) for index in persistent]
+        self.rows = rows
+        if persistent:
+            lookup = {position: row
+                      for row, position in enumerate(self.rows.tolist())}
+            self.changePersistentIndexList(
+                persistent, [self.index(lookup[position], index.column())
+                             for position, index in zip(positions, persistent)])
+        self.layoutChanged.emit()
+
+    def _keys(self):
+        """Sort keys of all drivers of the database, for the sort column.
+
+        Names are sorted by their codes, so no driver is created.
+        """
+        _, name, factor = COLUMNS[self.sort_column]
+        if factor is None:
+            return self.driver_db.columns.sort_codes(name)
+        return self.driver_db.columns[name]
+
+    def _sorted(self, rows):
+        """Order positions of drivers by the sort column."""
+        rows = np.asarray(rows, dtype=np.intp)
+        if self.sort_column is None:
+            return np.sort(rows)
+        order = np.argsort(self._keys()[rows], kind='stable')
+        if self.sort_order == QtCore.Qt.DescendingOrder:
+            order = order[::-1]
+        return rows[order]
+
+    def _insertion_row(self, keys, position):
+        """Row at which a driver belongs in the sorted table."""
+        shown = keys[self.rows]
+        if self.sort_order == QtCore.Qt.DescendingOrder:
+            return int(np.sum(shown >= keys[position]))
+        return int(np.sum(shown <= keys[position]))
+
+    def _matches(self, positions):
+        """Check which drivers lie within :attr:`ranges`."""
+        mask = np.ones(len(positions), dtype=bool)
+        columns = self.driver_db.columns
+        for name, bound in self.ranges.items():
+            low, high = bound if isinstance(bound, tuple) else (bound, bound)
+            values = columns[name][positions]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return mask
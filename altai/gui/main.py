@@ -38,6 +38,11 @@ class Gui(QtWidgets.QMainWindow):
 
         self.main_frames = [vented_box_frame, vent_dimensions_frame,
                             driver_database_frame]
+
+        # pick up drivers added by other instances of Altai
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_driver_db)
+        self.refresh_timer.start(2000)
         vbox = QtWidgets.QVBoxLayout()
         vbox.addWidget(self.tab_bar)
         for i, frame in enumerate(self.main_frames):
@@ -57,6 +62,17 @@ class Gui(QtWidgets.QMainWindow):
             else:
                 frame.hide()
 
+    def refresh_driver_db(self):
+        """ Reload the driver database if another process changed it """
+        if not config.driver_journal.refresh():
+            return
+        vented_box_frame, vent_dimensions_frame, driver_database_frame = \
+            self.main_frames
+        driver_database_frame.reload()
+        manufacturers = config.driver_db.sorted_manufacturers
+        vented_box_frame.driver_selection.update_drivers(manufacturers)
+        vent_dimensions_frame.driver_selection.update_drivers(manufacturers)
+
     def create_menu(self):
         """ Create main menu """
         menu_file = self.menuBar().addMenu("&File")
@@ -89,7 +105,7 @@ class Gui(QtWidgets.QMainWindow):
         fname, _ = QtWidgets.QFileDialog.getSaveFileName(
             self, "Save Response as", home,
             "PDF, PNG and SVG (*.pdf *.png *.svg)")
-        self.main_frames[0].fig.savefig(fname)
+        self.main_frames[0].save_figure(fname)
 
     def create_about_window(self):
         """ Creates the about window for Altai. """
@@ -111,6 +127,7 @@ class Gui(QtWidgets.QMainWindow):
 def main():
     """ Main function; acts as entry point for Altai. """
     app = QtWidgets.QApplication(sys.argv)
+    app.aboutToQuit.connect(lambda: config.driver_journal.compact(cache=True))
     gui = Gui()
     gui.resize(800, 600)
     gui.show()
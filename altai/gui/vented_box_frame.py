@@ -1,5 +1,6 @@
 """ Calculate and plot the frequency response of box/driver combinations """
 # system imports
+import os
 import numpy as np
 import PySide2.QtGui as QtGui
 import PySide2.QtCore as QtCore
@@ -7,9 +8,13 @@ import PySide2.QtWidgets as QtWidgets
 import scipy.signal as signal
 
 # altai imports
+from . import config
 from .driver_selection_group import DriverSelectionGroup
+from .driver_ranking_dialog import DriverRankingDialog
 from ..lib.vented_box import VentedBox
-from ..lib.speaker import VentedSpeaker
+from ..lib.simulation_cache import SimulationCache
+from ..lib.speaker import F_MIN, F_MAX
+from ..lib.tolerance import tolerance_analysis
 
 # Matplotlib setup
 import matplotlib as mpl
@@ -19,6 +24,49 @@ mpl.rcParams["lines.linewidth"] = 2.0
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 import matplotlib.figure as figure
 
+#: Fixed time base of the step response plot, in s
+STEP_RESPONSE_TIMES = np.linspace(0.0, 0.1, 200)
+#: Number of realizations of the tolerance bands
+TOLERANCE_SAMPLES = 20000
+#: Changes within this time are combined into one update, in ms
+UPDATE_INTERVAL = 16
+
+
+class ResponseSignals(QtCore.QObject):
+    """ Signals of a ResponseWorker; a QRunnable cannot have its own """
+
+    finished = QtCore.Signal(int, object)
+
+
+class ResponseWorker(QtCore.QRunnable):
+    """ Simulate a box/driver combination in a background thread
+
+    Emits ``signals.finished`` with the request number and the results, or
+    ``None`` if the request was superseded before it was done.
+    """
+
+    def __init__(self, request, driver, box, simulations, tolerance=None,
+                 is_current=lambda request: True):
+        QtCore.QRunnable.__init__(self)
+        self.signals = ResponseSignals()
+        self.request = request
+        self.driver = driver
+        self.box = box
+        self.simulations = simulations
+        self.tolerance = tolerance
+        self.is_current = is_current
+
+    def run(self):
+        """ Compute the responses and, if asked for, the tolerance bands """
+        results = self.simulations.simulate(self.driver, self.box)
+        if self.tolerance is not None and self.is_current(self.request):
+            results = dict(results, tolerance=tolerance_analysis(
+                self.driver, self.box, n=TOLERANCE_SAMPLES,
+                tolerance=self.tolerance, random_state=0))
+        if not self.is_current(self.request):
+            results = None
+        self.signals.finished.emit(self.request, results)
+
 
 class VentedBoxFrame(QtWidgets.QWidget):
     """ Predict frequency response of vented boxes according to Thiele & Small
@@ -54,7 +102,17 @@ class VentedBoxFrame(QtWidgets.QWidget):
         # self.displacement_axes = self.fig.add_subplot(224)
         # self.displacement_line, = self.displacement_axes.plot(0.0, 0.0)
         self.set_plot_options()
-        self.canvas.draw()
+
+        # Only the current responses, their tolerance bands and the legend
+        # change while parameters are modified. They are left out of full
+        # redraws and blitted onto a copy of everything else.
+        self.amplitude_line.set_animated(True)
+        self.step_response_line.set_animated(True)
+        self.legend = None
+        self.legend_labels = []
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.draw_idle()
 
         # Box parameter setup
         box_param_group = QtWidgets.QGroupBox("Box Parameters")
@@ -92,20 +150,58 @@ class VentedBoxFrame(QtWidgets.QWidget):
         self.driver_selection.driver_changed.connect(self.driver_changed)
         self.current_driver = self.driver_selection.current_driver
 
+        # Production tolerances of the driver
+        tolerance_group = QtWidgets.QGroupBox("Driver Tolerances")
+        tolerance_form = QtWidgets.QFormLayout()
+        self.tolerance_checkbox = QtWidgets.QCheckBox("Show Tolerance Bands", self)
+        self.tolerance_checkbox.stateChanged.connect(self.update_response)
+        self.tolerance_spinbox = QtWidgets.QDoubleSpinBox(self)
+        self.tolerance_spinbox.setPrefix(u"± ")
+        self.tolerance_spinbox.setSuffix(" %")
+        self.tolerance_spinbox.setRange(1.0, 50.0)
+        self.tolerance_spinbox.setValue(15.0)
+        self.tolerance_spinbox.valueChanged.connect(self.update_response)
+        tolerance_form.addRow(self.tolerance_checkbox)
+        tolerance_form.addRow("fs, Qts and Vas", self.tolerance_spinbox)
+        tolerance_group.setLayout(tolerance_form)
+        self.tolerance_bands = []
+
         output_text = QtWidgets.QLabel(self)
         output_text.setText("Displacement limited output:")
         self.output_val = QtWidgets.QLabel(self)
 
+        # scrubbing the spinboxes revisits the same combinations over and over
+        self.simulations = SimulationCache(
+            directory=os.path.join(config.altai_config_dir, "simulations"),
+            step_times=STEP_RESPONSE_TIMES,
+        )
+
+        # responses are computed in the background, one at a time; changes
+        # arriving meanwhile are combined, so only the latest is computed
+        self.thread_pool = QtCore.QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.update_timer = QtCore.QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(UPDATE_INTERVAL)
+        self.update_timer.timeout.connect(self.start_worker)
+        self.response_request = 0
+        self.worker = None
+        self.worker_busy = False
+        self.current_results = None
         self.update_response()
 
         # Assemble main view
         compare_button = QtWidgets.QPushButton("Freeze and Compare", self)
         compare_button.clicked.connect(self.add_new_response)
+        rank_button = QtWidgets.QPushButton("Rank Drivers for this Box", self)
+        rank_button.clicked.connect(self.rank_drivers)
 
         leftPlane = QtWidgets.QVBoxLayout()
         leftPlane.addWidget(box_param_group)
         leftPlane.addWidget(self.driver_selection)
+        leftPlane.addWidget(tolerance_group)
         leftPlane.addWidget(compare_button, alignment=QtCore.Qt.AlignHCenter)
+        leftPlane.addWidget(rank_button, alignment=QtCore.Qt.AlignHCenter)
 
         rightPlane = QtWidgets.QVBoxLayout()
         rightPlane.addWidget(self.canvas, stretch=1)
@@ -139,54 +235,166 @@ class VentedBoxFrame(QtWidgets.QWidget):
         self.update_response()
 
     def update_response(self):
-        """ Update the response plot """
-        self.speaker = VentedSpeaker(self.current_driver, self.current_box)
-
-        freqs, amplitude = self.speaker.frequency_response()
-        self.amplitude_line.set_xdata(freqs)
-        self.amplitude_line.set_ydata(amplitude)
-
+        """ Schedule an update of the response plot """
+        self.response_request += 1
+        self.update_timer.start()
+
+    def start_worker(self):
+        """ Compute the response for the current parameters, unless a
+        computation is running; then it is started once that is done """
+        if self.worker_busy:
+            return
+        tolerance = None
+        if self.tolerance_checkbox.isChecked():
+            tolerance = 1e-2 * self.tolerance_spinbox.value()
+        box = VentedBox(self.current_box.Vab, self.current_box.fb,
+                        self.current_box.Ql)
+        worker = ResponseWorker(
+            self.response_request, self.current_driver, box, self.simulations,
+            tolerance, is_current=lambda request: request == self.response_request)
+        worker.signals.finished.connect(self.response_ready)
+        # keep the signals alive until the results are delivered
+        self.worker = worker
+        self.worker_busy = True
+        self.thread_pool.start(worker)
+
+    def response_ready(self, request, results):
+        """ Show the results of a worker, if they are still current """
+        self.worker_busy = False
+        if request != self.response_request or results is None:
+            # superseded; compute the latest parameters, unless the timer
+            # is about to do so
+            if not self.update_timer.isActive():
+                self.start_worker()
+            return
+        self.current_results = results
+
+        self.amplitude_line.set_xdata(results["freqs"])
+        self.amplitude_line.set_ydata(results["amplitude"])
+        self.amplitude_line.set_label(self.response_label())
+        self.update_legend()
+
+        self.step_response_line.set_xdata(results["step_t"])
+        self.step_response_line.set_ydata(results["step_response"])
+
+        self.update_tolerance_bands(results.get("tolerance"))
+        self.blit()
+        self.output_val.setText(f"{results['displacement_limited_output']:4g} dB")
+
+    def response_label(self):
+        """ Legend entry of the current box/driver combination """
         manufacturer = self.current_driver.manufacturer
         model = self.current_driver.model
         box_volume = 1e3 * self.current_box.Vab
         box_tuning = self.current_box.fb
-        label = "{0} {1} in {2:2g}l / {3}Hz".format(
+        return "{0} {1} in {2:2g}l / {3}Hz".format(
             manufacturer, model, box_volume, box_tuning
         )
-        self.amplitude_line.set_label(label)
-        self.amplitude_axes.legend(loc="lower right")
-
-        t, step_response = self.speaker.step_response()
-        self.step_response_line.set_xdata(t)
-        self.step_response_line.set_ydata(step_response)
-
-        self.canvas.draw()
-        self.output_val.setText(f"{self.speaker.displacement_limited_output():4g} dB")
 
     def add_new_response(self):
         """ Add an additional response to the plot """
-        self.speaker = VentedSpeaker(self.current_driver, self.current_box)
-        freqs, amplitude = self.speaker.frequency_response()
-        self.amplitude_line, = self.amplitude_axes.semilogx(freqs, amplitude)
-        t, step_response = self.speaker.step_response()
-        self.step_response_line, = self.step_response_axes.plot(t, step_response)
-        manufacturer = self.current_driver.manufacturer
-        model = self.current_driver.model
-        box_volume = 1e3 * self.current_box.Vab
-        box_tuning = self.current_box.fb
-        label = "{0} {1} in {2:2g}l / {3}Hz".format(
-            manufacturer, model, box_volume, box_tuning
-        )
+        results = self.current_results
+        if results is None:
+            return
+        label = self.amplitude_line.get_label()
+        # the frozen responses become part of the background
+        self.amplitude_line.set_animated(False)
+        self.step_response_line.set_animated(False)
+        self.amplitude_line, = self.amplitude_axes.semilogx(
+            results["freqs"], results["amplitude"], animated=True)
+        self.step_response_line, = self.step_response_axes.plot(
+            results["step_t"], results["step_response"], animated=True)
         self.amplitude_line.set_label(label)
-        self.amplitude_axes.legend(loc="lower right")
-        self.set_plot_options()
-        self.canvas.draw()
-        self.output_val.setText(f"{self.speaker.displacement_limited_output():4g} dB")
+        self.update_legend()
+        self.update_tolerance_bands(results.get("tolerance"))
+        self.canvas.draw_idle()
+        self.output_val.setText(f"{results['displacement_limited_output']:4g} dB")
+
+    def update_tolerance_bands(self, result):
+        """ Shade the spread of the response due to driver tolerances
+
+        Args:
+            result : the tolerance analysis, or None to remove the bands
+        """
+        for band in self.tolerance_bands:
+            band.remove()
+        self.tolerance_bands = []
+        if result is None:
+            return
+        color = self.amplitude_line.get_color()
+        for lower, upper, alpha in [(5, 95, 0.15), (25, 75, 0.3)]:
+            freqs, low, high = result.band(lower, upper)
+            self.tolerance_bands.append(self.amplitude_axes.fill_between(
+                freqs, low, high, color=color, alpha=alpha, linewidth=0.0,
+                animated=True))
+
+    def update_legend(self):
+        """ Update the legend texts; it is only rebuilt when the number of
+        entries changes """
+        _, labels = self.amplitude_axes.get_legend_handles_labels()
+        if labels == self.legend_labels:
+            return
+        if self.legend is not None and len(self.legend.texts) == len(labels):
+            for text, label in zip(self.legend.texts, labels):
+                text.set_text(label)
+        else:
+            self.legend = self.amplitude_axes.legend(loc="lower right")
+            self.legend.set_animated(True)
+        self.legend_labels = labels
+
+    def animated_artists(self):
+        """ The artists left out of the cached background """
+        artists = [self.amplitude_line, self.step_response_line]
+        artists += self.tolerance_bands
+        if self.legend is not None:
+            artists.append(self.legend)
+        return artists
+
+    def on_draw(self, event):
+        """ After a full redraw, cache the background and draw the changing
+        artists on top """
+        if event.canvas is not self.canvas:
+            # drawn into a file, see save_figure
+            return
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        """ Draw the changing artists onto the canvas """
+        for artist in self.animated_artists():
+            artist.axes.draw_artist(artist)
+
+    def blit(self):
+        """ Redraw only the changing artists, over the cached background """
+        if self.background is None:
+            # not drawn yet; the full redraw will show the current state
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    def save_figure(self, fname):
+        """ Save the plot as file; all filetypes that are supported by
+        matplotlib """
+        artists = self.animated_artists()
+        for artist in artists:
+            artist.set_animated(False)
+        try:
+            self.fig.savefig(fname)
+        finally:
+            for artist in artists:
+                artist.set_animated(True)
+
+    def rank_drivers(self):
+        """ Show the best drivers of the database for the current box """
+        dialog = DriverRankingDialog(self.current_box, self)
+        dialog.exec_()
 
     def set_plot_options(self):
         """ Set the appearance of the plot """
         # Axis limits and grid
-        self.amplitude_axes.set_xlim(20, 300)
+        self.amplitude_axes.set_xlim(F_MIN, F_MAX)
         self.amplitude_axes.set_ylim(-36, 6)
         self.amplitude_axes.grid(True, which="both")
 
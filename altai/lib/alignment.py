@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Search for good vented box alignments of a driver."""
+import concurrent.futures
+import numpy as np
+from .speaker import VentedSpeakerBatch
+from .vented_box import VentedBox
+
+
+class Alignment(object):
+    """A vented box for a driver, together with its figures of merit."""
+
+    def __init__(self, Vab, fb, Ql, f_3, ripple):
+        """Create a new alignment.
+
+        Args:
+            Vab : box volume in m³
+            fb : box tuning frequency in Hz
+            Ql : enclosure leakage losses
+            f_3 : lower -3 dB frequency in Hz
+            ripple : peak of the response above the passband level, in dB
+        """
+        self.Vab = Vab
+        self.fb = fb
+        self.Ql = Ql
+        self.f_3 = f_3
+        self.ripple = ripple
+
+    def box(self):
+        """Return the vented box of this alignment."""
+        return VentedBox(Vab=self.Vab, fb=self.fb, Ql=self.Ql)
+
+    def __repr__(self):
+        """Return a string representation of the alignment."""
+        return "{0:.3g}l / {1:.3g}Hz / Ql {2:.3g}: f3 {3:.3g}Hz, {4:.2f}dB".format(
+            1e3 * self.Vab, self.fb, self.Ql, self.f_3, self.ripple)
+
+
+def evaluate(driver, Vab, fb, Ql):
+    """Evaluate f3 and passband ripple of many boxes for one driver.
+
+    All box parameters are broadcast against each other.
+
+    Args:
+        driver : the driver
+        Vab : box volumes in m³
+        fb : box tuning frequencies in Hz
+        Ql : enclosure leakage losses
+
+    Returns:
+        f_3 : lower -3 dB frequencies, in the broadcast shape
+        ripple : passband ripple in dB, in the broadcast shape
+    """
+    Vab, fb, Ql = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                        for x in (Vab, fb, Ql)])
+    box = VentedBox(Vab=Vab, fb=fb, Ql=Ql)
+    batch = VentedSpeakerBatch(driver.Ts, driver.Cas, driver.Qts,
+                               box.Tb, box.Cab, box.Ql)
+    f_3 = batch.f_3().reshape(Vab.shape)
+    ripple = batch.passband_ripple().reshape(Vab.shape)
+    return f_3, ripple
+
+
+def _evaluate_chunk(arguments):
+    """Unpack arguments for :func:`evaluate`, for use in a process pool."""
+    return evaluate(*arguments)
+
+
+def find_alignments(driver, max_volume, target_f3=None, max_ripple=1.0,
+                    Ql=7.0, min_volume=None, fb_range=None, grid=(64, 64),
+                    refinements=4, processes=None):
+    """Find the Pareto-best vented boxes for a driver.
+
+    An alignment is better than another if it is smaller and reaches lower.
+    First, a coarse grid of box volumes and tuning frequencies (and all
+    given leakage losses) is evaluated in one vectorized pass. For each
+    volume on the Pareto front, the tuning is then refined locally by a
+    shrinking pattern search, again for all candidates at once.
+
+    Args:
+        driver : driver to find a box for
+        max_volume : largest acceptable box volume in m³
+        target_f3 : only return alignments reaching at least this low, in Hz
+        max_ripple : largest acceptable peak in the passband, in dB
+        Ql : leakage losses of the box; a sequence of values is searched
+        min_volume : smallest box volume to consider, by default a tenth of
+            ``max_volume``
+        fb_range : tuning frequencies to consider, in Hz, by default from
+            half to twice the drivers resonance frequency
+        grid : number of (volumes, tuning frequencies) of the coarse grid
+        refinements : number of refinement steps
+        processes : if given, split the coarse grid across this many
+            processes; only worth it for very fine grids
+
+    Returns:
+        list of :class:`Alignment`, sorted by volume
+
+    Example:
+        >>> alignments = find_alignments(driver, max_volume=0.1, max_ripple=0.5)
+        >>> smallest = alignments[0].box()
+    """
+    if min_volume is None:
+        min_volume = 0.1 * max_volume
+    if fb_range is None:
+        fb_range = (0.5 * driver.fs, 2.0 * driver.fs)
+    volumes = np.geomspace(min_volume, max_volume, grid[0])
+    tunings = np.geomspace(fb_range[0], fb_range[1], grid[1])
+    losses = np.atleast_1d(np.asarray(Ql, dtype=float))
+
+    Vab, fb, Ql = np.meshgrid(volumes, tunings, losses, indexing='ij')
+    if processes is None or processes < 2:
+        f_3, ripple = evaluate(driver, Vab, fb, Ql)
+    else:
+        chunks = [(driver, Vab[i], fb[i], Ql[i])
+                  for i in np.array_split(np.arange(len(volumes)), processes)]
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_evaluate_chunk, chunks))
+        f_3 = np.concatenate([result[0] for result in results])
+        ripple = np.concatenate([result[1] for result in results])
+
+    # best feasible tuning and leakage for every volume
+    f_3 = np.where(ripple <= max_ripple, f_3, np.inf).reshape(len(volumes), -1)
+    best = np.argmin(f_3, axis=1)
+    feasible = np.isfinite(f_3[np.arange(len(volumes)), best])
+    if not np.any(feasible):
+        return []
+    best_fb, best_Ql = np.unravel_index(best[feasible], fb.shape[1:])
+    Vab = volumes[feasible]
+    Ql = losses[best_Ql]
+    fb = tunings[best_fb]
+
+    # shrink a bracket of one coarse grid step around each tuning
+    step = np.log(tunings[1] / tunings[0]) if len(tunings) > 1 else 0.0
+    log_fb = np.log(fb)
+    offsets = np.linspace(-1.0, 1.0, 9)
+    for _ in range(refinements):
+        candidates = log_fb[:, np.newaxis] + step * offsets
+        f3_candidates, ripple_candidates = evaluate(
+            driver, Vab[:, np.newaxis], np.exp(candidates), Ql[:, np.newaxis])
+        f3_candidates = np.where(ripple_candidates <= max_ripple,
+                                 f3_candidates, np.inf)
+        choice = np.argmin(f3_candidates, axis=1)
+        improved = np.isfinite(f3_candidates[np.arange(len(Vab)), choice])
+        log_fb = np.where(improved,
+                          candidates[np.arange(len(Vab)), choice], log_fb)
+        step /= 4.0
+    fb = np.exp(log_fb)
+    f_3, ripple = evaluate(driver, Vab, fb, Ql)
+
+    alignments = []
+    lowest = np.inf
+    for i in np.argsort(Vab):
+        if f_3[i] < lowest and (target_f3 is None or f_3[i] <= target_f3):
+            lowest = f_3[i]
+            alignments.append(Alignment(Vab[i], fb[i], Ql[i], f_3[i], ripple[i]))
+    return alignments
@@ -5,7 +5,15 @@ from . import air
 
 
 class Driver(object):
-    """Class to model driver units."""
+    """Class to model driver units.
+
+    Drivers have a fixed set of attributes (``__slots__``), which keeps
+    large databases small in memory.
+    """
+
+    __slots__ = ('manufacturer', 'model', 'diameter', 'weight', 'power', 'Qts',
+                 'Qes', 'Sd', 'xmax', 'ws', 'Cas', 'Ts', '_fs', '_Vas',
+                 '__weakref__')
 
     def __init__(self, manufacturer, model):
         """Create a new driver.
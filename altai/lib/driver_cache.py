@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""Binary sidecar cache of driver database files.
+
+Parsing a large JSON database and creating a :class:`~altai.lib.driver.Driver`
+for every entry takes time proportional to its size. The cache stores the
+same data next to the JSON file, in a directory ``<filename>.cache``:
+
+* ``records.npy``: a structured array with the numeric parameters of every
+  driver, the index of its manufacturer, the position of its model name
+  in the string table and among the sorted distinct model names,
+* ``models.npy``: the UTF-8 encoded model names, one after another,
+* ``model_labels.npy``: the sorted distinct model names,
+* ``meta.json``: the manufacturer names, the number of drivers, and the
+  modification time, size and SHA-1 hash of the JSON file the cache was
+  created from.
+
+The arrays are memory-mapped, so reading the cache takes the same time for
+any database size. The cache is valid as long as the JSON file has the same
+modification time and size, or, failing that, the same content hash.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from .driver import Driver
+
+#: Numeric parameters stored for every driver
+FIELDS = ('diameter', 'weight', 'power', 'Qts', 'Qes', 'Sd', 'xmax', 'fs',
+          'Vas')
+
+# bump whenever the layout of the cache changes
+_FORMAT_VERSION = 2
+
+_DTYPE = np.dtype([(name, 'f8') for name in FIELDS] +
+                  [('manufacturer', 'i4'), ('model_offset', 'i8'),
+                   ('model_length', 'i4'), ('model_code', 'i4'),
+                   ('integral', 'u2')])
+
+
+class DriverRecords(object):
+    """Drivers of a database, as read from the cache.
+
+    Drivers are only created when they are asked for.
+    """
+
+    def __init__(self, records, models, manufacturers, model_labels, sha1=None):
+        """Wrap the cached arrays.
+
+        Args:
+            records : structured array with one entry per driver
+            models : UTF-8 encoded model names, as array of bytes
+            manufacturers : list of manufacturer names
+            model_labels : sorted distinct model names, as string array
+            sha1 : SHA-1 hash of the JSON file the cache was created from
+        """
+        self.records = records
+        self.models = models
+        self.manufacturers = manufacturers
+        self.model_labels = model_labels
+        self.sha1 = sha1
+
+    def __len__(self):
+        return len(self.records)
+
+    def model(self, index):
+        """Return the model name of a driver.
+
+        Args:
+            index : position of the driver
+        """
+        record = self.records[index]
+        start = int(record['model_offset'])
+        end = start + int(record['model_length'])
+        return self.models[start:end].tobytes().decode('utf-8')
+
+    def driver(self, index):
+        """Create the driver at a position.
+
+        Args:
+            index : position of the driver
+        """
+        record = self.records[index]
+        entry = {'manufacturer': self.manufacturers[record['manufacturer']],
+                 'model': self.model(index)}
+        for bit, name in enumerate(FIELDS):
+            value = float(record[name])
+            entry[name] = int(value) if record['integral'] & (1 << bit) else value
+        return Driver.from_dict(entry)
+
+    def drivers(self):
+        """Create all drivers at once, much faster than one by one."""
+        records = self.records
+        columns = [records[name].tolist() for name in FIELDS]
+        integral = records['integral'].tolist()
+        manufacturers = [self.manufacturers[i]
+                         for i in records['manufacturer'].tolist()]
+        blob = self.models.tobytes()
+        ends = (records['model_offset'] + records['model_length']).tolist()
+        starts = records['model_offset'].tolist()
+        drivers = []
+        for i in range(len(records)):
+            entry = {'manufacturer': manufacturers[i],
+                     'model': blob[starts[i]:ends[i]].decode('utf-8')}
+            for bit, name in enumerate(FIELDS):
+                value = columns[bit][i]
+                entry[name] = int(value) if integral[i] & (1 << bit) else value
+            drivers.append(Driver.from_dict(entry))
+        return drivers
+
+    def positions(self):
+        """Group drivers by manufacturer.
+
+        Returns:
+            dict from manufacturer name to the positions of its drivers, in
+            database order
+        """
+        codes = self.records['manufacturer']
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.manufacturers) + 1))
+        return {name: order[bounds[i]:bounds[i + 1]]
+                for i, name in enumerate(self.manufacturers)
+                if bounds[i + 1] > bounds[i]}
+
+    def columns(self):
+        """Return the driver parameters in :data:`FIELDS` as dict of arrays.
+
+        The positions of the manufacturer and model names of the drivers
+        among :meth:`labels` are included as ``'manufacturer'`` and
+        ``'model'``.
+        """
+        columns = {name: np.array(self.records[name]) for name in FIELDS}
+        manufacturers = np.array(self.manufacturers, dtype=str)
+        ranks = np.searchsorted(np.sort(manufacturers), manufacturers)
+        columns['manufacturer'] = ranks[self.records['manufacturer']]
+        columns['model'] = np.array(self.records['model_code'])
+        return columns
+
+    def labels(self):
+        """Return the sorted distinct manufacturer and model names."""
+        return {'manufacturer': np.array(sorted(self.manufacturers), dtype=str),
+                'model': self.model_labels}
+
+
+def cache_directory(filename):
+    """Return the directory of the cache of a database file.
+
+    Args:
+        filename : the JSON database file
+    """
+    return filename + '.cache'
+
+
+def _file_hash(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def read_cache(filename):
+    """Read the cache of a database file, if it is valid.
+
+    Args:
+        filename : the JSON database file
+
+    Returns:
+        :class:`DriverRecords`, or ``None`` if there is no valid cache
+    """
+    directory = cache_directory(filename)
+    meta_fname = os.path.join(directory, 'meta.json')
+    try:
+        with open(meta_fname, 'r') as f:
+            meta = json.load(f)
+        stat = os.stat(filename)
+        if meta.get('version') != _FORMAT_VERSION:
+            return None
+        if (meta['mtime_ns'], meta['size']) != (stat.st_mtime_ns, stat.st_size):
+            if meta['sha1'] != _file_hash(filename):
+                return None
+            # same content, only touched; remember the new time stamp
+            meta['mtime_ns'], meta['size'] = stat.st_mtime_ns, stat.st_size
+            _write_json(directory, 'meta.json', meta)
+        records = np.load(os.path.join(directory, 'records.npy'), mmap_mode='r')
+        models = np.load(os.path.join(directory, 'models.npy'), mmap_mode='r')
+        model_labels = np.load(os.path.join(directory, 'model_labels.npy'),
+                               mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    if records.dtype != _DTYPE or len(records) != meta['count']:
+        return None
+    return DriverRecords(records, models, meta['manufacturers'], model_labels,
+                         meta['sha1'])
+
+
+def write_cache(filename, drivers, sha1=None):
+    """Write the cache of a database file.
+
+    Failures, e.g. due to a read-only directory, are silently ignored, as
+    the cache only speeds up loading. Databases that the cache cannot
+    represent, e.g. with names that are not strings, are not cached.
+
+    Args:
+        filename : the JSON database file, already written
+        drivers : the drivers stored in the file
+        sha1 : SHA-1 hash of the file, if already known
+
+    Returns:
+        whether the cache was written
+    """
+    if not all(isinstance(driver.manufacturer, str) and
+               isinstance(driver.model, str) for driver in drivers):
+        return False
+    records = np.zeros(len(drivers), dtype=_DTYPE)
+    for bit, name in enumerate(FIELDS):
+        values = [getattr(driver, name) for driver in drivers]
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                   for value in values):
+            return False
+        records[name] = values
+        records['integral'] |= np.array(
+            [isinstance(value, int) for value in values], dtype=np.uint16) << bit
+    manufacturers = {}
+    records['manufacturer'] = [
+        manufacturers.setdefault(driver.manufacturer, len(manufacturers))
+        for driver in drivers]
+    model_labels, records['model_code'] = np.unique(
+        np.array([driver.model for driver in drivers], dtype=str),
+        return_inverse=True)
+    models = [driver.model.encode('utf-8') for driver in drivers]
+    lengths = np.array([len(model) for model in models], dtype=np.int64)
+    records['model_length'] = lengths
+    records['model_offset'] = np.cumsum(lengths) - lengths
+
+    directory = cache_directory(filename)
+    try:
+        stat = os.stat(filename)
+        meta = {'version': _FORMAT_VERSION,
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha1': sha1 or _file_hash(filename),
+                'count': len(records),
+                'manufacturers': list(manufacturers)}
+        os.makedirs(directory, exist_ok=True)
+        # without meta data, a partially written cache is never used
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            os.remove(os.path.join(directory, 'meta.json'))
+        _write_array(directory, 'records.npy', records)
+        _write_array(directory, 'models.npy',
+                     np.frombuffer(b''.join(models), dtype=np.uint8))
+        _write_array(directory, 'model_labels.npy', model_labels)
+        _write_json(directory, 'meta.json', meta)
+    except OSError:
+        return False
+    return True
+
+
+def _replace(directory, name, write):
+    """Write a file atomically, via a temporary file."""
+    fd, tmp_fname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_fname, os.path.join(directory, name))
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def _write_array(directory, name, array):
+    _replace(directory, name, lambda f: np.save(f, array))
+
+
+def _write_json(directory, name, data):
+    _replace(directory, name, lambda f: f.write(json.dumps(data).encode('utf-8')))
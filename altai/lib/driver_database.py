@@ -1,11 +1,333 @@
 # -*- coding: utf-8 -*-
 """Collecting multiple drivers in a database."""
+import bisect
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from . import air, driver_cache
 from .driver import Driver
+from .file_lock import FileLock
+
+
+def file_state(filename):
+    """Identify the current version of a file, cheaply.
+
+    Replacing a file, as :meth:`DriverDB.write_to_disk` does, always changes
+    its state.
+
+    Args:
+        filename : the file
+
+    Returns:
+        tuple of inode number, size and modification time, or ``None`` if
+        the file does not exist
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class DriverColumns(object):
+    """Numeric driver parameters of a whole database, as NumPy arrays.
+
+    Every parameter in :attr:`FIELDS` and :attr:`DERIVED` is a column, with
+    one entry per driver in database order. Columns are read with
+    ``columns['fs']`` or ``columns.fs`` and are read-only views. Rows can
+    be appended cheaply, the storage grows geometrically.
+
+    Range queries over several parameters are answered by :meth:`query`
+    from sorted indexes, which are built per parameter on first use. The
+    names in :attr:`NAMES` are kept as integer codes that sort like the
+    names, see :meth:`sort_codes`.
+
+    Example:
+        >>> columns = driver_db.columns
+        >>> low = driver_db.select((columns.fs < 30) & (columns.Qts < 0.4))
+    """
+
+    #: Parameters stored for every driver
+    FIELDS = driver_cache.FIELDS
+    #: Parameters that follow from :attr:`FIELDS`
+    DERIVED = ('Cas', 'ws', 'Ts', 'Vd')
+    #: Names available as sort codes
+    NAMES = ('manufacturer', 'model')
+
+    def __init__(self, drivers=()):
+        """Collect the parameters of drivers.
+
+        Args:
+            drivers : sequence of drivers
+        """
+        self._size = 0
+        self._data = {name: np.empty(0) for name in self.FIELDS + self.DERIVED}
+        # per parameter: sort order and sorted values of the first rows
+        self._sorted = {}
+        # per name: sorted distinct names (None if unknown), the position
+        # of every row's name among them, and the names of the rows
+        # appended since, which are coded on next use
+        self._labels = {name: np.empty(0, dtype=str) for name in self.NAMES}
+        self._codes = {name: np.empty(0, dtype=np.intp) for name in self.NAMES}
+        self._pending = {name: [] for name in self.NAMES}
+        self.extend(drivers)
+
+    @classmethod
+    def from_arrays(cls, arrays, labels=None):
+        """Create columns from arrays of all parameters.
+
+        Args:
+            arrays : dict with an array for every name in :attr:`FIELDS`;
+                the :attr:`DERIVED` parameters are computed if missing
+            labels : dict from names in :attr:`NAMES` to the sorted
+                distinct names; ``arrays`` then holds the position of the
+                name of every row among them. Sort codes of other names
+                are not available.
+        """
+        columns = cls()
+        data = {name: np.asarray(arrays[name], dtype=float)
+                for name in cls.FIELDS}
+        if all(name in arrays for name in cls.DERIVED):
+            data.update((name, np.asarray(arrays[name], dtype=float))
+                        for name in cls.DERIVED)
+        else:
+            # the same operations as in Driver, so the results are identical
+            with np.errstate(divide='ignore'):
+                data['ws'] = 2 * np.pi * data['fs']
+                data['Ts'] = 1 / data['ws']
+            data['Cas'] = data['Vas'] / (air.RHO * air.C ** 2)
+            data['Vd'] = data['xmax'] * data['Sd']
+        columns._data = data
+        columns._size = len(data['fs'])
+        labels = labels or {}
+        for name in cls.NAMES:
+            if name in labels:
+                columns._labels[name] = np.asarray(labels[name], dtype=str)
+                columns._codes[name] = np.array(arrays[name], dtype=np.intp)
+            else:
+                columns._labels[name] = None
+                columns._codes[name] = np.zeros(columns._size, dtype=np.intp)
+        return columns
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        if name not in self._data:
+            raise KeyError(name)
+        column = self._data[name][:self._size]
+        column.flags.writeable = False
+        return column
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._data:
+            raise AttributeError(name)
+        return self[name]
+
+    def append(self, driver):
+        """Add the parameters of one driver.
+
+        Args:
+            driver : the driver
+        """
+        self.extend([driver])
+
+    def extend(self, drivers):
+        """Add the parameters of many drivers.
+
+        Args:
+            drivers : sequence of drivers
+        """
+        drivers = list(drivers)
+        size = self._size + len(drivers)
+        if size > len(self._data['fs']):
+            capacity = max(size, 2 * len(self._data['fs']), 16)
+            for arrays in (self._data, self._codes):
+                for name, values in arrays.items():
+                    grown = np.empty(capacity, dtype=values.dtype)
+                    grown[:self._size] = values[:self._size]
+                    arrays[name] = grown
+        for name in self.FIELDS + self.DERIVED:
+            self._data[name][self._size:size] = [getattr(driver, name)
+                                                 for driver in drivers]
+        for name in self.NAMES:
+            self._pending[name].extend(getattr(driver, name)
+                                       for driver in drivers)
+        self._size = size
+
+    def sort_codes(self, name):
+        """Return integer codes of the names of all rows, which sort like
+        the names themselves.
+
+        Equal names have equal codes. The codes are kept up to date as
+        rows are appended; names not seen before change the codes of other
+        rows, so do not keep them across appends.
+
+        Args:
+            name : one of :attr:`NAMES`
+
+        Example:
+            >>> order = np.argsort(columns.sort_codes('model'), kind='stable')
+        """
+        labels = self._labels[name]
+        if labels is None:
+            raise KeyError(name)
+        codes = self._codes[name]
+        pending = self._pending[name]
+        if pending:
+            start = self._size - len(pending)
+            names = np.array(pending, dtype=str)
+            merged = np.union1d(labels, names)
+            if len(merged) > len(labels):
+                # make room for the new names among the codes
+                codes[:start] = np.searchsorted(merged, labels)[codes[:start]]
+                labels = self._labels[name] = merged
+            codes[start:self._size] = np.searchsorted(labels, names)
+            del pending[:]
+        codes = codes[:self._size]
+        codes.flags.writeable = False
+        return codes
+
+    def _sorted_index(self, name):
+        """Sort order and sorted values of a column.
+
+        Rows appended after the index was built are not part of it; once
+        there are too many of them, the index is rebuilt.
+        """
+        index = self._sorted.get(name)
+        if index is None or self._size - len(index[0]) > max(1024, self._size // 16):
+            values = self[name]
+            order = np.argsort(values, kind='stable')
+            index = self._sorted[name] = (order, values[order])
+        return index
+
+    def query(self, **ranges):
+        """Find the rows whose parameters lie within given ranges.
+
+        The rows matching the most selective range are looked up in its
+        sorted index by binary search, and only those are checked against
+        the other ranges. The time taken therefore grows with the number
+        of candidates rather than the number of rows.
+
+        Args:
+            ranges : for every parameter to restrict, either a pair
+                ``(low, high)`` of inclusive bounds, where ``None`` leaves
+                a side open, or a single value to match exactly
+
+        Returns:
+            positions of the matching rows, in ascending order
+
+        Example:
+            >>> columns.query(diameter=15, Qts=(0.3, 0.45), fs=(None, 40))
+        """
+        bounds = {}
+        for name, bound in ranges.items():
+            if name not in self._data:
+                raise KeyError(name)
+            if isinstance(bound, tuple):
+                low, high = bound
+            else:
+                low = high = bound
+            bounds[name] = (-np.inf if low is None else low,
+                            np.inf if high is None else high)
+        if not bounds:
+            return np.arange(self._size)
+
+        candidates = None
+        for name, (low, high) in bounds.items():
+            order, values = self._sorted_index(name)
+            start = np.searchsorted(values, low, side='left')
+            stop = np.searchsorted(values, high, side='right')
+            if candidates is None or stop - start < len(candidates):
+                # rows appended since the index was built are candidates too
+                candidates = np.concatenate(
+                    [order[start:stop], np.arange(len(order), self._size)])
+                chosen = name
+        if len(candidates) > self._size // 4:
+            # hardly selective, a plain scan is faster than gathering
+            mask = np.ones(self._size, dtype=bool)
+            for name, (low, high) in bounds.items():
+                values = self[name]
+                mask &= (values >= low) & (values <= high)
+            return np.flatnonzero(mask)
+        candidates = np.sort(candidates)
+        mask = np.ones(len(candidates), dtype=bool)
+        for name, (low, high) in bounds.items():
+            if name != chosen or len(self._sorted[name][0]) < self._size:
+                values = self._data[name][candidates]
+                mask &= (values >= low) & (values <= high)
+        return candidates[mask]
+
+
+_COLUMNS = DriverColumns.FIELDS + DriverColumns.DERIVED
+
+
+class DriverSelection(object):
+    """Lightweight view of a subset of a database.
+
+    A selection only holds the indexes of the selected drivers. Columns are
+    available as in :class:`DriverColumns`, e.g. ``selection.fs``, and the
+    drivers themselves by index and iteration.
+    """
+
+    def __init__(self, driver_db, indexes):
+        """Create a view.
+
+        Args:
+            driver_db : the :class:`DriverDB`
+            indexes : positions of the selected drivers in the database
+        """
+        self.driver_db = driver_db
+        self.indexes = np.asarray(indexes, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        """Return the driver at a position of the selection."""
+        return self.driver_db[self.indexes[index]]
+
+    def __iter__(self):
+        for index in self.indexes:
+            yield self.driver_db[index]
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in _COLUMNS:
+            raise AttributeError(name)
+        return self.driver_db.columns[name][self.indexes]
+
+    @property
+    def columns(self):
+        """The columns of the selected drivers, as a dict of arrays."""
+        columns = self.driver_db.columns
+        return {name: columns[name][self.indexes] for name in _COLUMNS}
+
+    def select(self, mask):
+        """Narrow down the selection.
+
+        Args:
+            mask : boolean array of the length of this selection
+        """
+        return DriverSelection(self.driver_db, self.indexes[np.asarray(mask)])
 
 
 class DriverDB(list):
-    """Representing the database (inherits from ``list``)."""
+    """Representing the database (inherits from ``list``).
+
+    Besides the list of drivers, the database keeps hash indexes from
+    manufacturer to drivers and from (manufacturer, model) to driver, so that
+    lookups do not depend on the size of the database. The indexes are kept
+    up to date by all methods that add or remove drivers. If the manufacturer
+    or model of a driver in the database is changed, call :meth:`reindex`.
+
+    A database loaded from a binary cache (see :mod:`~altai.lib.driver_cache`)
+    creates its drivers only when they are accessed. Lookups and columns
+    are served from the cache as well; the first change to the database
+    creates all drivers.
+    """
 
     def __init__(self):
         """Create an empty database.
@@ -13,44 +335,369 @@ class DriverDB(list):
         Take a look at ``from_file`` for loading an existing database file.
         """
         list.__init__(self)
-        self.manufacturers = set()
+        self._by_manufacturer = {}
+        self._by_name = {}
+        self._sorted_manufacturers = []
+        self._columns = None
+        # drivers not created yet, their positions by manufacturer
+        self._records = None
+        self._positions = None
+        #: State of the file last loaded or written, see :func:`file_state`
+        self.file_state = None
+        #: SHA-1 hash of the content of that file, taken while reading or
+        #: writing it
+        self.file_hash = None
+
+    @property
+    def columns(self):
+        """Numeric parameters of all drivers, see :class:`DriverColumns`.
+
+        The columns are built on first access and kept up to date when
+        drivers are appended; other changes rebuild them on next access.
+        """
+        if self._columns is None:
+            if self._records is not None:
+                self._columns = DriverColumns.from_arrays(
+                    self._records.columns(), self._records.labels())
+            else:
+                self._columns = DriverColumns(self)
+        return self._columns
+
+    def query(self, **ranges):
+        """Return a view of the drivers whose parameters lie within ranges.
+
+        See :meth:`DriverColumns.query`; drivers are only created when the
+        result is accessed.
+
+        Example:
+            >>> woofers = driver_db.query(diameter=15, Qts=(0.3, 0.45),
+            >>>                           fs=(None, 40.0), Vas=(None, 0.2))
+        """
+        return DriverSelection(self, self.columns.query(**ranges))
+
+    def select(self, mask):
+        """Return a view of the drivers for which ``mask`` is true.
+
+        Args:
+            mask : boolean array with one entry per driver, e.g. computed
+                from :attr:`columns`
+
+        Example:
+            >>> small = driver_db.select(driver_db.columns.Sd < 0.02)
+        """
+        return DriverSelection(self, np.flatnonzero(mask))
+
+    @property
+    def manufacturers(self):
+        """Set-like view of all manufacturers in the database."""
+        if self._records is not None:
+            return self._lazy_positions().keys()
+        return self._by_manufacturer.keys()
+
+    @property
+    def sorted_manufacturers(self):
+        """Alphabetically sorted list of all manufacturers.
+
+        .. note:: Do not modify the returned list.
+        """
+        return self._sorted_manufacturers
+
+    def drivers_of(self, manufacturer):
+        """Return all drivers of a manufacturer, in database order.
+
+        Args:
+            manufacturer : manufacturer name
+        """
+        if self._records is not None:
+            return [self[i] for i in self._lazy_positions().get(manufacturer, ())]
+        return list(self._by_manufacturer.get(manufacturer, ()))
+
+    def get(self, manufacturer, model, default=None):
+        """Look up a driver by manufacturer and model.
+
+        If several drivers share the same names, the first one added is
+        returned.
+
+        Args:
+            manufacturer : manufacturer name
+            model : model name
+            default : returned if there is no such driver
+        """
+        if self._records is not None:
+            for i in self._lazy_positions().get(manufacturer, ()):
+                if self._records.model(i) == model:
+                    return self[i]
+            return default
+        return self._by_name.get((manufacturer, model), default)
+
+    def update(self, driver, **changes):
+        """Change parameters of a driver in the database.
+
+        Unlike setting the attributes directly, this keeps indexes and
+        columns up to date.
 
-    def load_from_disk(self, filename):
+        Args:
+            driver : a driver of this database
+            changes : new parameter values, e.g. ``fs=35.0``
+
+        Example:
+            >>> driver_db.update(driver, Qts=0.38, Vas=0.12)
+        """
+        self._materialize()
+        for name, value in changes.items():
+            setattr(driver, name, value)
+        if 'manufacturer' in changes or 'model' in changes:
+            self.reindex()
+        self._columns = None
+
+    def reindex(self):
+        """Rebuild all indexes and columns from the list of drivers."""
+        self._materialize()
+        self._columns = None
+        self._by_manufacturer.clear()
+        self._by_name.clear()
+        del self._sorted_manufacturers[:]
+        for driver in self:
+            self._index(driver)
+
+    def _lazy_positions(self):
+        if self._positions is None:
+            self._positions = self._records.positions()
+        return self._positions
+
+    def _load_records(self, records):
+        """Fill the database with drivers to be created on access."""
+        list.extend(self, [None] * len(records))
+        self._records = records
+        self._sorted_manufacturers[:] = sorted(records.manufacturers)
+
+    def _materialize(self):
+        """Create all drivers not created yet and index them."""
+        if self._records is None:
+            return
+        # keep the drivers that were already handed out
+        for i, driver in enumerate(self._records.drivers()):
+            if list.__getitem__(self, i) is None:
+                list.__setitem__(self, i, driver)
+        self._records = None
+        self._positions = None
+        del self._sorted_manufacturers[:]
+        for driver in list.__iter__(self):
+            self._index(driver)
+
+    def __getitem__(self, key):
+        if self._records is None:
+            return list.__getitem__(self, key)
+        if isinstance(key, slice):
+            return [self[i] for i in range(len(self))[key]]
+        driver = list.__getitem__(self, key)
+        if driver is None:
+            index = range(len(self))[key]
+            driver = self._records.driver(index)
+            list.__setitem__(self, index, driver)
+        return driver
+
+    def __iter__(self):
+        if self._records is None:
+            return list.__iter__(self)
+        return (self[i] for i in range(len(self)))
+
+    def __reversed__(self):
+        self._materialize()
+        return list.__reversed__(self)
+
+    def __contains__(self, driver):
+        self._materialize()
+        return list.__contains__(self, driver)
+
+    def index(self, driver, *args):
+        self._materialize()
+        return list.index(self, driver, *args)
+
+    def count(self, driver):
+        self._materialize()
+        return list.count(self, driver)
+
+    def copy(self):
+        self._materialize()
+        return list.copy(self)
+
+    def sort(self, *args, **kwargs):
+        self._materialize()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._materialize()
+        list.reverse(self)
+
+    def _index(self, driver):
+        drivers = self._by_manufacturer.get(driver.manufacturer)
+        if drivers is None:
+            drivers = self._by_manufacturer[driver.manufacturer] = []
+            bisect.insort(self._sorted_manufacturers, driver.manufacturer)
+        drivers.append(driver)
+        self._by_name.setdefault((driver.manufacturer, driver.model), driver)
+
+    def _unindex(self, driver):
+        drivers = self._by_manufacturer[driver.manufacturer]
+        drivers.remove(driver)
+        if not drivers:
+            del self._by_manufacturer[driver.manufacturer]
+            index = bisect.bisect_left(self._sorted_manufacturers,
+                                       driver.manufacturer)
+            del self._sorted_manufacturers[index]
+        key = (driver.manufacturer, driver.model)
+        if self._by_name.get(key) is driver:
+            del self._by_name[key]
+            # another driver of the same name takes its place
+            for other in drivers:
+                if other.model == driver.model:
+                    self._by_name[key] = other
+                    break
+
+    def append(self, driver):
+        self._materialize()
+        list.append(self, driver)
+        self._index(driver)
+        if self._columns is not None:
+            self._columns.append(driver)
+
+    def extend(self, drivers):
+        self._materialize()
+        drivers = list(drivers)
+        list.extend(self, drivers)
+        for driver in drivers:
+            self._index(driver)
+        if self._columns is not None:
+            self._columns.extend(drivers)
+
+    def __iadd__(self, drivers):
+        self.extend(drivers)
+        return self
+
+    def insert(self, index, driver):
+        self._materialize()
+        list.insert(self, index, driver)
+        self._index(driver)
+        self._columns = None
+
+    def remove(self, driver):
+        self._materialize()
+        list.remove(self, driver)
+        self._unindex(driver)
+        self._columns = None
+
+    def pop(self, index=-1):
+        self._materialize()
+        driver = list.pop(self, index)
+        self._unindex(driver)
+        self._columns = None
+        return driver
+
+    def clear(self):
+        self._records = None
+        self._positions = None
+        list.clear(self)
+        self.reindex()
+
+    def __delitem__(self, key):
+        self._materialize()
+        removed = self[key] if isinstance(key, slice) else [self[key]]
+        list.__delitem__(self, key)
+        for driver in removed:
+            self._unindex(driver)
+        self._columns = None
+
+    def __setitem__(self, key, value):
+        self._materialize()
+        if isinstance(key, slice):
+            removed = self[key]
+            added = list(value)
+            list.__setitem__(self, key, added)
+        else:
+            removed = [self[key]]
+            added = [value]
+            list.__setitem__(self, key, value)
+        for driver in removed:
+            self._unindex(driver)
+        for driver in added:
+            self._index(driver)
+        self._columns = None
+
+    def load_from_disk(self, filename, cache=False):
         """Load a database from file.
 
         Args:
             filename : file to load database from
+            cache : use the binary cache next to the file, and create it if
+                it is missing or outdated
         """
         self.clear()
-        self.manufacturers.clear()
-        with open(filename, 'r') as f:
-            driver_list = json.load(f)
-        for entry in driver_list:
-            driver = Driver.from_dict(entry)
-            self.manufacturers.add(driver.manufacturer)
-            self.append(driver)
-
-    def write_to_disk(self, filename):
+        # taken before reading: should the file be replaced meanwhile, the
+        # change is still detected later
+        self.file_state = file_state(filename)
+        if cache:
+            records = driver_cache.read_cache(filename)
+            if records is not None:
+                self._load_records(records)
+                self.file_hash = records.sha1
+                return
+        with open(filename, 'rb') as f:
+            data = f.read()
+        self.file_hash = hashlib.sha1(data).hexdigest()
+        self.extend(Driver.from_dict(entry) for entry in json.loads(data))
+        if cache:
+            driver_cache.write_cache(filename, self, self.file_hash)
+
+    def write_to_disk(self, filename, cache=False):
         """Write database to disk.
 
+        The database is written to a temporary file first, which then
+        replaces ``filename``, so the file is never left half-written.
+
+        Other processes are kept from writing the file meanwhile by a
+        :class:`~altai.lib.file_lock.FileLock`. To keep their changes,
+        write through a :class:`~altai.lib.driver_journal.DriverJournal`.
+
         Args:
             filename : file in which to store database
+            cache : also write the binary cache next to the file
         """
         driver_list = []
         for driver in self:
             driver_list.append(driver.dict_representation())
-        with open(filename, 'w') as f:
-            json.dump(driver_list, f, indent=4, sort_keys=True)
+        data = json.dumps(driver_list, indent=4, sort_keys=True).encode('utf-8')
+        with FileLock(filename):
+            if not os.path.exists(filename):
+                # creating it keeps the default permissions for the new file
+                open(filename, 'a').close()
+            directory = os.path.dirname(os.path.abspath(filename))
+            fd, tmp_fname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                shutil.copymode(filename, tmp_fname)
+                os.replace(tmp_fname, filename)
+            finally:
+                if os.path.exists(tmp_fname):
+                    os.remove(tmp_fname)
+            self.file_state = file_state(filename)
+            self.file_hash = hashlib.sha1(data).hexdigest()
+            if cache:
+                driver_cache.write_cache(filename, self, self.file_hash)
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, cache=False):
         """Create a new database from existing file.
 
         Args:
             filename : file from which to initialize database
+            cache : use the binary cache, see :meth:`load_from_disk`
         Example:
             >>> mydatabase = DriverDB.from_file("mypersonaldb.json")
         """
         driver_db = cls()
-        driver_db.load_from_disk(filename)
+        driver_db.load_from_disk(filename, cache)
         return driver_db
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Import driver catalogs from CSV or JSON files in bulk."""
+import concurrent.futures
+import csv
+import json
+import math
+import os
+from .driver import Driver
+
+#: Units of vendor datasheets, as in the dialog for adding a driver
+DATASHEET_UNITS = {'xmax': 'mm', 'Sd': 'cm2', 'Vas': 'l'}
+#: SI units, as used by Altai's own database files
+SI_UNITS = {'xmax': 'm', 'Sd': 'm2', 'Vas': 'm3'}
+
+# conversion factors to SI units
+_FACTORS = {'xmax': {'m': 1.0, 'cm': 1e-2, 'mm': 1e-3},
+            'Sd': {'m2': 1.0, 'cm2': 1e-4, 'mm2': 1e-6},
+            'Vas': {'m3': 1.0, 'l': 1e-3, 'ft3': 0.028316846592}}
+
+_REQUIRED = ('fs', 'Qts', 'Vas')
+_OPTIONAL = ('diameter', 'weight', 'power', 'Qes', 'Sd', 'xmax')
+# column names are matched case-insensitively
+_COLUMNS = {name.lower(): name
+            for name in ('manufacturer', 'model') + _REQUIRED + _OPTIONAL}
+
+
+class RowError(object):
+    """A catalog row that could not be imported."""
+
+    def __init__(self, row, message):
+        """Create a new error.
+
+        Args:
+            row : row number in the catalog, starting at 1 (for CSV files,
+                the line number)
+            message : what is wrong with the row
+        """
+        self.row = row
+        self.message = message
+
+    def __repr__(self):
+        """Return a string representation of the error."""
+        return "row {0}: {1}".format(self.row, self.message)
+
+
+class ImportReport(object):
+    """Outcome of a catalog import."""
+
+    def __init__(self, added, duplicates, errors):
+        """Create a new report.
+
+        Args:
+            added : drivers added to the database
+            duplicates : list of (row, (manufacturer, model)) of rows that
+                were skipped because the driver already exists
+            errors : list of :class:`RowError`
+        """
+        self.added = added
+        self.duplicates = duplicates
+        self.errors = errors
+
+    def __repr__(self):
+        """Return a string representation of the report."""
+        return "{0} added, {1} duplicates, {2} errors".format(
+            len(self.added), len(self.duplicates), len(self.errors))
+
+
+def read_rows(filename, file_format=None):
+    """Read the rows of a catalog, without interpreting them.
+
+    Args:
+        filename : CSV or JSON file; a JSON catalog is a list of objects
+        file_format : ``'csv'`` or ``'json'``, by default from the file
+            extension
+
+    Returns:
+        list of (row number, dict)
+    """
+    if file_format is None:
+        file_format = os.path.splitext(filename)[1].lstrip('.').lower()
+    if file_format == 'csv':
+        with open(filename, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            return [(reader.line_num, row) for row in reader]
+    if file_format == 'json':
+        with open(filename, 'r') as f:
+            rows = json.load(f)
+        return [(i + 1, row) for i, row in enumerate(rows)]
+    raise ValueError("Unknown catalog format " + repr(file_format))
+
+
+def parse_row(row, units=DATASHEET_UNITS):
+    """Check one catalog row and convert it to SI units.
+
+    Args:
+        row : dict of column name to value
+        units : units of ``xmax``, ``Sd`` and ``Vas`` in the catalog, see
+            :data:`DATASHEET_UNITS`
+
+    Returns:
+        dict as accepted by :meth:`~altai.lib.driver.Driver.from_dict`
+
+    Raises:
+        ValueError : if the row is invalid
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a record")
+    values = {}
+    for column, value in row.items():
+        name = _COLUMNS.get(str(column).strip().lower())
+        if name is not None and value not in (None, ''):
+            values[name] = value
+
+    entry = {}
+    for name in ('manufacturer', 'model'):
+        text = str(values.get(name, '')).strip()
+        if not text:
+            raise ValueError("{0} is missing".format(name))
+        entry[name] = text
+    for name in _REQUIRED + _OPTIONAL:
+        if name not in values:
+            if name in _REQUIRED:
+                raise ValueError("{0} is missing".format(name))
+            entry[name] = 0.0
+            continue
+        try:
+            value = float(values[name])
+        except (TypeError, ValueError):
+            raise ValueError("{0} is not a number: {1!r}".format(name, values[name]))
+        if not math.isfinite(value) or value < 0.0:
+            raise ValueError("{0} must be a non-negative number".format(name))
+        if name in _REQUIRED and value == 0.0:
+            raise ValueError("{0} must be positive".format(name))
+        if name in _FACTORS:
+            value *= _FACTORS[name][units[name]]
+        entry[name] = value
+    return entry
+
+
+def _parse_chunk(arguments):
+    """Parse rows, returning (row number, entry or error message) each."""
+    rows, units = arguments
+    results = []
+    for number, row in rows:
+        try:
+            results.append((number, parse_row(row, units)))
+        except ValueError as error:
+            results.append((number, str(error)))
+    return results
+
+
+def import_drivers(driver_db, filename, file_format=None, units=DATASHEET_UNITS,
+                   journal=None, processes=None, chunk_size=2000):
+    """Import a vendor catalog into a database.
+
+    Rows are validated and converted independently, optionally spread over
+    a process pool. Invalid rows and rows whose (manufacturer, model) is
+    already in the database, or earlier in the catalog, are reported and
+    skipped; all other drivers are added in a single batch.
+
+    Args:
+        driver_db : the :class:`~altai.lib.driver_database.DriverDB`
+        filename : CSV or JSON catalog, see :func:`read_rows`
+        file_format : ``'csv'`` or ``'json'``, by default from the file
+            extension
+        units : units of ``xmax``, ``Sd`` and ``Vas`` in the catalog
+        journal : if given, the :class:`~altai.lib.driver_journal.DriverJournal`
+            through which the drivers are added; drivers are then checked
+            against the database under its lock, so that drivers added by
+            other processes meanwhile are skipped as well
+        processes : if given, parse in this many processes
+        chunk_size : number of rows parsed per task
+
+    Returns:
+        an :class:`ImportReport`
+
+    Example:
+        >>> report = import_drivers(driver_db, "catalog.csv")
+        >>> for error in report.errors:
+        >>>     print(error)
+    """
+    for name in _FACTORS:
+        if units.get(name) not in _FACTORS[name]:
+            raise ValueError("Unknown unit {0!r} for {1}, use one of {2}".format(
+                units.get(name), name, ", ".join(_FACTORS[name])))
+    rows = read_rows(filename, file_format)
+    chunks = [(rows[start:start + chunk_size], units)
+              for start in range(0, len(rows), chunk_size)]
+    if processes is None or processes < 2 or len(chunks) < 2:
+        parsed = [_parse_chunk(chunk) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            parsed = list(executor.map(_parse_chunk, chunks))
+
+    added, duplicates, errors = [], [], []
+    numbers = {}
+    for number, result in (item for chunk in parsed for item in chunk):
+        if isinstance(result, str):
+            errors.append(RowError(number, result))
+            continue
+        key = (result['manufacturer'], result['model'])
+        if key in numbers:
+            duplicates.append((number, key))
+            continue
+        numbers[key] = number
+        added.append(Driver.from_dict(result))
+
+    if journal is not None:
+        skipped = journal.extend(added, skip_existing=True)
+    else:
+        skipped = [driver for driver in added
+                   if driver_db.get(driver.manufacturer, driver.model) is not None]
+    if skipped:
+        existing = {(driver.manufacturer, driver.model) for driver in skipped}
+        added = [driver for driver in added
+                 if (driver.manufacturer, driver.model) not in existing]
+        duplicates = sorted(duplicates + [(numbers[key], key) for key in existing])
+    if journal is None:
+        driver_db.extend(added)
+    return ImportReport(added, duplicates, errors)
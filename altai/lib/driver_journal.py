@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""Append-only journal of changes to a driver database file.
+
+Rewriting the whole JSON database for every added driver takes time
+proportional to its size. Instead, changes are appended as single lines to
+a journal next to the database, ``<filename>.journal`` (JSON Lines). The
+first line identifies the database file the journal applies to; every
+further line is one change::
+
+    {"op": "add", "driver": {...}}
+    {"op": "edit", "manufacturer": "...", "model": "...", "changes": {...}}
+    {"op": "delete", "manufacturer": "...", "model": "..."}
+
+Compaction writes the database with all changes applied and removes the
+journal. Should it be interrupted after the database was replaced, the
+journal no longer matches the database and is discarded on next load, so
+no change is ever applied twice.
+
+Several processes may share a database. Changes and compaction happen
+under a :class:`~altai.lib.file_lock.FileLock`, after first applying the
+changes made by other processes, so no change is lost. Changes by others
+are picked up by reading only the new lines of the journal, or, after a
+compaction, by loading the database again.
+"""
+import json
+import os
+from .driver import Driver
+from .driver_cache import _file_hash
+from .driver_database import file_state
+from .file_lock import FileLock
+
+# bump whenever the layout of the journal changes
+_FORMAT_VERSION = 1
+
+
+def journal_filename(filename):
+    """Return the journal file of a database file.
+
+    Args:
+        filename : the JSON database file
+    """
+    return filename + '.journal'
+
+
+def _base(filename, sha1):
+    """Describe the database file a journal applies to.
+
+    Args:
+        filename : the JSON database file
+        sha1 : SHA-1 hash of its content
+    """
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1}
+
+
+def _matches(base, filename, sha1):
+    """Check whether a journal header belongs to the current database.
+
+    The hash is only compared if the file was touched since.
+    """
+    stat = os.stat(filename)
+    if (base['size'], base['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return True
+    return base['sha1'] == sha1
+
+
+class DriverJournal(object):
+    """Record changes to a driver database in an append-only journal.
+
+    On creation, the changes already in the journal (e.g. from an earlier
+    session that was not closed properly, or from another process) are
+    applied to the database. Every change is then applied to the database
+    and appended to the journal, which takes constant time.
+
+    Call :meth:`refresh` to pick up changes by other processes. Changes by
+    other processes may replace all drivers of the database; :meth:`edit`
+    and :meth:`delete` therefore find the driver by manufacturer and model.
+
+    Example:
+        >>> driver_db = DriverDB.from_file(fname)
+        >>> journal = DriverJournal(driver_db, fname)
+        >>> journal.add(new_driver)
+        >>> journal.compact()
+    """
+
+    #: Driver parameters that can be changed by :meth:`edit`
+    PARAMETERS = ('manufacturer', 'model', 'diameter', 'weight', 'power',
+                  'Qts', 'Qes', 'Sd', 'xmax', 'fs', 'Vas')
+
+    def __init__(self, driver_db, filename, cache=False):
+        """Open the journal of a database file.
+
+        Args:
+            driver_db : the database loaded from ``filename``
+            filename : the JSON database file
+            cache : use the binary cache when the database has to be
+                loaded again
+        """
+        self.driver_db = driver_db
+        self.filename = filename
+        self.journal_fname = journal_filename(filename)
+        self.cache = cache
+        #: Lock shared with other processes using the database
+        self.lock = FileLock(filename)
+        #: Number of changes in the journal
+        self.entries = 0
+        #: Increased whenever the database changes
+        self.generation = 0
+        self._offset = 0
+        with self.lock:
+            self._catch_up()
+
+    def changed(self):
+        """Check whether the database files were changed by another process.
+
+        Only the state of the files is compared, which is cheap enough to
+        do frequently.
+        """
+        if self.driver_db.file_state != file_state(self.filename):
+            return True
+        try:
+            return os.path.getsize(self.journal_fname) != self._offset
+        except FileNotFoundError:
+            return False
+
+    def refresh(self):
+        """Apply the changes made by other processes.
+
+        Returns:
+            whether the database changed
+        """
+        if not self.changed():
+            return False
+        with self.lock:
+            return self._catch_up()
+
+    def add(self, driver):
+        """Add a driver to the database.
+
+        Args:
+            driver : the new driver
+        """
+        with self.lock:
+            self._catch_up()
+            self.driver_db.append(driver)
+            self._write({'op': 'add', 'driver': driver.dict_representation()})
+
+    def extend(self, drivers, skip_existing=False):
+        """Add many drivers to the database, with a single write to the
+        journal.
+
+        Args:
+            drivers : the new drivers
+            skip_existing : skip drivers whose manufacturer and model are
+                already in the database, including those just added by
+                other processes, or earlier in ``drivers``
+
+        Returns:
+            list of the skipped drivers
+        """
+        drivers = list(drivers)
+        skipped = []
+        if not drivers:
+            return skipped
+        with self.lock:
+            self._catch_up()
+            if skip_existing:
+                names = set()
+                new = []
+                for driver in drivers:
+                    key = (driver.manufacturer, driver.model)
+                    if key in names or self.driver_db.get(*key) is not None:
+                        skipped.append(driver)
+                    else:
+                        names.add(key)
+                        new.append(driver)
+                drivers = new
+            if drivers:
+                self.driver_db.extend(drivers)
+                self._write(*[{'op': 'add', 'driver': driver.dict_representation()}
+                              for driver in drivers])
+        return skipped
+
+    def edit(self, driver, **changes):
+        """Change parameters of a driver of the database.
+
+        Args:
+            driver : a driver of the database
+            changes : new parameter values, see :attr:`PARAMETERS`
+        """
+        unknown = set(changes) - set(self.PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown parameters {0}".format(sorted(unknown)))
+        with self.lock:
+            self._catch_up()
+            driver = self._find(driver)
+            entry = {'op': 'edit', 'manufacturer': driver.manufacturer,
+                     'model': driver.model, 'changes': changes}
+            self.driver_db.update(driver, **changes)
+            self._write(entry)
+
+    def delete(self, driver):
+        """Remove a driver from the database.
+
+        Args:
+            driver : a driver of the database
+        """
+        with self.lock:
+            self._catch_up()
+            driver = self._find(driver)
+            self.driver_db.remove(driver)
+            self._write({'op': 'delete', 'manufacturer': driver.manufacturer,
+                         'model': driver.model})
+
+    def compact(self, cache=False):
+        """Write the database file with all changes and clear the journal.
+
+        Args:
+            cache : also write the binary cache of the database
+        """
+        with self.lock:
+            self._catch_up()
+            if self.entries == 0 and not os.path.exists(self.journal_fname):
+                return
+            self.driver_db.write_to_disk(self.filename, cache)
+            if os.path.exists(self.journal_fname):
+                os.remove(self.journal_fname)
+            self.entries = 0
+            self._offset = 0
+
+    def _find(self, driver):
+        """Return the driver of the database with the names of ``driver``."""
+        found = self.driver_db.get(driver.manufacturer, driver.model)
+        if found is None:
+            raise ValueError("{0} is not in the database".format(driver))
+        return found
+
+    def _catch_up(self):
+        """Apply the changes made by other processes; hold the lock.
+
+        Returns:
+            whether the database changed
+        """
+        changed = False
+        if self.driver_db.file_state != file_state(self.filename):
+            # written by another process, including all of the journal
+            self.driver_db.load_from_disk(self.filename, self.cache)
+            self.entries = 0
+            self._offset = 0
+            self.generation += 1
+            changed = True
+        try:
+            f = open(self.journal_fname, 'rb')
+        except FileNotFoundError:
+            self._offset = 0
+            return changed
+        with f:
+            if self._offset == 0:
+                header = f.readline()
+                try:
+                    header = json.loads(header)
+                    valid = (header['version'] == _FORMAT_VERSION and
+                             _matches(header['base'], self.filename,
+                                      self._file_hash()))
+                except (ValueError, KeyError, OSError):
+                    valid = False
+                if not valid:
+                    f.close()
+                    os.remove(self.journal_fname)
+                    return changed
+                self._offset = f.tell()
+            f.seek(self._offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._apply(entry)
+                self.entries += 1
+                self._offset += len(line)
+                self.generation += 1
+                changed = True
+        if self._offset < os.path.getsize(self.journal_fname):
+            # a line left incomplete by a crash, as writers hold the lock
+            with open(self.journal_fname, 'r+b') as f:
+                f.truncate(self._offset)
+        return changed
+
+    def _file_hash(self):
+        """Hash of the database file, as taken by the database when it read
+        or wrote the file; hold the lock, after catching up."""
+        if self.driver_db.file_hash is None:
+            self.driver_db.file_hash = _file_hash(self.filename)
+        return self.driver_db.file_hash
+
+    def _apply(self, entry):
+        """Apply one change read from the journal to the database."""
+        if entry['op'] == 'add':
+            self.driver_db.append(Driver.from_dict(entry['driver']))
+            return
+        driver = self.driver_db.get(entry['manufacturer'], entry['model'])
+        if driver is None:
+            return
+        if entry['op'] == 'edit':
+            self.driver_db.update(driver, **entry['changes'])
+        elif entry['op'] == 'delete':
+            self.driver_db.remove(driver)
+
+    def _write(self, *entries):
+        """Append changes to the journal, and make sure they are on disk."""
+        if self._offset == 0:
+            header = {'version': _FORMAT_VERSION,
+                      'base': _base(self.filename, self._file_hash())}
+            with open(self.journal_fname, 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                self._offset = f.tell()
+        lines = b''.join(json.dumps(entry, sort_keys=True).encode('utf-8') + b'\n'
+                         for entry in entries)
+        with open(self.journal_fname, 'ab') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._offset += len(lines)
+        self.entries += len(entries)
+        self.generation += 1
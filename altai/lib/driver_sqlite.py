@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""Driver database stored in SQLite.
+
+:class:`~altai.lib.driver_database.DriverDB` keeps all drivers in memory
+and writes them as one JSON document. :class:`SQLiteDriverDB` offers the
+same interface for reading and adding drivers, but keeps them in an SQLite
+file with indexes on manufacturer, model and the Thiele/Small parameters.
+Only the drivers asked for are read, and adding a driver only writes that
+driver, so large catalogs shared by several users stay fast.
+
+A JSON database is migrated into an SQLite file together with the pending
+changes of its :class:`~altai.lib.driver_journal.DriverJournal`. The SQLite
+file records the state of both files, like the binary cache of
+:mod:`~altai.lib.driver_cache`, and is migrated again once they change.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+import numpy as np
+from .driver import Driver
+from .driver_cache import _file_hash
+from .driver_database import DriverColumns, DriverDB
+from .driver_journal import DriverJournal, journal_filename
+from .file_lock import FileLock
+
+#: Numeric parameters stored for every driver
+FIELDS = DriverColumns.FIELDS
+#: Parameters with an index, for fast range queries
+INDEXED = ('diameter', 'Qts', 'Qes', 'xmax', 'fs', 'Vas')
+
+# bump whenever the schema changes
+_SCHEMA_VERSION = 2
+_SQLITE_HEADER = b'SQLite format 3\x00'
+# parameters are declared without type, so that integers and floats are
+# stored as given and a JSON database round-trips exactly
+_TABLE = ("CREATE TABLE drivers (id INTEGER PRIMARY KEY, "
+          "manufacturer TEXT NOT NULL, model TEXT NOT NULL, " +
+          ", ".join(FIELDS) + ")")
+_INDEXES = (["CREATE INDEX drivers_name ON drivers (manufacturer, model)"] +
+            ["CREATE INDEX drivers_{0} ON drivers ({0})".format(name)
+             for name in INDEXED])
+# the JSON database migrated from, and whether the drivers changed since
+_META = "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+_SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+_COLUMNS = ('manufacturer', 'model') + FIELDS
+_SELECT = "SELECT " + ", ".join(_COLUMNS) + " FROM drivers"
+_INSERT = "INSERT INTO drivers ({0}) VALUES ({1})".format(
+    ", ".join(_COLUMNS), ", ".join("?" * len(_COLUMNS)))
+# the driver a driver object stands for, see SQLiteDriverDB
+_FIRST_ID = ("SELECT id FROM drivers WHERE manufacturer = ? AND model = ? "
+             "ORDER BY id LIMIT 1")
+
+
+def database_filename(filename):
+    """Return the SQLite file that a JSON database is migrated to.
+
+    Args:
+        filename : the JSON database file
+    """
+    return os.path.splitext(filename)[0] + '.sqlite'
+
+
+def is_sqlite_file(filename):
+    """Check whether a file is an SQLite database.
+
+    Args:
+        filename : file to check
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+
+
+def _driver(row):
+    """Create a driver from a row of :data:`_SELECT`."""
+    return Driver.from_dict(dict(zip(_COLUMNS, row)))
+
+
+def _row(driver):
+    """Return the values of a driver in the order of :data:`_COLUMNS`."""
+    return tuple(getattr(driver, name) for name in _COLUMNS)
+
+
+def _source_files(json_fname):
+    return {'json': json_fname, 'journal': journal_filename(json_fname)}
+
+
+def _source_state(json_fname):
+    """Describe a JSON database and its journal, as recorded by :func:`migrate`."""
+    state = {}
+    for name, fname in _source_files(json_fname).items():
+        try:
+            stat = os.stat(fname)
+        except FileNotFoundError:
+            state[name] = None
+            continue
+        state[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'sha1': _file_hash(fname)}
+    return state
+
+
+def _source_matches(source, json_fname):
+    """Check whether a JSON database and its journal are still as recorded.
+
+    Files that were only touched are recognized by their hash, and their
+    new time stamps are stored in ``source``.
+
+    Returns:
+        whether the files match, and whether ``source`` was updated
+    """
+    touched = False
+    for name, fname in _source_files(json_fname).items():
+        recorded = source.get(name)
+        try:
+            stat = os.stat(fname)
+        except FileNotFoundError:
+            if recorded is not None:
+                return False, False
+            continue
+        if recorded is None:
+            return False, False
+        if (recorded['mtime_ns'], recorded['size']) != (stat.st_mtime_ns,
+                                                        stat.st_size):
+            if recorded['sha1'] != _file_hash(fname):
+                return False, False
+            recorded['mtime_ns'], recorded['size'] = stat.st_mtime_ns, stat.st_size
+            touched = True
+    return True, touched
+
+
+def _read_meta(filename):
+    """Return the meta data of an SQLite database file, or ``None`` if it is
+    missing or of another schema version."""
+    if not os.path.exists(filename):
+        return None
+    connection = sqlite3.connect(filename)
+    try:
+        if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            return None
+        return dict(connection.execute("SELECT key, value FROM meta"))
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        connection.close()
+
+
+def migrate(json_fname, filename):
+    """Copy a JSON database, with the changes in its journal, into a new
+    SQLite database.
+
+    The SQLite file is created under a temporary name and only renamed
+    when complete, so an interrupted migration leaves nothing behind.
+
+    Args:
+        json_fname : the JSON database file
+        filename : the SQLite file to create
+    """
+    # the files must not change between reading and describing them
+    with FileLock(json_fname):
+        driver_db = DriverDB.from_file(json_fname)
+        DriverJournal(driver_db, json_fname)
+        source = _source_state(json_fname)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_fname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_fname)
+        try:
+            with connection:
+                # building the indexes once at the end is much faster
+                connection.execute(_TABLE)
+                connection.execute(_META)
+                connection.executemany(_INSERT, (_row(driver)
+                                                 for driver in driver_db))
+                connection.execute(_SET_META, ('source', json.dumps(source)))
+                _create_indexes(connection)
+        finally:
+            connection.close()
+        os.replace(tmp_fname, filename)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def _create_indexes(connection):
+    for statement in _INDEXES:
+        connection.execute(statement)
+    connection.execute("PRAGMA user_version = {0}".format(_SCHEMA_VERSION))
+
+
+class SQLiteDriverDB(object):
+    """Driver database in an SQLite file.
+
+    Drivers are created from the rows as they are read, e.g. while
+    iterating, and are not kept; changing a driver object therefore does
+    not change the database, use :meth:`update` instead. Drivers are
+    identified by manufacturer and model, as in
+    :class:`~altai.lib.driver_journal.DriverJournal`. Positions are mapped
+    to rows through a list of the row ids, which is read again whenever
+    the database was changed.
+
+    :meth:`drivers_of` and :meth:`query` return iterators that read the
+    rows from SQLite as they are consumed; consume them before changing
+    the database. An iterator not consumed keeps other processes from
+    writing to the file until it is garbage collected or the database is
+    closed. Only :attr:`columns` reads all rows at once.
+
+    Example:
+        >>> driver_db = SQLiteDriverDB.from_file("driver_db.json")
+        >>> for driver in driver_db.drivers_of("B&C Speakers"):
+        >>>     print(driver, driver.fs)
+    """
+
+    def __init__(self, filename=':memory:'):
+        """Open a database, creating it if needed.
+
+        Take a look at ``from_file`` for opening JSON databases as well.
+
+        Args:
+            filename : the SQLite file, by default a database in memory
+        """
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        # ids of the rows in database order, and the PRAGMA data_version
+        # they were read at, which changes with commits of other connections
+        self._ids = None
+        self._data_version = None
+        # cursors of the iterators handed out, closed with the database
+        self._cursors = weakref.WeakSet()
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            with self._connection:
+                self._connection.execute(_TABLE)
+                self._connection.execute(_META)
+                _create_indexes(self._connection)
+        elif version != _SCHEMA_VERSION:
+            self._connection.close()
+            raise ValueError("Unsupported database version {0} in {1}".format(
+                version, filename))
+
+    @classmethod
+    def from_file(cls, filename):
+        """Open a database file.
+
+        A JSON database, as written by
+        :meth:`~altai.lib.driver_database.DriverDB.write_to_disk`, is
+        migrated on first use into an SQLite file next to it (see
+        :func:`database_filename`), which is used from then on. Should the
+        JSON database or its journal change, it is migrated again.
+
+        Args:
+            filename : SQLite or JSON database file; a missing file is
+                created as an empty SQLite database
+
+        Raises:
+            ValueError : if both the JSON database and the drivers of the
+                SQLite file were changed since the migration
+
+        Example:
+            >>> driver_db = SQLiteDriverDB.from_file("mypersonaldb.json")
+        """
+        if not os.path.exists(filename) or is_sqlite_file(filename):
+            return cls(filename)
+        json_fname, filename = filename, database_filename(filename)
+        meta = _read_meta(filename) or {}
+        source = json.loads(meta.get('source', 'null'))
+        matches, touched = False, False
+        if source is not None:
+            matches, touched = _source_matches(source, json_fname)
+        if not matches:
+            if meta.get('changed') == '1':
+                raise ValueError(
+                    "Both {0} and {1} were changed since the migration; open "
+                    "{1} directly, or remove it to migrate again".format(
+                        json_fname, filename))
+            migrate(json_fname, filename)
+        driver_db = cls(filename)
+        if touched:
+            with driver_db._connection:
+                driver_db._connection.execute(_SET_META,
+                                              ('source', json.dumps(source)))
+        return driver_db
+
+    def close(self):
+        """Close the database file.
+
+        Iterators returned by :meth:`drivers_of` and :meth:`query` cannot
+        be used afterwards.
+        """
+        for cursor in list(self._cursors):
+            cursor.close()
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM drivers").fetchone()[0]
+
+    def __iter__(self):
+        """Iterate over all drivers, in the order they were added."""
+        for row in self._connection.execute(_SELECT + " ORDER BY id"):
+            yield _driver(row)
+
+    def __getitem__(self, index):
+        """Return the driver at a position, or a list for a slice."""
+        ids = self._row_ids()
+        if isinstance(index, slice):
+            selected = ids[index]
+            if not selected:
+                return []
+            if index.step not in (None, 1):
+                return [self._driver_with_id(row_id) for row_id in selected]
+            rows = self._connection.execute(
+                _SELECT + " WHERE id BETWEEN ? AND ? ORDER BY id",
+                (selected[0], selected[-1]))
+            return [_driver(row) for row in rows]
+        try:
+            row_id = ids[int(index)]
+        except IndexError:
+            raise IndexError("database index out of range")
+        return self._driver_with_id(row_id)
+
+    def _row_ids(self):
+        """Return the ids of all rows, in database order."""
+        version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if self._ids is None or version != self._data_version:
+            self._ids = [row[0] for row in self._connection.execute(
+                "SELECT id FROM drivers ORDER BY id")]
+            self._data_version = version
+        return self._ids
+
+    def _driver_with_id(self, row_id):
+        row = self._connection.execute(_SELECT + " WHERE id = ?",
+                                       (row_id,)).fetchone()
+        return _driver(row)
+
+    def _changed(self):
+        """Note a change of the drivers; call within the transaction."""
+        self._ids = None
+        self._connection.execute(_SET_META, ('changed', '1'))
+
+    @property
+    def manufacturers(self):
+        """Set of all manufacturers in the database."""
+        return set(self.sorted_manufacturers)
+
+    @property
+    def sorted_manufacturers(self):
+        """Alphabetically sorted list of all manufacturers."""
+        rows = self._connection.execute(
+            "SELECT DISTINCT manufacturer FROM drivers ORDER BY manufacturer")
+        return [row[0] for row in rows]
+
+    def drivers_of(self, manufacturer):
+        """Iterate over all drivers of a manufacturer, in database order.
+
+        Args:
+            manufacturer : manufacturer name
+        """
+        rows = self._connection.execute(
+            _SELECT + " WHERE manufacturer = ? ORDER BY id", (manufacturer,))
+        self._cursors.add(rows)
+        return (_driver(row) for row in rows)
+
+    def get(self, manufacturer, model, default=None):
+        """Look up a driver by manufacturer and model.
+
+        If several drivers share the same names, the first one added is
+        returned.
+
+        Args:
+            manufacturer : manufacturer name
+            model : model name
+            default : returned if there is no such driver
+        """
+        row = self._connection.execute(
+            _SELECT + " WHERE manufacturer = ? AND model = ? ORDER BY id LIMIT 1",
+            (manufacturer, model)).fetchone()
+        return default if row is None else _driver(row)
+
+    @property
+    def columns(self):
+        """Numeric parameters of all drivers, see
+        :class:`~altai.lib.driver_database.DriverColumns`.
+
+        Unlike the other methods, this reads every row into memory, in one
+        pass over the table, and is not kept; store the result to use it
+        more than once.
+        """
+        names = DriverColumns.NAMES
+        rows = self._connection.execute(
+            "SELECT " + ", ".join(names + FIELDS) + " FROM drivers ORDER BY id"
+        ).fetchall()
+        values = np.array([row[len(names):] for row in rows],
+                          dtype=float).reshape(-1, len(FIELDS))
+        arrays = {name: values[:, i] for i, name in enumerate(FIELDS)}
+        labels = {}
+        for i, name in enumerate(names):
+            labels[name], arrays[name] = np.unique(
+                np.array([row[i] for row in rows], dtype=str),
+                return_inverse=True)
+        return DriverColumns.from_arrays(arrays, labels)
+
+    def query(self, **ranges):
+        """Return the drivers whose parameters lie within ranges.
+
+        The ranges are checked by SQLite, using the parameter indexes.
+
+        Args:
+            ranges : for every parameter to restrict, either a pair
+                ``(low, high)`` of inclusive bounds, where ``None`` leaves
+                a side open, or a single value to match exactly
+
+        Returns:
+            iterator over the matching drivers, in database order
+
+        Example:
+            >>> woofers = driver_db.query(diameter=15, Qts=(0.3, 0.45),
+            >>>                           fs=(None, 40.0))
+        """
+        conditions, parameters = [], []
+        for name, bound in ranges.items():
+            if name not in FIELDS:
+                raise KeyError(name)
+            low, high = bound if isinstance(bound, tuple) else (bound, bound)
+            if low is not None:
+                conditions.append("{0} >= ?".format(name))
+                parameters.append(low)
+            if high is not None:
+                conditions.append("{0} <= ?".format(name))
+                parameters.append(high)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self._connection.execute(
+            _SELECT + where + " ORDER BY id", parameters)
+        self._cursors.add(rows)
+        return (_driver(row) for row in rows)
+
+    def append(self, driver):
+        """Add a driver to the database.
+
+        Args:
+            driver : the new driver
+        """
+        with self._connection:
+            self._connection.execute(_INSERT, _row(driver))
+            self._changed()
+
+    def extend(self, drivers):
+        """Add many drivers to the database, in one transaction.
+
+        Args:
+            drivers : the new drivers
+        """
+        with self._connection:
+            self._connection.executemany(_INSERT, (_row(driver)
+                                                   for driver in drivers))
+            self._changed()
+
+    def update(self, driver, **changes):
+        """Change parameters of a driver in the database.
+
+        The driver object is changed as well.
+
+        Args:
+            driver : a driver of this database
+            changes : new parameter values, e.g. ``fs=35.0``
+        """
+        unknown = set(changes) - set(_COLUMNS)
+        if unknown:
+            raise ValueError("Unknown parameters {0}".format(sorted(unknown)))
+        if not changes:
+            return
+        names = sorted(changes)
+        with self._connection:
+            self._connection.execute(
+                "UPDATE drivers SET {0} WHERE id = ({1})".format(
+                    ", ".join("{0} = ?".format(name) for name in names),
+                    _FIRST_ID),
+                [changes[name] for name in names] +
+                [driver.manufacturer, driver.model])
+            self._changed()
+        for name in names:
+            setattr(driver, name, changes[name])
+
+    def remove(self, driver):
+        """Remove a driver from the database.
+
+        Args:
+            driver : a driver of this database
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM drivers WHERE id = ({0})".format(_FIRST_ID),
+                (driver.manufacturer, driver.model))
+            if cursor.rowcount:
+                self._changed()
+        if cursor.rowcount == 0:
+            raise ValueError("{0} is not in the database".format(driver))
+
+    def write_to_disk(self, filename):
+        """Export the database as JSON file.
+
+        Args:
+            filename : file in which to store database, in the format of
+                :meth:`~altai.lib.driver_database.DriverDB.write_to_disk`
+        """
+        driver_db = DriverDB()
+        driver_db.extend(self)
+        driver_db.write_to_disk(filename)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Exclusive locks on files, shared between processes.
+
+The lock on ``<filename>`` is held on a separate file ``<filename>.lock``,
+so that the locked file itself can be replaced atomically while locked.
+The lock file is removed on release. A process waiting for it may then
+hold a lock on the removed file, so after locking it checks that the lock
+file still is the one it locked, and starts over if not. On Windows, where
+open files cannot be removed, the lock file is left in place.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# per lock file: the state shared by all FileLock objects of this process
+_states = {}
+_states_guard = threading.Lock()
+
+
+class _LockState(object):
+
+    def __init__(self):
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+
+def _lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after ten seconds; keep waiting
+            pass
+
+
+def _is_current(fd, lock_fname):
+    """Check whether a locked descriptor still belongs to the lock file."""
+    if fcntl is None:
+        return True
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(lock_fname))
+    except FileNotFoundError:
+        return False
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock(object):
+    """Exclusive lock on a file, between processes and threads.
+
+    The lock is reentrant: a thread holding it may acquire it again, e.g.
+    through another :class:`FileLock` object for the same file.
+
+    Example:
+        >>> with FileLock("driver_db.json"):
+        >>>     driver_db.write_to_disk("driver_db.json")
+    """
+
+    def __init__(self, filename):
+        """Create a lock, without acquiring it.
+
+        Args:
+            filename : the file to lock
+        """
+        self.lock_fname = os.path.abspath(filename) + '.lock'
+        with _states_guard:
+            self._state = _states.setdefault(self.lock_fname, _LockState())
+
+    def acquire(self):
+        """Wait until the lock is acquired."""
+        state = self._state
+        state.thread_lock.acquire()
+        if state.depth == 0:
+            try:
+                while True:
+                    fd = os.open(self.lock_fname, os.O_RDWR | os.O_CREAT, 0o666)
+                    try:
+                        _lock(fd)
+                    except BaseException:
+                        os.close(fd)
+                        raise
+                    if _is_current(fd, self.lock_fname):
+                        break
+                    # removed by the previous holder while waiting
+                    os.close(fd)
+            except BaseException:
+                state.thread_lock.release()
+                raise
+            state.fd = fd
+        state.depth += 1
+
+    def release(self):
+        """Release the lock."""
+        state = self._state
+        state.depth -= 1
+        if state.depth == 0:
+            fd, state.fd = state.fd, None
+            try:
+                if fcntl is not None:
+                    # while still locked, so no one can have locked a new one
+                    try:
+                        os.remove(self.lock_fname)
+                    except OSError:
+                        pass
+                _unlock(fd)
+            finally:
+                os.close(fd)
+        state.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Rank the drivers of a database for a given enclosure."""
+import concurrent.futures
+import numpy as np
+from .driver_database import DriverColumns
+from .speaker import VentedSpeakerBatch
+
+#: Metrics by which drivers can be ranked, and whether larger is better
+METRICS = {'f_3': False,
+           'reference_efficiency': True,
+           'displacement_limited_output': True,
+           'ripple': False}
+
+
+class DriverScore(object):
+    """A driver together with its metrics in a given box."""
+
+    def __init__(self, driver, f_3, reference_efficiency,
+                 displacement_limited_output, ripple):
+        """Create a new score.
+
+        Args:
+            driver : the scored driver
+            f_3 : lower -3 dB frequency in Hz
+            reference_efficiency : reference efficiency
+            displacement_limited_output : displacement limited output in dB
+            ripple : peak of the response above the passband level, in dB
+        """
+        self.driver = driver
+        self.f_3 = f_3
+        self.reference_efficiency = reference_efficiency
+        self.displacement_limited_output = displacement_limited_output
+        self.ripple = ripple
+
+    def __repr__(self):
+        """Return a string representation of the score."""
+        return "{0}: f3 {1:.3g}Hz, {2:.3g}%, {3:.3g}dB, {4:.2f}dB".format(
+            self.driver, self.f_3, 1e2 * self.reference_efficiency,
+            self.displacement_limited_output, self.ripple)
+
+
+def driver_columns(drivers):
+    """Collect the parameters needed for ranking as arrays.
+
+    Databases and selections provide their columns directly; other
+    sequences of drivers are collected into
+    :class:`~altai.lib.driver_database.DriverColumns` first.
+
+    Args:
+        drivers : sequence of drivers, a
+            :class:`~altai.lib.driver_database.DriverDB` or a
+            :class:`~altai.lib.driver_database.DriverSelection`
+
+    Returns:
+        dict of arrays with the entries ``Ts``, ``Cas``, ``Qts``, ``Qes``
+        and ``Vd``
+    """
+    columns = getattr(drivers, 'columns', None)
+    if columns is None:
+        columns = DriverColumns(drivers)
+    return {name: columns[name] for name in ('Ts', 'Cas', 'Qts', 'Qes', 'Vd')}
+
+
+def score(columns, box):
+    """Compute all ranking metrics of many drivers in one box.
+
+    Only scalar metrics are returned; no response curves are kept.
+
+    Args:
+        columns : driver parameters, see :func:`driver_columns`
+        box : the vented box
+
+    Returns:
+        dict of arrays, one per entry of :data:`METRICS`
+    """
+    batch = VentedSpeakerBatch(columns['Ts'], columns['Cas'], columns['Qts'],
+                               box.Tb, box.Cab, box.Ql)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'f_3': batch.f_3(),
+                'reference_efficiency': batch.reference_efficiency(columns['Qes']),
+                'displacement_limited_output':
+                    batch.displacement_limited_output(columns['Vd']),
+                'ripple': batch.passband_ripple()}
+
+
+def _score_chunk(arguments):
+    """Unpack arguments for :func:`score`, for use in a process pool."""
+    return score(*arguments)
+
+
+def rank_drivers(drivers, box, by='f_3', k=10, chunk_size=8192,
+                 processes=None):
+    """Rank drivers by how well they perform in a given box.
+
+    The driver parameters are pulled into arrays and all metrics are
+    computed in batched passes of ``chunk_size`` drivers, which bounds the
+    memory used for intermediate responses. Large catalogs can be spread
+    across a process pool.
+
+    Args:
+        drivers : sequence of drivers, e.g. a
+            :class:`~altai.lib.driver_database.DriverDB` or a selection of it
+        box : the vented box
+        by : metric to rank by, one of :data:`METRICS`
+        k : number of drivers to return
+        chunk_size : number of drivers evaluated in one pass
+        processes : if given, evaluate chunks in this many processes
+
+    Returns:
+        list of the ``k`` best :class:`DriverScore`, best first
+
+    Example:
+        >>> best = rank_drivers(driver_db, VentedBox(0.09, 40.0, 20.0), k=5)
+    """
+    if by not in METRICS:
+        raise ValueError("Unknown metric '{0}', use one of {1}".format(
+            by, ", ".join(sorted(METRICS))))
+    columns = driver_columns(drivers)
+    n = len(columns['Ts'])
+    if n == 0:
+        return []
+    chunks = [{name: values[start:start + chunk_size]
+               for name, values in columns.items()}
+              for start in range(0, n, chunk_size)]
+    if processes is None or processes < 2 or len(chunks) < 2:
+        scores = [score(chunk, box) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            scores = list(executor.map(_score_chunk,
+                                       [(chunk, box) for chunk in chunks]))
+    metrics = {name: np.concatenate([chunk[name] for chunk in scores])
+               for name in METRICS}
+
+    # rank so that the best value comes first; invalid values come last
+    values = -metrics[by] if METRICS[by] else metrics[by].copy()
+    values[~np.isfinite(values)] = np.inf
+    k = min(k, n)
+    top = np.argpartition(values, k - 1)[:k]
+    top = top[np.argsort(values[top], kind='stable')]
+    return [DriverScore(drivers[i], **{name: float(metrics[name][i])
+                                       for name in METRICS})
+            for i in top]
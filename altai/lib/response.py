@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Evaluate rational transfer functions at given frequencies.
+
+The systems in Altai are ratios of low order polynomials in :math:`s`. At a
+fixed frequency grid the powers of :math:`s = j\\omega` never change, so
+evaluating numerator and denominator reduces to a matrix product, which is
+much cheaper than going through ``scipy.signal`` for every call. All
+functions accept stacked coefficients of shape ``(..., order + 1)``, highest
+power first, and return arrays of shape ``(..., M)`` for M frequencies.
+"""
+import functools
+import numpy as np
+
+
+def powers(w, order=4):
+    """Powers of :math:`s = j\\omega` and their derivatives with respect to s
+
+    Args:
+        w : angular frequencies, shape (M,)
+        order : order of the polynomials to be evaluated
+
+    Returns:
+        S : :math:`s^k` for k = order, ..., 0, shape (M, order + 1)
+        dS : :math:`k s^{k-1}`, shape (M, order + 1)
+    """
+    s = 1j * np.asarray(w, dtype=float)
+    exponents = np.arange(order, -1, -1)
+    S = s[:, np.newaxis] ** exponents
+    dS = np.zeros_like(S)
+    dS[:, :-1] = exponents[:-1] * S[:, 1:]
+    return S, dS
+
+
+@functools.lru_cache(maxsize=32)
+def log_grid(f_min, f_max, num, order=4):
+    """Logarithmic frequency grid, with the powers of s precomputed
+
+    Grids are cached, so repeated calls with the same arguments cost
+    nothing. The returned arrays are read-only.
+
+    Args:
+        f_min : lower frequency in Hz
+        f_max : upper frequency in Hz
+        num : number of frequencies
+        order : order of the polynomials to be evaluated
+
+    Returns:
+        w : angular frequencies, shape (num,)
+        S, dS : see :func:`powers`
+    """
+    start = np.log10(2 * np.pi * f_min)
+    stop = np.log10(2 * np.pi * f_max)
+    w = np.logspace(start, stop, num=num)
+    S, dS = powers(w, order)
+    for array in (w, S, dS):
+        array.flags.writeable = False
+    return w, S, dS
+
+
+def transfer(b, a, S):
+    """Complex frequency response :math:`H = B(s) / A(s)`
+
+    Args:
+        b : numerator coefficients, shape (..., order + 1)
+        a : denominator coefficients, shape (..., order + 1)
+        S : powers of s, see :func:`powers`
+
+    Returns:
+        complex response, shape (..., M)
+    """
+    return (np.asarray(b) @ S.T) / (np.asarray(a) @ S.T)
+
+
+def evaluate(b, a, S, dS):
+    """Magnitude, phase and group delay from one complex evaluation
+
+    With :math:`H = B/A`, the group delay is
+    :math:`\\tau = -\\frac{d\\varphi}{d\\omega}
+    = \\mathrm{Re}\\left(\\frac{A'}{A} - \\frac{B'}{B}\\right)`,
+    where the prime denotes the derivative with respect to s.
+
+    Args:
+        b : numerator coefficients, shape (..., order + 1)
+        a : denominator coefficients, shape (..., order + 1)
+        S, dS : powers of s, see :func:`powers`
+
+    Returns:
+        amplitude : magnitude in dB, shape (..., M)
+        phase : unwrapped phase in rad, shape (..., M)
+        group_delay : group delay in s, shape (..., M)
+    """
+    b, a = np.asarray(b), np.asarray(a)
+    B, A = b @ S.T, a @ S.T
+    dB, dA = b @ dS.T, a @ dS.T
+    h = B / A
+    amplitude = 20.0 * np.log10(np.abs(h))
+    phase = np.unwrap(np.angle(h), axis=-1)
+    group_delay = np.real(dA / A - dB / B)
+    return amplitude, phase, group_delay
+
+
+def _polyval(coefficients, x):
+    """Evaluate stacked polynomials at stacked points by Horner's scheme
+
+    Args:
+        coefficients : shape (..., K), highest power first
+        x : points, shape (..., P)
+
+    Returns:
+        values, shape (..., P)
+    """
+    coefficients = np.asarray(coefficients)[..., np.newaxis]
+    shape = np.broadcast_shapes(coefficients.shape[:-2] + (1,), x.shape)
+    result = np.zeros(shape, dtype=complex)
+    for k in range(coefficients.shape[-2]):
+        result = result * x + coefficients[..., k, :]
+    return result
+
+
+def poles(a):
+    """Poles of stacked systems, as eigenvalues of the companion matrices
+
+    Args:
+        a : denominator coefficients, shape (..., order + 1)
+
+    Returns:
+        complex poles, shape (..., order)
+    """
+    a = np.asarray(a, dtype=float)
+    order = a.shape[-1] - 1
+    companion = np.zeros(a.shape[:-1] + (order, order))
+    companion[..., 0, :] = -a[..., 1:] / a[..., :1]
+    companion[..., np.arange(1, order), np.arange(order - 1)] = 1.0
+    return np.linalg.eigvals(companion)
+
+
+def _modal_coefficients(b, a):
+    """Poles p_k and the values B(p_k) / A'(p_k) for stacked systems"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    order = a.shape[-1] - 1
+    p = poles(a)
+    da = a[..., :-1] * np.arange(order, 0, -1)
+    return p, _polyval(b, p) / _polyval(da, p)
+
+
+def default_times(a, num=200):
+    """Time grid as scipy.signal would choose it for a step response
+
+    The grid ends at seven times the slowest time constant of the system.
+
+    Args:
+        a : denominator coefficients, shape (order + 1,)
+        num : number of points
+    """
+    slowest = np.min(np.abs(np.real(poles(a))))
+    return np.linspace(0.0, 7.0 / slowest, num)
+
+
+def step_response(b, a, t):
+    """Step response of stacked systems from their poles and residues
+
+    For distinct poles :math:`p_k`,
+
+    .. math:: y(t) = H(0) + \\sum_k \\frac{B(p_k)}{p_k A'(p_k)} e^{p_k t},
+
+    which is exact at any time and costs one small eigenvalue problem per
+    system. Systems with repeated poles are not supported.
+
+    Args:
+        b : numerator coefficients, shape (..., order + 1)
+        a : denominator coefficients, shape (..., order + 1)
+        t : times, shape (T,)
+
+    Returns:
+        step response, shape (..., T)
+    """
+    b, a = np.asarray(b, dtype=float), np.asarray(a, dtype=float)
+    p, r = _modal_coefficients(b, a)
+    dc_gain = b[..., -1] / a[..., -1]
+    modes = np.exp(p[..., np.newaxis] * np.asarray(t, dtype=float))
+    transient = np.einsum("...k,...kt->...t", r / p, modes)
+    return dc_gain[..., np.newaxis] + np.real(transient)
+
+
+def impulse_response(b, a, t):
+    """Impulse response of stacked systems from their poles and residues
+
+    For distinct poles :math:`p_k`,
+
+    .. math:: h(t) = \\frac{b_0}{a_0} \\delta(t)
+              + \\sum_k \\frac{B(p_k)}{A'(p_k)} e^{p_k t};
+
+    like ``scipy.signal.impulse``, the Dirac term of systems with direct
+    feedthrough is left out. Systems with repeated poles are not supported.
+
+    Args:
+        b : numerator coefficients, shape (..., order + 1)
+        a : denominator coefficients, shape (..., order + 1)
+        t : times, shape (T,)
+
+    Returns:
+        impulse response, shape (..., T)
+    """
+    p, r = _modal_coefficients(b, a)
+    modes = np.exp(p[..., np.newaxis] * np.asarray(t, dtype=float))
+    return np.real(np.einsum("...k,...kt->...t", r, modes))
+
+
+def _wrap(phase):
+    """Wrap phase differences into [-pi, pi)"""
+    return (phase + np.pi) % (2.0 * np.pi) - np.pi
+
+
+def adaptive_grid(transfer_function, w_min, w_max, tol=0.05, seeds=(),
+                  num_initial=9, max_points=1000):
+    """Frequency grid that is fine only where the response changes fast
+
+    Starting from a coarse logarithmic grid (plus any seed frequencies),
+    every interval is bisected in log-frequency until the response at the
+    midpoint deviates by less than ``tol`` from the interpolation between
+    its ends. The deviation is measured on :math:`\\ln H`, so it covers both
+    magnitude and phase; ``tol`` dB of magnitude error correspond to
+    ``tol * ln(10) / 20`` rad of phase error. Intervals are refined all at
+    once, so each pass costs a single vectorized evaluation.
+
+    Args:
+        transfer_function : callable returning the complex response at an
+            array of angular frequencies
+        w_min : lowest angular frequency
+        w_max : highest angular frequency
+        tol : tolerance, in dB
+        seeds : angular frequencies that should be part of the grid, e.g.
+            resonances; those outside [w_min, w_max] are ignored
+        num_initial : number of points of the initial grid
+        max_points : stop refining once the grid has this many points
+
+    Returns:
+        sorted angular frequencies
+    """
+    seeds = np.asarray(seeds, dtype=float).ravel()
+    seeds = seeds[(seeds > w_min) & (seeds < w_max)]
+    w = np.unique(np.concatenate([np.geomspace(w_min, w_max, num_initial),
+                                  seeds]))
+    h = transfer_function(w)
+    log_h, phase = np.log(np.abs(h)), np.angle(h)
+    tol = tol * np.log(10.0) / 20.0
+
+    refine = np.ones(len(w) - 1, dtype=bool)
+    while np.any(refine) and len(w) < max_points:
+        left = np.nonzero(refine)[0]
+        left = left[:max_points - len(w)]
+        mid = np.sqrt(w[left] * w[left + 1])
+        h_mid = transfer_function(mid)
+        log_mid, phase_mid = np.log(np.abs(h_mid)), np.angle(h_mid)
+
+        expected_phase = phase[left] + 0.5 * _wrap(phase[left + 1] - phase[left])
+        error = np.hypot(log_mid - 0.5 * (log_h[left] + log_h[left + 1]),
+                         _wrap(phase_mid - expected_phase))
+        split = ~(error <= tol)
+
+        w = np.insert(w, left + 1, mid)
+        log_h = np.insert(log_h, left + 1, log_mid)
+        phase = np.insert(phase, left + 1, phase_mid)
+        # interval i of the old grid is now intervals i + n and i + n + 1,
+        # with n the number of midpoints inserted before it
+        shifted = left + np.arange(len(left))
+        refine = np.zeros(len(w) - 1, dtype=bool)
+        refine[shifted] = split
+        refine[shifted + 1] = split
+    return w
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+r"""Analytic sensitivities of vented systems to their parameters.
+
+Written in the time constants, the coefficients of the vented box transfer
+function :math:`H = B/A` (see
+:func:`~altai.lib.speaker.vented_coefficients`) are
+
+.. math::
+
+    a_0 &= T_s^2 T_b^2, \quad
+    a_1 = \frac{T_s T_b^2}{Q_{ts}} + \frac{T_s^2 T_b}{Q_l}, \quad
+    a_2 = \frac{T_s T_b}{Q_{ts} Q_l} + (\alpha + 1) T_b^2 + T_s^2, \\
+    a_3 &= \frac{T_s}{Q_{ts}} + \frac{T_b}{Q_l}, \quad a_4 = 1, \quad
+    b_0 = T_s^2 T_b^2,
+
+with the compliance ratio :math:`\alpha = V_{as}/V_{ab}`. Their derivatives
+are simple closed forms, and with them the derivative of the level is
+
+.. math::
+
+    \frac{\partial L}{\partial p} = \frac{20}{\ln 10}
+    \mathrm{Re}\left(\frac{\partial B / \partial p}{B}
+    - \frac{\partial A / \partial p}{A}\right),
+
+which costs little more than the response itself. The derivative of f3
+follows by implicit differentiation of :math:`|H(j\omega_3)| = 1/\sqrt{2}`.
+"""
+import numpy as np
+from . import air
+from . import response
+from .speaker import VentedSpeakerBatch, _batch_grid, F_MIN, F_MAX
+
+#: Parameters the sensitivities are taken with respect to, in this order
+PARAMETERS = ('Vab', 'fb', 'Ql', 'fs', 'Qts', 'Vas')
+
+
+def coefficient_derivatives(Ts, Cas, Qts, Tb, Cab, Ql):
+    """Derivatives of the transfer function coefficients.
+
+    All arguments are broadcast against each other, as in
+    :func:`~altai.lib.speaker.vented_coefficients`.
+
+    Args:
+        Ts : time constants of the drivers
+        Cas : acoustic compliances of the drivers suspensions
+        Qts : total Qs of the drivers
+        Tb : time constants of the boxes
+        Cab : acoustic compliances of the boxes
+        Ql : enclosure leakage losses
+
+    Returns:
+        da : derivatives of the denominator, shape (..., 6, 5)
+        db : derivatives of the numerator, shape (..., 6, 5)
+        db2 : derivatives of the displacement numerator, shape (..., 6, 5)
+
+        The second to last axis runs over :data:`PARAMETERS`.
+    """
+    Ts, Cas, Qts, Tb, Cab, Ql = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (Ts, Cas, Qts, Tb, Cab, Ql)])
+    c = Cas / Cab
+
+    # partial derivatives with respect to Ts, Tb, Qts, Ql and c
+    zero = np.zeros(Ts.shape)
+    a_Ts = [2 * Ts * Tb ** 2, Tb ** 2 / Qts + 2 * Ts * Tb / Ql,
+            Tb / (Qts * Ql) + 2 * Ts, 1 / Qts, zero]
+    a_Tb = [2 * Ts ** 2 * Tb, 2 * Ts * Tb / Qts + Ts ** 2 / Ql,
+            Ts / (Qts * Ql) + 2 * (c + 1) * Tb, 1 / Ql, zero]
+    a_Qts = [zero, -Ts * Tb ** 2 / Qts ** 2, -Ts * Tb / (Qts ** 2 * Ql),
+             -Ts / Qts ** 2, zero]
+    a_Ql = [zero, -Ts ** 2 * Tb / Ql ** 2, -Ts * Tb / (Qts * Ql ** 2),
+            -Tb / Ql ** 2, zero]
+    a_c = [zero, zero, Tb ** 2, zero, zero]
+    b_Ts = [2 * Ts * Tb ** 2, zero, zero, zero, zero]
+    b_Tb = [2 * Ts ** 2 * Tb, zero, zero, zero, zero]
+    b2_Tb = [zero, zero, 2 * Tb, 1 / Ql, zero]
+    b2_Ql = [zero, zero, zero, -Tb / Ql ** 2, zero]
+
+    # chain rule: Ts = 1/(2 pi fs), Tb = 1/(2 pi fb), c = Vas/Vab
+    Ts_fs = -2 * np.pi * Ts ** 2
+    Tb_fb = -2 * np.pi * Tb ** 2
+    c_Vab = -c / (Cab * air.RHO * air.C ** 2)
+    c_Vas = 1 / (Cab * air.RHO * air.C ** 2)
+
+    def stack(Vab, fb, Ql, fs, Qts, Vas):
+        rows = [np.stack(np.broadcast_arrays(*row), axis=-1)
+                for row in (Vab, fb, Ql, fs, Qts, Vas)]
+        return np.stack(rows, axis=-2)
+
+    def scale(factor, row):
+        return [factor * x for x in row]
+
+    zeros = [zero] * 5
+    da = stack(scale(c_Vab, a_c), scale(Tb_fb, a_Tb), a_Ql,
+               scale(Ts_fs, a_Ts), a_Qts, scale(c_Vas, a_c))
+    db = stack(zeros, scale(Tb_fb, b_Tb), zeros, scale(Ts_fs, b_Ts), zeros,
+               zeros)
+    db2 = stack(zeros, scale(Tb_fb, b2_Tb), b2_Ql, zeros, zeros, zeros)
+    return da, db, db2
+
+
+class Sensitivities(object):
+    """Responses of vented systems together with their derivatives.
+
+    The derivatives are taken with respect to the parameters in
+    :data:`PARAMETERS`, in SI units (e.g. dB per m³ for ``Vab``). For
+    systems of N combinations and M frequencies, curves have the shape
+    (N, M), their derivatives (N, 6, M).
+    """
+
+    def __init__(self, freqs, amplitude, d_amplitude, displacement,
+                 d_displacement, f_3, d_f_3):
+        #: Frequencies of the curves, in Hz
+        self.freqs = freqs
+        #: Frequency responses in dB
+        self.amplitude = amplitude
+        #: Derivatives of the frequency responses
+        self.d_amplitude = d_amplitude
+        #: Normalized displacements, as in
+        #: :meth:`~altai.lib.speaker.VentedSpeaker.displacement`
+        self.displacement = displacement
+        #: Derivatives of the normalized displacements
+        self.d_displacement = d_displacement
+        #: Lower -3 dB frequencies in Hz, shape (N,)
+        self.f_3 = f_3
+        #: Derivatives of the lower -3 dB frequencies, shape (N, 6)
+        self.d_f_3 = d_f_3
+
+    def __getitem__(self, parameter):
+        """Return the derivatives (amplitude, displacement, f_3) for one
+        parameter of :data:`PARAMETERS`."""
+        i = PARAMETERS.index(parameter)
+        return (self.d_amplitude[:, i], self.d_displacement[:, i],
+                self.d_f_3[:, i])
+
+
+def vented_sensitivities(Ts, Cas, Qts, Tb, Cab, Ql, f_min=F_MIN, f_max=F_MAX,
+                         frequencies=None):
+    """Compute responses and their derivatives for many vented systems.
+
+    Args:
+        Ts : time constants of the drivers
+        Cas : acoustic compliances of the drivers suspensions
+        Qts : total Qs of the drivers
+        Tb : time constants of the boxes
+        Cab : acoustic compliances of the boxes
+        Ql : enclosure leakage losses
+        f_min : lower frequency
+        f_max : upper frequency
+        frequencies : exact frequencies in Hz, instead of 100 logarithmically
+            spaced ones between f_min and f_max
+
+    Returns:
+        a :class:`Sensitivities` for the N broadcast combinations
+    """
+    batch = VentedSpeakerBatch(Ts, Cas, Qts, Tb, Cab, Ql)
+    da, db, db2 = coefficient_derivatives(Ts, Cas, Qts, Tb, Cab, Ql)
+    da, db, db2 = [x.reshape(-1, len(PARAMETERS), 5) for x in (da, db, db2)]
+    a, b, b2 = batch._a, batch._b, batch._displacement_coefficients()
+
+    w, S = _batch_grid(f_min, f_max, 100, frequencies)
+    A, B, B2 = a @ S.T, b @ S.T, b2 @ S.T
+    # relative derivatives of H and X, shape (N, 6, M)
+    dlogA = (da @ S.T) / A[:, np.newaxis]
+    dlogH = (db @ S.T) / B[:, np.newaxis] - dlogA
+    X = B2 / A
+    dX = X[:, np.newaxis] * ((db2 @ S.T) / B2[:, np.newaxis] - dlogA)
+
+    amplitude = 20.0 * np.log10(np.abs(B / A))
+    d_amplitude = 20.0 / np.log(10.0) * np.real(dlogH)
+    displacement = np.abs(np.real(X))
+    d_displacement = np.sign(np.real(X))[:, np.newaxis] * np.real(dX)
+
+    # implicit differentiation of |H(j w3)|^2 = 1/2
+    f_3 = batch.f_3()
+    S3, dS3 = response.powers(2 * np.pi * f_3)
+    A3 = np.sum(a * S3, axis=-1)
+    B3 = np.sum(b * S3, axis=-1)
+    dlogH_dw = 1j * (np.sum(b * dS3, axis=-1) / B3 -
+                     np.sum(a * dS3, axis=-1) / A3)
+    S3 = S3[:, np.newaxis]
+    dlogH3 = (np.sum(db * S3, axis=-1) / B3[:, np.newaxis] -
+              np.sum(da * S3, axis=-1) / A3[:, np.newaxis])
+    d_f_3 = (-np.real(dlogH3) / np.real(dlogH_dw)[:, np.newaxis] /
+             (2.0 * np.pi))
+    return Sensitivities(w / (2 * np.pi), amplitude, d_amplitude, displacement,
+                         d_displacement, f_3, d_f_3)
+
+
+def sensitivities(driver, box, f_min=F_MIN, f_max=F_MAX, frequencies=None):
+    """Compute the response of a driver/box combination and its derivatives.
+
+    Args:
+        driver : the driver
+        box : the vented box
+        f_min : lower frequency
+        f_max : upper frequency
+        frequencies : exact frequencies in Hz
+
+    Returns:
+        a :class:`Sensitivities` with N = 1
+
+    Example:
+        >>> result = sensitivities(driver, box)
+        >>> d_amplitude, d_displacement, d_f_3 = result['fs']
+    """
+    return vented_sensitivities(driver.Ts, driver.Cas, driver.Qts, box.Tb,
+                                box.Cab, box.Ql, f_min, f_max, frequencies)
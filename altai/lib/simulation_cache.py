@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Cache simulation results of driver/box combinations."""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+import numpy as np
+from .speaker import VentedSpeaker, F_MIN, F_MAX
+
+# bump whenever the stored results change meaning, to invalidate disk caches
+_FORMAT_VERSION = 1
+# results stored for every simulation
+_NAMES = ('freqs', 'amplitude', 'step_t', 'step_response', 'displacement_freqs',
+          'displacement', 'f_3', 'reference_efficiency',
+          'displacement_limited_output')
+# temporary files older than this, in seconds, were left by a crash
+_STALE_TMP_AGE = 3600
+
+
+class SimulationCache(object):
+    """Bounded LRU cache of vented speaker simulations.
+
+    Results are keyed by a hash of the driver parameters (as given by
+    :meth:`~altai.lib.driver.Driver.dict_representation`), the box parameters
+    and the simulation settings, so equal combinations share an entry no
+    matter which objects describe them. The least recently used entries are
+    evicted once either ``max_entries`` or ``max_bytes`` is exceeded.
+
+    If a ``directory`` is given, every simulation is also stored there, and
+    entries that have been evicted from memory (or were computed in an
+    earlier session) are loaded from disk instead of being recomputed. The
+    on-disk tier is bounded by ``max_disk_entries`` and ``max_disk_bytes``
+    as well; loading a file marks it as used by touching it, and the files
+    used least recently are deleted first.
+
+    Example:
+        >>> cache = SimulationCache(max_entries=100)
+        >>> results = cache.simulate(driver, box)
+        >>> freqs, amplitude = results['freqs'], results['amplitude']
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 * 2**20, directory=None,
+                 f_min=F_MIN, f_max=F_MAX, step_times=None,
+                 max_disk_entries=8192, max_disk_bytes=64 * 2**20):
+        """Create an empty cache.
+
+        Args:
+            max_entries : maximum number of simulations kept in memory
+            max_bytes : maximum size of the arrays kept in memory
+            directory : optional directory for the on-disk tier
+            f_min : lower frequency of the simulated responses
+            f_max : upper frequency of the simulated responses
+            step_times : time base of the step response; by default as
+                chosen by :meth:`~altai.lib.speaker.VentedSpeaker.step_response`
+            max_disk_entries : maximum number of simulations kept on disk,
+                ``None`` for no limit
+            max_disk_bytes : maximum size of the files kept on disk,
+                ``None`` for no limit
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.f_min = f_min
+        self.f_max = f_max
+        self.step_times = step_times
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        #: Number of lookups answered from memory
+        self.hits = 0
+        #: Number of lookups answered from disk
+        self.disk_hits = 0
+        #: Number of lookups that required a new simulation
+        self.misses = 0
+        #: Size of the arrays currently kept in memory, in bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        # files and bytes on disk as of the last scan, plus those written
+        # since; other processes may write to the directory as well
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._prune()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, driver, box):
+        """Return a stable hash of a driver/box combination.
+
+        Args:
+            driver : driver to simulate
+            box : vented box to simulate
+        """
+        if self.step_times is None:
+            step_times = None
+        else:
+            step_times = hashlib.sha1(
+                np.asarray(self.step_times, dtype=float).tobytes()).hexdigest()
+        description = {'version': _FORMAT_VERSION,
+                       'driver': driver.dict_representation(),
+                       'box': {'Vab': box.Vab, 'fb': box.fb, 'Ql': box.Ql},
+                       'settings': [self.f_min, self.f_max, step_times]}
+        text = json.dumps(description, sort_keys=True, default=float)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def simulate(self, driver, box):
+        """Return the simulation results of a driver/box combination.
+
+        The results are a dict holding the frequency response (``freqs``,
+        ``amplitude``), the step response (``step_t``, ``step_response``),
+        the displacement (``displacement_freqs``, ``displacement``) and the
+        scalar metrics ``f_3``, ``reference_efficiency`` and
+        ``displacement_limited_output``. All arrays are read-only.
+
+        Args:
+            driver : driver to simulate
+            box : vented box to simulate
+        """
+        key = self.key(driver, box)
+        results = self.get(key)
+        if results is not None:
+            return results
+        self.misses += 1
+        results = self._compute(driver, box)
+        self._insert(key, results)
+        if self.directory is not None:
+            self._write(key, results)
+        return results
+
+    def get(self, key):
+        """Look up results by key, without simulating anything.
+
+        Args:
+            key : key as returned by :meth:`key`
+
+        Returns:
+            the results, or ``None`` if they are not cached
+        """
+        results = self._entries.get(key)
+        if results is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+        if self.directory is not None:
+            results = self._read(key)
+            if results is not None:
+                self.disk_hits += 1
+                self._insert(key, results)
+                return results
+        return None
+
+    def clear(self, disk=False):
+        """Remove all entries from memory, and optionally from disk.
+
+        Args:
+            disk : also delete the on-disk tier
+        """
+        self._entries.clear()
+        self.nbytes = 0
+        if disk and self.directory is not None:
+            for fname in os.listdir(self.directory):
+                if fname.endswith('.npz'):
+                    os.remove(os.path.join(self.directory, fname))
+            self._disk_entries = 0
+            self._disk_bytes = 0
+
+    def _compute(self, driver, box):
+        speaker = VentedSpeaker(driver, box)
+        freqs, amplitude = speaker.frequency_response(self.f_min, self.f_max)
+        step_t, step_response = speaker.step_response(self.step_times)
+        displacement_freqs, displacement = speaker.displacement(
+            self.f_min, self.f_max)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reference_efficiency = speaker.reference_efficiency()
+            displacement_limited_output = speaker.displacement_limited_output()
+        return {'freqs': freqs,
+                'amplitude': amplitude,
+                'step_t': step_t,
+                'step_response': step_response,
+                'displacement_freqs': displacement_freqs,
+                'displacement': displacement,
+                'f_3': float(speaker.f_3()),
+                'reference_efficiency': float(reference_efficiency),
+                'displacement_limited_output': float(displacement_limited_output)}
+
+    def _insert(self, key, results):
+        self._entries[key] = results
+        self.nbytes += _size(results)
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 self.nbytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= _size(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _write(self, key, results):
+        # write to a temporary file first, so that readers never see a
+        # partially written entry
+        fd, tmp_fname = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        path = self._path(key)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **results)
+            size = os.path.getsize(tmp_fname)
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = None
+            os.replace(tmp_fname, path)
+        except OSError:
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+            return
+        if replaced is None:
+            self._disk_entries += 1
+            self._disk_bytes += size
+        else:
+            self._disk_bytes += size - replaced
+        if self._disk_full(self._disk_entries, self._disk_bytes):
+            self._prune()
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f, np.load(f) as data:
+                results = {name: data[name] for name in _NAMES}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+            # corrupt or incomplete, e.g. written by an older version
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        try:
+            # the modification time tells _prune when it was last used
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        for name, value in results.items():
+            if value.ndim == 0:
+                results[name] = float(value)
+            else:
+                value.flags.writeable = False
+        return results
+
+    def _disk_full(self, entries, nbytes):
+        return ((self.max_disk_entries is not None and
+                 entries > self.max_disk_entries) or
+                (self.max_disk_bytes is not None and nbytes > self.max_disk_bytes))
+
+    def _prune(self):
+        """Delete the least recently used files until the on-disk tier is
+        within its bounds, and temporary files left by crashes."""
+        files = []
+        stale = time.time() - _STALE_TMP_AGE
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.npz', '.tmp')):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith('.npz'):
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                elif stat.st_mtime < stale:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        entries = len(files)
+        nbytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if not self._disk_full(entries, nbytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # pruned by another process
+                pass
+            except OSError:
+                continue
+            entries -= 1
+            nbytes -= size
+        self._disk_entries = entries
+        self._disk_bytes = nbytes
+
+
+def _size(results):
+    """Memory used by the arrays of a result dict, in bytes."""
+    return sum(value.nbytes for value in results.values()
+               if isinstance(value, np.ndarray))
@@ -1,6 +1,269 @@
 import numpy as np
 import scipy.signal as signal
 from . import air
+from . import response
+
+
+#: Lower end of the default frequency range, in Hz
+F_MIN = 20.0
+#: Upper end of the default frequency range, in Hz
+F_MAX = 300.0
+
+
+# reference sound pressure and measuring distance for SPL figures
+_P_REF = 20e-6
+_DISTANCE = 1.0
+
+
+def vented_coefficients(Ts, Cas, Qts, Tb, Cab, Ql):
+    """Compute the transfer function coefficients of vented systems
+
+    All arguments may be scalars or arrays of matching shape; the
+    coefficients of every system are stacked along the last axis, highest
+    power of s first.
+
+    Parameters
+    ----------
+    Ts :
+        Time constant of the driver
+    Cas :
+        Acoustic compliance of the drivers suspension
+    Qts :
+        Total Q of the driver
+    Tb :
+        Time constant of the box
+    Cab :
+        Acoustic compliance of the box
+    Ql :
+        Enclosure leakage losses
+
+    Returns
+    -------
+    T_0 : ndarray
+        System time constant
+    a : ndarray
+        denominator coefficients, shape ``(..., 5)``
+    b : ndarray
+        numerator coefficients, shape ``(..., 5)``
+    """
+    Ts, Cas, Qts, Tb, Cab, Ql = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (Ts, Cas, Qts, Tb, Cab, Ql)]
+    )
+    T_0 = np.sqrt(Ts * Tb)
+    # tuning ratio
+    h = Ts / Tb
+    # compliance ratio
+    c = Cas / Cab
+
+    a = np.zeros(T_0.shape + (5,))
+    b = np.zeros(T_0.shape + (5,))
+    b[..., 0] = T_0 ** 4
+
+    a[..., 0] = T_0 ** 4
+    a[..., 1] = T_0 ** 3 * (Ql + h * Qts) / (np.sqrt(h) * Ql * Qts)
+    a[..., 2] = T_0 ** 2 * (h + (c + 1 + h ** 2) * Qts * Ql) / (h * Qts * Ql)
+    a[..., 3] = T_0 * (h * Ql + Qts) / (np.sqrt(h) * Qts * Ql)
+    a[..., 4] = 1.0
+    if T_0.ndim == 0:
+        T_0 = T_0[()]
+    return T_0, a, b
+
+
+def _grid_key(frequencies):
+    """Hashable representation of an optional frequency grid"""
+    if frequencies is None:
+        return None
+    return np.asarray(frequencies, dtype=float).tobytes()
+
+
+def _batch_grid(f_min, f_max, num, frequencies):
+    """Angular frequencies and powers of s for batched evaluation"""
+    if frequencies is None:
+        w, S, _ = response.log_grid(f_min, f_max, num)
+    else:
+        w = 2 * np.pi * np.asarray(frequencies, dtype=float)
+        S, _ = response.powers(w)
+    return w, S
+
+
+def _column(x):
+    """Values of the systems as column, to broadcast against frequencies"""
+    return np.asarray(x, dtype=float)[..., np.newaxis]
+
+
+def _maximum_spl(H, X, Ts, Sd, xmax, power, efficiency):
+    """Excursion and thermally limited SPL from the complex responses
+
+    ``H`` and ``X`` are the normalized acoustic output and cone displacement,
+    the driver parameters broadcast against them.
+    """
+    with np.errstate(divide="ignore"):
+        # in the passband the cone acceleration is x0 / Ts^2, where x0 is the
+        # scale of the normalized displacement; xmax limits x0 |X|
+        acceleration = xmax / (np.abs(X) * Ts ** 2)
+        p_excursion = (air.RHO * Sd * acceleration * np.abs(H)
+                       / (2.0 * np.pi * _DISTANCE) / np.sqrt(2.0))
+        p_thermal = np.abs(H) * np.sqrt(
+            air.RHO * air.C * efficiency * power / (2.0 * np.pi * _DISTANCE ** 2))
+        spl_excursion = 20.0 * np.log10(p_excursion / _P_REF)
+        spl_thermal = 20.0 * np.log10(p_thermal / _P_REF)
+    return np.minimum(spl_excursion, spl_thermal), spl_excursion, spl_thermal
+
+
+def _f3_coefficients(a, T_0):
+    """Coefficients A1, A2, A3 of the -3 dB quartic, as given by Small"""
+    A1 = (a[..., 1] / T_0 ** 3) ** 2 - 2.0 * a[..., 2] / T_0 ** 2
+    A2 = (a[..., 2] / T_0 ** 2) ** 2 + 2.0 - 2 * a[..., 1] * a[..., 3] / T_0 ** 4
+    A3 = (a[..., 3] / T_0) ** 2 - 2.0 * a[..., 2] / T_0 ** 2
+    return A1, A2, A3
+
+
+def _quartic_roots(A1, A2, A3):
+    """Roots of d^4 - A1 d^3 - A2 d^2 - A3 d - 1 in closed form (Ferrari)
+
+    Returns a complex array of shape ``(N, 4)``.
+    """
+    b, c, d = -A1.astype(complex), -A2.astype(complex), -A3.astype(complex)
+    # depressed quartic y^4 + p y^2 + q y + r, with d = y - b/4
+    p = c - 3.0 * b ** 2 / 8.0
+    q = d - b * c / 2.0 + b ** 3 / 8.0
+    r = -1.0 - b * d / 4.0 + b ** 2 * c / 16.0 - 3.0 * b ** 4 / 256.0
+
+    # one root m of the resolvent cubic m^3 + p m^2 + (p^2/4 - r) m - q^2/8,
+    # by Cardano; the one of largest modulus keeps sqrt(2m) away from zero
+    delta0 = p ** 2 - 3.0 * (p ** 2 / 4.0 - r)
+    delta1 = 2.0 * p ** 3 - 9.0 * p * (p ** 2 / 4.0 - r) - 27.0 * q ** 2 / 8.0
+    sq = np.sqrt(delta1 ** 2 - 4.0 * delta0 ** 3)
+    big = np.where(np.abs(delta1 + sq) >= np.abs(delta1 - sq),
+                   delta1 + sq, delta1 - sq)
+    C = (big / 2.0) ** (1.0 / 3.0)
+    ms = []
+    for k in range(3):
+        Ck = C * np.exp(2j * np.pi * k / 3.0)
+        ratio = np.divide(delta0, Ck, out=np.zeros_like(Ck), where=Ck != 0)
+        ms.append(-(p + Ck + ratio) / 3.0)
+    ms = np.stack(ms, axis=-1)
+    m = ms[np.arange(ms.shape[0]), np.argmax(np.abs(ms), axis=-1)]
+
+    sqrt2m = np.sqrt(2.0 * m)
+    ratio = np.divide(q, sqrt2m, out=np.zeros_like(q), where=sqrt2m != 0)
+    roots = []
+    for s1 in (1.0, -1.0):
+        disc = np.sqrt(-(2.0 * p + 2.0 * m + 2.0 * s1 * ratio))
+        for s2 in (1.0, -1.0):
+            roots.append((s1 * sqrt2m + s2 * disc) / 2.0 - b / 4.0)
+    return np.stack(roots, axis=-1)
+
+
+def _companion_roots(A1, A2, A3):
+    """Roots of d^4 - A1 d^3 - A2 d^2 - A3 d - 1 as companion eigenvalues"""
+    companion = np.zeros((A1.shape[0], 4, 4))
+    companion[:, 0, 0] = A1
+    companion[:, 0, 1] = A2
+    companion[:, 0, 2] = A3
+    companion[:, 0, 3] = 1.0
+    companion[:, 1, 0] = 1.0
+    companion[:, 2, 1] = 1.0
+    companion[:, 3, 2] = 1.0
+    return np.linalg.eigvals(companion)
+
+
+def _smallest_positive_root(roots, A1, A2, A3):
+    """Pick and polish the smallest positive real root of each quartic
+
+    Returns the roots and a mask of those quartics for which no such root
+    could be identified reliably.
+    """
+    # Double roots may come out as a pair with a tiny imaginary part, hence
+    # the tolerance.
+    is_real = np.abs(roots.imag) <= 1e-6 * np.abs(roots)
+    candidates = np.where(is_real & (roots.real > 0.0), roots.real, np.inf)
+    d = candidates.min(axis=1)
+    failed = np.isinf(d)
+    d[failed] = 1.0
+
+    for _ in range(2):
+        p = (((d - A1) * d - A2) * d - A3) * d - 1.0
+        dp = ((4.0 * d - 3.0 * A1) * d - 2.0 * A2) * d - A3
+        step = np.divide(p, dp, out=np.zeros_like(d), where=dp != 0.0)
+        d = d - step
+
+    # coming from -1 at d = 0, the quartic must be rising at its first root
+    p = (((d - A1) * d - A2) * d - A3) * d - 1.0
+    dp = ((4.0 * d - 3.0 * A1) * d - 2.0 * A2) * d - A3
+    scale = d ** 4 + np.abs(A1) * d ** 3 + np.abs(A2) * d ** 2 + np.abs(A3) * d + 1.0
+    failed |= (np.abs(p) > 1e-8 * scale) | (dp < 0.0) | (d <= 0.0)
+    return d, failed
+
+
+def _smallest_positive_root_scalar(A1, A2, A3):
+    """:func:`_smallest_positive_root` of a single quartic, via np.roots
+
+    For one quartic, the overhead of the vectorized solution outweighs the
+    work, so this goes through Python floats instead.
+    """
+    roots = np.roots([1.0, -A1, -A2, -A3, -1.0]).tolist()
+    candidates = [root.real for root in roots
+                  if abs(root.imag) <= 1e-6 * abs(root) and root.real > 0.0]
+    d = min(candidates) if candidates else 1.0
+    for _ in range(2):
+        p = (((d - A1) * d - A2) * d - A3) * d - 1.0
+        dp = ((4.0 * d - 3.0 * A1) * d - 2.0 * A2) * d - A3
+        if dp != 0.0:
+            d -= p / dp
+    return d
+
+
+def solve_f_3(A1, A2, A3, f_0=1.0):
+    r"""Solve the -3 dB condition of many vented systems at once
+
+    The lower -3 dB frequency :math:`f_3 = \sqrt{d} f_0` follows from the
+    smallest positive real root of the quartic
+    :math:`d^4 - A_1 d^3 - A_2 d^2 - A_3 d - 1 = 0`, see Small [1]_. This is
+    the frequency at which the response first reaches -3 dB coming from low
+    frequencies, so a slight sag of the passband below -3 dB does not move
+    f_3 up into the passband.
+
+    All quartics are solved together in closed form and the chosen root is
+    polished with Newton steps. The few quartics for which this is not
+    reliable (e.g. close to a double root) are solved again via the
+    eigenvalues of their companion matrices. A single quartic, given as
+    scalars, is solved via the companion matrix right away, which is faster
+    than the closed form for one system.
+
+    Parameters
+    ----------
+    A1, A2, A3 :
+        coefficients of the quartics, scalars or arrays of matching shape
+    f_0 :
+        system resonance frequency, by which the result is scaled
+
+    Returns
+    -------
+    f3 : ndarray or float
+        lower -3 dB frequencies, in the shape of the broadcast inputs
+
+    References
+    ----------
+    .. [1] Richard H. Small, "Vented-Box Loudspeaker Systems -- Part I"
+    """
+    A1, A2, A3 = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (A1, A2, A3)]
+    )
+    shape = A1.shape
+    if not shape:
+        d = _smallest_positive_root_scalar(float(A1), float(A2), float(A3))
+        return np.sqrt(d) * f_0
+    A1, A2, A3 = A1.ravel(), A2.ravel(), A3.ravel()
+
+    d, failed = _smallest_positive_root(_quartic_roots(A1, A2, A3), A1, A2, A3)
+    if np.any(failed):
+        A1f, A2f, A3f = A1[failed], A2[failed], A3[failed]
+        roots = _companion_roots(A1f, A2f, A3f)
+        d[failed], _ = _smallest_positive_root(roots, A1f, A2f, A3f)
+
+    f3 = np.sqrt(d) * f_0
+    return f3.reshape(shape) if shape else f3[0]
 
 
 class Speaker(object):
@@ -10,67 +273,132 @@ class Speaker(object):
 
 
 class VentedSpeaker(Speaker):
+    """A driver in a vented box
+
+    Everything derived from the driver and box parameters (coefficients, LTI
+    system, f_3, efficiency figures and responses) is computed on first
+    access and then cached. Driver and box may be changed or replaced at any
+    time; the cache is dropped as soon as any of the parameters it depends
+    on differs from the ones it was computed with. Cached arrays are
+    read-only.
+
+    Responses are evaluated directly from the coefficients, see
+    :mod:`altai.lib.response`. Set :attr:`backend` to ``"scipy"`` to go
+    through ``scipy.signal`` instead, e.g. as a reference.
+    """
+
+    #: How responses are evaluated, ``"direct"`` or ``"scipy"``
+    backend = "direct"
+
     def __init__(self, driver, box):
         Speaker.__init__(self, driver, box)
+        self._cache = {}
+        self._cache_key = None
 
-        # Response parameters
-        self.T_0 = np.sqrt(driver.Ts * box.Tb)
-        self.f_0 = 1.0 / (2.0 * np.pi * self.T_0)
-        # tuning ratio
-        h = driver.Ts / box.Tb
-        # compliance ratio
-        c = driver.Cas / box.Cab
-
-        self._a = np.zeros(5)
-        self._b = np.zeros(5)
-        self._b[0] = self.T_0 ** 4
-
-        self._a[0] = self.T_0 ** 4
-        self._a[1] = (
-            self.T_0 ** 3
-            * (box.Ql + h * driver.Qts)
-            / (np.sqrt(h) * box.Ql * driver.Qts)
-        )
-        self._a[2] = (
-            self.T_0 ** 2
-            * (h + (c + 1 + h ** 2) * driver.Qts * box.Ql)
-            / (h * driver.Qts * box.Ql)
+    def _parameters(self):
+        """Driver and box parameters that the cached quantities depend on"""
+        driver, box = self.driver, self.box
+        return (
+            driver.Ts, driver.Cas, driver.Qts, driver.Qes, driver.fs,
+            driver.Vas, driver.xmax, driver.Sd, driver.power,
+            box.Tb, box.Cab, box.Ql, box.Vab,
         )
-        self._a[3] = (
-            self.T_0 * (h * box.Ql + driver.Qts) / (np.sqrt(h) * driver.Qts * box.Ql)
-        )
-        self._a[4] = 1.0
 
-        self._system = signal.lti(self._b, self._a)
+    def _cached(self, key, compute):
+        """Return cached value for key, computing it if necessary"""
+        parameters = self._parameters()
+        if parameters != self._cache_key:
+            self._cache.clear()
+            self._cache_key = parameters
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = compute()
+            for array in value if isinstance(value, tuple) else ():
+                if isinstance(array, np.ndarray):
+                    array.flags.writeable = False
+            self._cache[key] = value
+            return value
+
+    def _coefficients(self):
+        return self._cached("coefficients", lambda: vented_coefficients(
+            self.driver.Ts, self.driver.Cas, self.driver.Qts,
+            self.box.Tb, self.box.Cab, self.box.Ql
+        ))
+
+    @property
+    def T_0(self):
+        r"""System time constant :math:`T_0 = \sqrt{T_s T_b}`"""
+        return self._coefficients()[0]
+
+    @property
+    def f_0(self):
+        r"""System resonance frequency :math:`f_0 = 1 / (2 \pi T_0)`"""
+        return 1.0 / (2.0 * np.pi * self.T_0)
+
+    @property
+    def _a(self):
+        return self._coefficients()[1]
+
+    @property
+    def _b(self):
+        return self._coefficients()[2]
+
+    @property
+    def _system(self):
+        return self._cached("system", lambda: signal.lti(self._b, self._a))
 
     def f_3(self):
-        A1 = (self._a[1] / self.T_0 ** 3) ** 2 - 2.0 * self._a[2] / self.T_0 ** 2
-        A2 = (
-            (self._a[2] / self.T_0 ** 2) ** 2
-            + 2.0
-            - 2 * self._a[1] * self._a[3] / self.T_0 ** 4
-        )
-        A3 = (self._a[3] / self.T_0) ** 2 - 2.0 * self._a[2] / self.T_0 ** 2
-        d_poly = np.poly1d([1.0, -A1, -A2, -A3, -1.0])
-        roots = d_poly.r
-        d = np.abs(roots[2])
-        f3 = np.sqrt(d) * self.f_0
-        return f3
-
-    def frequency_response(self, f_min=20.0, f_max=300.0):
+        """Lower -3 dB frequency, see :func:`solve_f_3`"""
+        return self._cached("f_3", self._f_3)
+
+    def _f_3(self):
+        A1, A2, A3 = _f3_coefficients(self._a, self.T_0)
+        return solve_f_3(A1, A2, A3, self.f_0)
+
+    def _grid(self, f_min, f_max, num, frequencies, adaptive, tol, numerator):
+        """Angular frequencies and powers of s to evaluate a response at"""
+        if frequencies is not None:
+            w = 2 * np.pi * np.asarray(frequencies, dtype=float)
+        elif adaptive:
+            w = response.adaptive_grid(
+                lambda w: response.transfer(numerator, self._a,
+                                            response.powers(w)[0]),
+                2 * np.pi * f_min, 2 * np.pi * f_max, tol,
+                seeds=2 * np.pi * np.array([self.f_3(), self.box.fb]),
+            )
+        else:
+            return response.log_grid(f_min, f_max, num)
+        return (w,) + response.powers(w)
+
+    def frequency_response(self, f_min=F_MIN, f_max=F_MAX, frequencies=None,
+                           adaptive=False, tol=0.1):
         """Calculate frequency response of the speaker (box/driver combination)
 
         Calculate system response of a certain driver in a vented box,
         according to Small [1]_.
 
+        By default, the response is computed at 100 logarithmically spaced
+        frequencies. With ``adaptive``, the grid is refined only where the
+        response changes fast, see :func:`altai.lib.response.adaptive_grid`;
+        this gives a curve accurate to about ``tol`` dB with far fewer points
+        in flat regions. Pass ``frequencies`` to get the response at exactly
+        these frequencies, e.g. to stack it with others.
+
         Parameters
         ----------
         f_min :
             Lower frequency
         f_max :
             Upper frequency
+        frequencies :
+            Exact frequencies in Hz; overrides all other grid options
+        adaptive :
+            Choose the frequencies adaptively
+        tol :
+            Tolerance of the adaptive grid, in dB
 
-        EReturns
+        Returns
         -------
         freqs : ndarray
             the frequencies at which h was computed
@@ -81,33 +409,148 @@ class VentedSpeaker(Speaker):
         ----------
         .. [1] Richard H. Small, "Vented-Box Loudspeaker Systems -- Part I"
         """
-        start = np.log10(2 * np.pi * f_min)
-        stop = np.log10(2 * np.pi * f_max)
-        frequencies = np.logspace(start, stop, num=100)
+        if self.backend != "direct":
+            return self._cached(
+                ("frequency_response", self.backend, f_min, f_max,
+                 _grid_key(frequencies), adaptive, tol),
+                lambda: self._scipy_frequency_response(
+                    f_min, f_max, frequencies, adaptive, tol),
+            )
+        freqs, amplitude, _, _ = self.full_frequency_response(
+            f_min, f_max, frequencies, adaptive, tol)
+        return (freqs, amplitude)
+
+    def full_frequency_response(self, f_min=F_MIN, f_max=F_MAX,
+                                frequencies=None, adaptive=False, tol=0.1):
+        """Calculate amplitude, phase and group delay of the speaker
+
+        All three are derived from the same complex evaluation, see
+        :func:`altai.lib.response.evaluate`. The frequencies are chosen as
+        for :meth:`frequency_response`.
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the response was computed
+        amplitude : ndarray
+            the frequency response in dB
+        phase : ndarray
+            the unwrapped phase in rad
+        group_delay : ndarray
+            the group delay in s
+        """
+        return self._cached(
+            ("full_frequency_response", f_min, f_max,
+             _grid_key(frequencies), adaptive, tol),
+            lambda: self._full_frequency_response(
+                f_min, f_max, frequencies, adaptive, tol),
+        )
+
+    def _full_frequency_response(self, f_min, f_max, frequencies, adaptive, tol):
+        w, S, dS = self._grid(f_min, f_max, 100, frequencies, adaptive, tol,
+                              self._b)
+        amplitude, phase, group_delay = response.evaluate(self._b, self._a, S, dS)
+        return (w / (2 * np.pi), amplitude, phase, group_delay)
+
+    def _scipy_frequency_response(self, f_min, f_max, frequencies, adaptive, tol):
+        frequencies = self._grid(f_min, f_max, 100, frequencies, adaptive, tol,
+                                 self._b)[0]
 
         w, h = self._system.freqresp(w=frequencies)
         freqs = w / (2 * np.pi)
         amplitude = 20.0 * np.log10(np.abs(h))
         return (freqs, amplitude)
 
-    def displacement(self, f_min=20.0, f_max=300.0):
-        start = np.log10(2 * np.pi * f_min)
-        stop = np.log10(2 * np.pi * f_max)
-        frequencies = np.logspace(start, stop, num=50)
+    def displacement(self, f_min=F_MIN, f_max=F_MAX, frequencies=None,
+                     adaptive=False, tol=0.1):
+        """Calculate the normalized cone displacement of the speaker
 
+        The frequencies are chosen as for :meth:`frequency_response`, but
+        with 50 points by default. An adaptive grid resolves the
+        cone-excursion null at the tuning frequency.
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the displacement was computed
+        displacement : ndarray
+            the normalized displacement
+        """
+        return self._cached(
+            ("displacement", self.backend, f_min, f_max,
+             _grid_key(frequencies), adaptive, tol),
+            lambda: self._displacement(f_min, f_max, frequencies, adaptive, tol),
+        )
+
+    def _displacement_coefficients(self):
+        """Numerator of the normalized cone displacement"""
         b2 = np.zeros(5)
         b2[2] = self.box.Tb ** 2
         b2[3] = self.box.Tb / self.box.Ql
         b2[4] = 1.0
+        return b2
 
-        w, displacement = signal.freqs(b2, self._a, worN=frequencies)
+    def _displacement(self, f_min, f_max, frequencies, adaptive, tol):
+        b2 = self._displacement_coefficients()
+        w, S, _ = self._grid(f_min, f_max, 50, frequencies, adaptive, tol, b2)
+
+        if self.backend == "direct":
+            displacement = response.transfer(b2, self._a, S)
+        else:
+            w, displacement = signal.freqs(b2, self._a, worN=w)
         freqs = w / (2 * np.pi)
         return (freqs, np.abs(np.real(displacement)))
 
-    def step_response(self):
-        return self._system.step(N=200)
+    def step_response(self, t=None):
+        """Calculate the step response of the speaker
+
+        The response is computed analytically from the poles and residues of
+        the system, see :func:`altai.lib.response.step_response`.
+
+        Parameters
+        ----------
+        t :
+            Times at which to evaluate the response. By default, 200 points
+            covering the decay of the slowest pole, as scipy would choose
+            them. Pass a fixed grid to get responses on the same time base.
+
+        Returns
+        -------
+        t : ndarray
+            the times at which the response was computed
+        response : ndarray
+            the step response
+        """
+        key = None if t is None else np.asarray(t, dtype=float).tobytes()
+        return self._cached(
+            ("step_response", self.backend, key),
+            lambda: self._transient(response.step_response, "step", t),
+        )
+
+    def impulse_response(self, t=None):
+        """Calculate the impulse response of the speaker
+
+        Like :meth:`step_response`, but for a Dirac impulse. The Dirac part
+        due to the direct feedthrough of the system is left out.
+        """
+        key = None if t is None else np.asarray(t, dtype=float).tobytes()
+        return self._cached(
+            ("impulse_response", self.backend, key),
+            lambda: self._transient(response.impulse_response, "impulse", t),
+        )
+
+    def _transient(self, function, scipy_method, t):
+        if self.backend != "direct":
+            return getattr(self._system, scipy_method)(T=t, N=200)
+        if t is None:
+            t = response.default_times(self._a)
+        t = np.array(t, dtype=float)
+        return (t, function(self._b, self._a, t))
 
     def reference_efficiency(self):
+        return self._cached("reference_efficiency", self._reference_efficiency)
+
+    def _reference_efficiency(self):
         f3 = self.f_3()
         factor = 4.0 * np.pi ** 2 / (air.C ** 3)
         v_ratio = self.driver.Vas / self.box.Vab
@@ -116,6 +559,290 @@ class VentedSpeaker(Speaker):
         return k_eta * f3 ** 3 * self.box.Vab
 
     def displacement_limited_output(self):
+        return self._cached(
+            "displacement_limited_output", self._displacement_limited_output
+        )
+
+    def _displacement_limited_output(self):
         P_ar = 3.0 * self.f_3() ** 4.0 * self.driver.Vd ** 2.0
-        print(P_ar)
         return 112.0 + 10.0 * np.log10(P_ar)
+
+    def maximum_spl(self, f_min=F_MIN, f_max=F_MAX, frequencies=None):
+        """Calculate the maximum SPL the speaker can produce at each frequency
+
+        At each frequency, the output is limited either by the excursion of
+        the cone reaching ``driver.xmax``, or by the input reaching the
+        thermal power handling ``driver.power``; the maximum SPL is the lower
+        of both. Levels are for a sine wave, at 1 m in half space.
+
+        Parameters
+        ----------
+        f_min :
+            Lower frequency
+        f_max :
+            Upper frequency
+        frequencies :
+            Exact frequencies in Hz, instead of 100 logarithmically spaced
+            ones between f_min and f_max
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the SPL was computed
+        spl : ndarray
+            the maximum SPL in dB
+        spl_excursion : ndarray
+            the excursion limited SPL in dB
+        spl_thermal : ndarray
+            the thermally limited SPL in dB
+        """
+        return self._cached(
+            ("maximum_spl", f_min, f_max, _grid_key(frequencies)),
+            lambda: self._maximum_spl(f_min, f_max, frequencies),
+        )
+
+    def _maximum_spl(self, f_min, f_max, frequencies):
+        w, S, _ = self._grid(f_min, f_max, 100, frequencies, False, None, None)
+        H = response.transfer(self._b, self._a, S)
+        X = response.transfer(self._displacement_coefficients(), self._a, S)
+        driver = self.driver
+        with np.errstate(divide="ignore"):
+            efficiency = self.reference_efficiency()
+        spls = _maximum_spl(H, X, driver.Ts, driver.Sd, driver.xmax,
+                            driver.power, efficiency)
+        return (w / (2 * np.pi),) + spls
+
+
+class VentedSpeakerBatch(object):
+    """Many driver/box combinations in vented boxes, evaluated at once
+
+    Counterpart of :class:`VentedSpeaker` for design sweeps: instead of one
+    object per combination, the parameters are given as arrays and the
+    coefficients of all N systems are kept in ``(N, 5)`` matrices. All
+    parameters are broadcast against each other, so e.g. a single driver
+    can be combined with many boxes.
+
+    Parameters
+    ----------
+    Ts :
+        Time constants of the drivers
+    Cas :
+        Acoustic compliances of the drivers suspensions
+    Qts :
+        Total Qs of the drivers
+    Tb :
+        Time constants of the boxes
+    Cab :
+        Acoustic compliances of the boxes
+    Ql :
+        Enclosure leakage losses
+    """
+
+    def __init__(self, Ts, Cas, Qts, Tb, Cab, Ql):
+        T_0, a, b = vented_coefficients(Ts, Cas, Qts, Tb, Cab, Ql)
+        shape = np.shape(T_0)
+        self.Ts = np.broadcast_to(Ts, shape).ravel().astype(float)
+        self.Cas = np.broadcast_to(Cas, shape).ravel().astype(float)
+        self.Tb = np.broadcast_to(Tb, shape).ravel().astype(float)
+        self.Cab = np.broadcast_to(Cab, shape).ravel().astype(float)
+        self.Ql = np.broadcast_to(Ql, shape).ravel().astype(float)
+        self.T_0 = np.ravel(T_0)
+        self.f_0 = 1.0 / (2.0 * np.pi * self.T_0)
+        self._a = a.reshape(-1, 5)
+        self._b = b.reshape(-1, 5)
+        self._f_3 = None
+
+    @classmethod
+    def from_speakers(cls, drivers, boxes):
+        """Create a batch from sequences of drivers and boxes
+
+        Parameters
+        ----------
+        drivers :
+            sequence of :class:`~altai.lib.driver.Driver`
+        boxes :
+            sequence of :class:`~altai.lib.vented_box.VentedBox`, of the same
+            length as ``drivers``
+        """
+        return cls(
+            [driver.Ts for driver in drivers],
+            [driver.Cas for driver in drivers],
+            [driver.Qts for driver in drivers],
+            [box.Tb for box in boxes],
+            [box.Cab for box in boxes],
+            [box.Ql for box in boxes],
+        )
+
+    def __len__(self):
+        return self._a.shape[0]
+
+    def f_3(self):
+        """Lower -3 dB frequencies of all systems, see :func:`solve_f_3`"""
+        if self._f_3 is None:
+            A1, A2, A3 = _f3_coefficients(self._a, self.T_0)
+            self._f_3 = solve_f_3(A1, A2, A3, self.f_0)
+            self._f_3.flags.writeable = False
+        return self._f_3
+
+    def reference_efficiency(self, Qes):
+        """Reference efficiencies of all systems
+
+        Parameters
+        ----------
+        Qes :
+            Electrical Qs of the drivers
+        """
+        f3 = self.f_3()
+        factor = 4.0 * np.pi ** 2 / (air.C ** 3)
+        v_ratio = self.Cas / self.Cab
+        tuning_ratio = 1.0 / (2.0 * np.pi * self.Ts * f3)
+        k_eta = factor * v_ratio * tuning_ratio ** 3 / Qes
+        Vab = self.Cab * air.RHO * air.C ** 2
+        return k_eta * f3 ** 3 * Vab
+
+    def displacement_limited_output(self, Vd):
+        """Displacement limited output of all systems, in dB
+
+        Parameters
+        ----------
+        Vd :
+            Displacement volumes :math:`V_d = S_d x_{max}` of the drivers
+        """
+        P_ar = 3.0 * self.f_3() ** 4.0 * np.asarray(Vd) ** 2.0
+        return 112.0 + 10.0 * np.log10(P_ar)
+
+    def maximum_spl(self, Sd, xmax, power, Qes, f_min=F_MIN, f_max=F_MAX,
+                    frequencies=None):
+        """Calculate the maximum SPL of all systems at each frequency
+
+        See :meth:`VentedSpeaker.maximum_spl`; the driver parameters not
+        needed for the response itself are passed in here.
+
+        Parameters
+        ----------
+        Sd :
+            Diaphragm areas of the drivers
+        xmax :
+            Linear peak excursions of the drivers
+        power :
+            Power handling of the drivers
+        Qes :
+            Electrical Qs of the drivers
+        f_min :
+            Lower frequency
+        f_max :
+            Upper frequency
+        frequencies :
+            Exact frequencies in Hz
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the SPL was computed, shape (M,)
+        spl, spl_excursion, spl_thermal : ndarray
+            maximum, excursion limited and thermally limited SPL in dB,
+            shape (N, M)
+        """
+        w, S = _batch_grid(f_min, f_max, 100, frequencies)
+        H = response.transfer(self._b, self._a, S)
+        X = response.transfer(self._displacement_coefficients(), self._a, S)
+        with np.errstate(divide="ignore"):
+            efficiency = self.reference_efficiency(Qes)
+        spls = _maximum_spl(H, X, _column(self.Ts), _column(Sd), _column(xmax),
+                            _column(power), _column(efficiency))
+        return (w / (2 * np.pi),) + spls
+
+    def frequency_response(self, f_min=F_MIN, f_max=F_MAX, frequencies=None):
+        """Calculate frequency responses of all systems
+
+        Parameters
+        ----------
+        f_min :
+            Lower frequency
+        f_max :
+            Upper frequency
+        frequencies :
+            Exact frequencies in Hz, instead of 100 logarithmically spaced
+            ones between f_min and f_max
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the responses were computed, shape (M,)
+        amplitude : ndarray
+            the frequency responses in dB, shape (N, M)
+        """
+        w, S = _batch_grid(f_min, f_max, 100, frequencies)
+        h = response.transfer(self._b, self._a, S)
+        freqs = w / (2 * np.pi)
+        amplitude = 20.0 * np.log10(np.abs(h))
+        return (freqs, amplitude)
+
+    def passband_ripple(self, f_min=10.0, f_max=1000.0, num=200):
+        """Peak of each response above its 0 dB passband level, in dB
+
+        Responses without a peak, like the maximally flat alignments, have a
+        ripple of zero.
+
+        Parameters
+        ----------
+        f_min :
+            Lower frequency of the search
+        f_max :
+            Upper frequency of the search
+        num :
+            Number of frequencies to evaluate
+        """
+        _, S, _ = response.log_grid(f_min, f_max, num)
+        h = response.transfer(self._b, self._a, S)
+        peak = 20.0 * np.log10(np.max(np.abs(h), axis=-1))
+        return np.maximum(peak, 0.0)
+
+    def displacement(self, f_min=F_MIN, f_max=F_MAX, frequencies=None):
+        """Calculate normalized cone displacement of all systems
+
+        The frequencies are chosen as for :meth:`frequency_response`, but
+        with 50 points by default.
+
+        Returns
+        -------
+        freqs : ndarray
+            the frequencies at which the displacement was computed, shape (M,)
+        displacement : ndarray
+            the normalized displacement, shape (N, M)
+        """
+        w, S = _batch_grid(f_min, f_max, 50, frequencies)
+        displacement = response.transfer(self._displacement_coefficients(),
+                                          self._a, S)
+        freqs = w / (2 * np.pi)
+        return (freqs, np.abs(np.real(displacement)))
+
+    def _displacement_coefficients(self):
+        """Numerators of the normalized cone displacements, shape (N, 5)"""
+        b2 = np.zeros((len(self), 5))
+        b2[:, 2] = self.Tb ** 2
+        b2[:, 3] = self.Tb / self.Ql
+        b2[:, 4] = 1.0
+        return b2
+
+    def step_response(self, t):
+        """Calculate step responses of all systems on a common time base
+
+        Parameters
+        ----------
+        t :
+            times at which to evaluate the responses, shape (T,)
+
+        Returns
+        -------
+        response : ndarray
+            the step responses, shape (N, T)
+        """
+        return response.step_response(self._b, self._a, t)
+
+    def impulse_response(self, t):
+        """Calculate impulse responses of all systems on a common time base
+
+        See :meth:`VentedSpeaker.impulse_response`.
+        """
+        return response.impulse_response(self._b, self._a, t)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Play arbitrary signals through a simulated speaker, block by block."""
+import numpy as np
+import scipy.io.wavfile as wavfile
+import scipy.signal as signal
+from . import air
+from .speaker import _DISTANCE, _P_REF
+
+
+def _discretize(b, a, sample_rate):
+    """Second-order sections of a continuous system, by bilinear transform"""
+    z, p, k = signal.tf2zpk(np.trim_zeros(b, 'f'), a)
+    return signal.zpk2sos(*signal.bilinear_zpk(z, p, k, sample_rate))
+
+
+class StreamingSimulator(object):
+    """Filter a signal through a vented speaker with constant memory.
+
+    The acoustic and the cone displacement transfer functions are
+    discretized into second-order sections once; blocks of samples are then
+    filtered one after another, with the filter states carried over, so
+    signals of any length can be processed without holding them in memory.
+
+    Samples are scaled such that a full-scale sine (amplitude 1) in the
+    passband corresponds to ``power`` watts of electrical input. The
+    acoustic output is the sound pressure in Pa at 1 m in half space, the
+    excursion is the cone displacement in m.
+
+    Example:
+        >>> simulator = StreamingSimulator(speaker, sample_rate=44100)
+        >>> for block in blocks:
+        >>>     pressure, excursion = simulator.process(block)
+        >>> print(simulator.excursion_ratio)
+    """
+
+    def __init__(self, speaker, sample_rate, power=None):
+        """Prepare the filters of a speaker.
+
+        Args:
+            speaker : the :class:`~altai.lib.speaker.VentedSpeaker`
+            sample_rate : sample rate of the signal, in Hz
+            power : electrical power of a full-scale sine, in W; by default
+                the power handling of the driver
+        """
+        self.speaker = speaker
+        self.sample_rate = sample_rate
+        driver = speaker.driver
+        if power is None:
+            power = driver.power
+        #: Electrical power of a full-scale sine, in W
+        self.power = power
+
+        # pressure amplitude of a full-scale sine in the passband, and the
+        # cone displacement scale that produces it
+        p_rms = np.sqrt(air.RHO * air.C * speaker.reference_efficiency() *
+                        power / (2.0 * np.pi * _DISTANCE ** 2))
+        self._pressure_scale = np.sqrt(2.0) * p_rms
+        acceleration = (2.0 * np.pi * _DISTANCE * self._pressure_scale /
+                        (air.RHO * driver.Sd))
+        self._excursion_scale = acceleration * driver.Ts ** 2
+
+        self._sos_output = _discretize(speaker._b, speaker._a, sample_rate)
+        self._sos_excursion = _discretize(
+            speaker._displacement_coefficients(), speaker._a, sample_rate)
+        self.reset()
+
+    def reset(self):
+        """Clear filter states and statistics, e.g. to start a new signal."""
+        self._zi_output = np.zeros((self._sos_output.shape[0], 2))
+        self._zi_excursion = np.zeros((self._sos_excursion.shape[0], 2))
+        #: Number of samples processed so far
+        self.samples = 0
+        #: Largest cone displacement so far, in m
+        self.peak_excursion = 0.0
+        #: Largest sound pressure so far, in Pa
+        self.peak_pressure = 0.0
+
+    @property
+    def excursion_ratio(self):
+        """Peak excursion so far, relative to the drivers xmax."""
+        return self.peak_excursion / self.speaker.driver.xmax
+
+    @property
+    def peak_spl(self):
+        """Peak sound pressure level so far, in dB."""
+        return 20.0 * np.log10(self.peak_pressure / _P_REF)
+
+    def process(self, block):
+        """Filter the next block of samples.
+
+        Args:
+            block : 1D array of samples, scaled to [-1, 1]
+
+        Returns:
+            pressure : sound pressure in Pa at 1 m
+            excursion : cone displacement in m
+        """
+        block = np.asarray(block, dtype=float)
+        pressure, self._zi_output = signal.sosfilt(
+            self._sos_output, block, zi=self._zi_output)
+        excursion, self._zi_excursion = signal.sosfilt(
+            self._sos_excursion, block, zi=self._zi_excursion)
+        pressure *= self._pressure_scale
+        excursion *= self._excursion_scale
+        if block.size:
+            self.peak_pressure = max(self.peak_pressure,
+                                     np.max(np.abs(pressure)))
+            self.peak_excursion = max(self.peak_excursion,
+                                      np.max(np.abs(excursion)))
+        self.samples += block.size
+        return pressure, excursion
+
+
+def _normalize(samples):
+    """Scale integer or float samples to [-1, 1], averaging channels."""
+    if samples.dtype == np.uint8:
+        samples = (samples.astype(float) - 128.0) / 128.0
+    elif np.issubdtype(samples.dtype, np.integer):
+        samples = samples / float(-np.iinfo(samples.dtype).min)
+    else:
+        samples = samples.astype(float)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return samples
+
+
+def stream_wav(simulator, filename, block_size=65536):
+    """Play a WAV file through a simulator, one block at a time.
+
+    The file is memory-mapped, so memory use does not depend on its length.
+    The simulator is reset first and has to be set up for the sample rate of
+    the file. Multi-channel files are mixed down to mono.
+
+    Args:
+        simulator : a :class:`StreamingSimulator`
+        filename : WAV file to play
+        block_size : number of samples per block
+
+    Yields:
+        (pressure, excursion) of each block, see
+        :meth:`StreamingSimulator.process`
+    """
+    sample_rate, samples = wavfile.read(filename, mmap=True)
+    if sample_rate != simulator.sample_rate:
+        raise ValueError("File has a sample rate of {0} Hz, the simulator "
+                         "{1} Hz".format(sample_rate, simulator.sample_rate))
+    simulator.reset()
+    for start in range(0, samples.shape[0], block_size):
+        yield simulator.process(_normalize(samples[start:start + block_size]))
+
+
+def simulate_wav(speaker, filename, power=None, block_size=65536):
+    """Play a WAV file through a speaker and report the peak values.
+
+    Args:
+        speaker : the :class:`~altai.lib.speaker.VentedSpeaker`
+        filename : WAV file to play
+        power : electrical power of a full-scale sine, in W; by default the
+            power handling of the driver
+        block_size : number of samples per block
+
+    Returns:
+        the :class:`StreamingSimulator` after processing the whole file, with
+        :attr:`~StreamingSimulator.peak_excursion`,
+        :attr:`~StreamingSimulator.excursion_ratio` and
+        :attr:`~StreamingSimulator.peak_spl`
+    """
+    sample_rate, _ = wavfile.read(filename, mmap=True)
+    simulator = StreamingSimulator(speaker, sample_rate, power)
+    for _ in stream_wav(simulator, filename, block_size):
+        pass
+    return simulator
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Monte-Carlo analysis of production tolerances of driver parameters."""
+import numpy as np
+import scipy.special
+from . import air
+from .speaker import VentedSpeaker, VentedSpeakerBatch, F_MIN, F_MAX
+
+#: Driver parameters that can be varied, in the order of correlation matrices
+PARAMETERS = ('fs', 'Qts', 'Vas')
+
+
+def sample_parameters(driver, n, tolerance=0.15, correlation=None,
+                      distribution='uniform', random_state=None):
+    """Draw random driver parameters around the datasheet values.
+
+    Correlated samples are drawn as correlated standard normals (via a
+    Cholesky factor of ``correlation``), which are then mapped to the
+    requested distribution, so the marginals are the same with or without
+    correlations.
+
+    Args:
+        driver : driver with the datasheet values
+        n : number of samples
+        tolerance : relative tolerance, either one value for all parameters
+            or a dict with keys from :data:`PARAMETERS`; missing parameters
+            do not vary
+        correlation : optional 3x3 correlation matrix of fs, Qts and Vas
+        distribution : ``'uniform'`` for values evenly spread within the
+            tolerance, ``'normal'`` for a normal distribution with the
+            tolerance as 3 standard deviations
+        random_state : seed or :class:`numpy.random.Generator`
+
+    Returns:
+        dict mapping the names in :data:`PARAMETERS` to arrays of shape (n,)
+    """
+    if not isinstance(tolerance, dict):
+        tolerance = dict.fromkeys(PARAMETERS, tolerance)
+    unknown = set(tolerance) - set(PARAMETERS)
+    if unknown:
+        raise ValueError("Unknown parameters {0}, choose from {1}".format(
+            sorted(unknown), PARAMETERS))
+    if distribution not in ('uniform', 'normal'):
+        raise ValueError("Unknown distribution " + repr(distribution))
+    rng = np.random.default_rng(random_state)
+
+    z = rng.standard_normal((n, len(PARAMETERS)))
+    if correlation is not None:
+        z = z @ np.linalg.cholesky(np.asarray(correlation, dtype=float)).T
+    if distribution == 'uniform':
+        deviation = 2.0 * scipy.special.ndtr(z) - 1.0
+    else:
+        deviation = z / 3.0
+    samples = {}
+    for i, name in enumerate(PARAMETERS):
+        relative = tolerance.get(name, 0.0)
+        samples[name] = getattr(driver, name) * (1.0 + relative * deviation[:, i])
+    return samples
+
+
+class _Histogram(object):
+    """Histograms of many columns on fixed bins, to estimate percentiles.
+
+    The bins have a fixed width, on a logarithmic scale if ``log`` is set,
+    and are aligned to multiples of it. They are added as needed to cover
+    all values, so no value is clamped; only values that are not finite
+    are counted in the first or last bin.
+    """
+
+    def __init__(self, width, columns=1, log=False):
+        self.width = width
+        self.columns = columns
+        self.log = log
+        # index of the first bin on the grid of multiples of width
+        self.start = 0
+        self.counts = np.zeros((columns, 0), dtype=np.int64)
+
+    @property
+    def edges(self):
+        """Edges of the bins, in the units of the values."""
+        edges = self.width * np.arange(self.start,
+                                       self.start + self.counts.shape[1] + 1)
+        return np.exp(edges) if self.log else edges
+
+    def add(self, values):
+        """Count values of shape (n, columns)."""
+        values = np.asarray(values, dtype=float).reshape(-1, self.columns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scaled = (np.log(values) if self.log else values) / self.width
+        finite = np.isfinite(scaled)
+        indexes = np.floor(np.where(finite, scaled, 0.0)).astype(np.int64)
+        if np.any(finite):
+            self._cover(int(indexes[finite].min()), int(indexes[finite].max()))
+        elif self.counts.shape[1] == 0:
+            self._cover(0, 0)
+        nbins = self.counts.shape[1]
+        bins = np.where(finite, indexes - self.start,
+                        np.where(scaled < 0, 0, nbins - 1))
+        bins += nbins * np.arange(self.columns)
+        counts = np.bincount(bins.ravel(), minlength=self.counts.size)
+        self.counts += counts.reshape(self.counts.shape)
+
+    def _cover(self, low, high):
+        """Add bins so that the bins low to high exist."""
+        if self.counts.shape[1] == 0:
+            self.start = low
+            self.counts = np.zeros((self.columns, high - low + 1), dtype=np.int64)
+            return
+        stop = self.start + self.counts.shape[1]
+        before = max(self.start - low, 0)
+        after = max(high + 1 - stop, 0)
+        if before or after:
+            self.counts = np.pad(self.counts, ((0, 0), (before, after)))
+            self.start -= before
+
+    def percentiles(self, q):
+        """Percentiles of each column, interpolated within the bins.
+
+        Returns:
+            array of shape (len(q), columns)
+        """
+        edges = self.edges
+        cumulative = np.cumsum(self.counts, axis=1)
+        rows = np.arange(self.columns)
+        result = np.empty((len(q), self.columns))
+        for i, p in enumerate(q):
+            target = p / 100.0 * cumulative[:, -1]
+            index = np.minimum(np.sum(cumulative < target[:, np.newaxis], axis=1),
+                               cumulative.shape[1] - 1)
+            below = cumulative[rows, index] - self.counts[rows, index]
+            inside = np.maximum(self.counts[rows, index], 1)
+            fraction = np.clip((target - below) / inside, 0.0, 1.0)
+            result[i] = (edges[index] +
+                         fraction * (edges[index + 1] - edges[index]))
+        return result
+
+
+class ToleranceResult(object):
+    """Summary of a Monte-Carlo tolerance analysis.
+
+    Curves are summarized by percentiles per frequency, scalars by a
+    histogram and its percentiles. Percentiles are accurate to the bin
+    width of the histograms, 0.01 dB for the responses and about 0.1 % for
+    f3 and the displacement.
+    """
+
+    def __init__(self, n, percentiles, freqs, amplitude, displacement_freqs,
+                 displacement, f_3, f_3_histogram, peak_displacement,
+                 peak_displacement_histogram):
+        #: Number of simulated realizations
+        self.n = n
+        #: The percentiles given in the bands, in %
+        self.percentiles = percentiles
+        #: Frequencies of the response bands, in Hz
+        self.freqs = freqs
+        #: Percentiles of the frequency response in dB, shape (P, M)
+        self.amplitude = amplitude
+        #: Frequencies of the displacement bands, in Hz
+        self.displacement_freqs = displacement_freqs
+        #: Percentiles of the normalized displacement, shape (P, M)
+        self.displacement = displacement
+        #: Percentiles of the lower -3 dB frequency, in Hz, shape (P,)
+        self.f_3 = f_3
+        #: Histogram ``(counts, edges)`` of the lower -3 dB frequency
+        self.f_3_histogram = f_3_histogram
+        #: Percentiles of the peak normalized displacement, shape (P,)
+        self.peak_displacement = peak_displacement
+        #: Histogram ``(counts, edges)`` of the peak normalized displacement
+        self.peak_displacement_histogram = peak_displacement_histogram
+
+    def band(self, lower, upper):
+        """Return the frequency response band between two percentiles.
+
+        Args:
+            lower : lower percentile, one of :attr:`percentiles`
+            upper : upper percentile, one of :attr:`percentiles`
+
+        Returns:
+            freqs, lower amplitude, upper amplitude
+        """
+        percentiles = list(self.percentiles)
+        return (self.freqs, self.amplitude[percentiles.index(lower)],
+                self.amplitude[percentiles.index(upper)])
+
+
+def tolerance_analysis(driver, box, n=100000, tolerance=0.15, correlation=None,
+                       distribution='uniform', percentiles=(5, 25, 50, 75, 95),
+                       f_min=F_MIN, f_max=F_MAX, chunk_size=8192,
+                       random_state=None):
+    """Simulate a driver/box combination for many production samples.
+
+    The realizations are drawn by :func:`sample_parameters` and simulated in
+    chunks of ``chunk_size`` with :class:`~altai.lib.speaker.VentedSpeakerBatch`.
+    Each chunk is reduced into fixed-bin histograms right away, so memory
+    use does not grow with ``n``.
+
+    Args:
+        driver : driver with the datasheet values
+        box : the vented box
+        n : number of realizations
+        tolerance : relative tolerances, see :func:`sample_parameters`
+        correlation : correlation matrix, see :func:`sample_parameters`
+        distribution : distribution, see :func:`sample_parameters`
+        percentiles : percentiles to report, in %
+        f_min : lower frequency of the bands
+        f_max : upper frequency of the bands
+        chunk_size : number of realizations simulated at once
+        random_state : seed or :class:`numpy.random.Generator`
+
+    Returns:
+        a :class:`ToleranceResult`
+
+    Example:
+        >>> result = tolerance_analysis(driver, box, tolerance={'fs': 0.15})
+        >>> freqs, low, high = result.band(5, 95)
+    """
+    if n < 1:
+        raise ValueError("At least one realization needed, got n={0}".format(n))
+    rng = np.random.default_rng(random_state)
+    nominal = VentedSpeaker(driver, box)
+    _, nominal_displacement = nominal.displacement(f_min, f_max)
+
+    amplitude = None
+    displacement = None
+    # bins of 0.01 dB for the responses and 0.1 % for the scalars
+    f_3 = _Histogram(1e-3, log=True)
+    peak_displacement = _Histogram(1e-3, log=True)
+    for start in range(0, n, chunk_size):
+        samples = sample_parameters(driver, min(chunk_size, n - start),
+                                    tolerance, correlation, distribution, rng)
+        batch = VentedSpeakerBatch(1.0 / (2.0 * np.pi * samples['fs']),
+                                   samples['Vas'] / (air.RHO * air.C ** 2),
+                                   samples['Qts'], box.Tb, box.Cab, box.Ql)
+        freqs, chunk_amplitude = batch.frequency_response(f_min, f_max)
+        displacement_freqs, chunk_displacement = batch.displacement(f_min, f_max)
+        if amplitude is None:
+            amplitude = _Histogram(0.01, len(freqs))
+            displacement = _Histogram(
+                (2.0 * np.max(nominal_displacement) + 1.0) / 8000,
+                len(displacement_freqs))
+        amplitude.add(chunk_amplitude)
+        displacement.add(chunk_displacement)
+        f_3.add(batch.f_3())
+        peak_displacement.add(np.max(chunk_displacement, axis=1))
+
+    return ToleranceResult(
+        n, tuple(percentiles), freqs, amplitude.percentiles(percentiles),
+        displacement_freqs, displacement.percentiles(percentiles),
+        f_3.percentiles(percentiles)[:, 0], (f_3.counts[0], f_3.edges),
+        peak_displacement.percentiles(percentiles)[:, 0],
+        (peak_displacement.counts[0], peak_displacement.edges))
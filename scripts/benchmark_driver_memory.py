@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import timeit
+import tracemalloc
+from altai.lib.driver import Driver
+
+N = 100000
+
+
+# the previous layout: the same class, with every attribute in a
+# per-instance __dict__
+UnslottedDriver = type('UnslottedDriver', (object,), {
+    name: value for name, value in vars(Driver).items()
+    if name not in Driver.__slots__ + ('__slots__',)})
+
+
+def make_drivers(cls, n):
+    return [cls.from_dict({'manufacturer': "Acme", 'model': "W{0}".format(i),
+                           'diameter': 12.0, 'weight': 4.2, 'power': 400.0,
+                           'Qts': 0.38, 'Qes': 0.41, 'Sd': 0.0531,
+                           'xmax': 0.0065, 'fs': 30.0 + i % 50, 'Vas': 0.14})
+            for i in range(n)]
+
+
+def footprint(cls, n):
+    """Bytes allocated per driver, without the shared strings"""
+    tracemalloc.start()
+    drivers = make_drivers(cls, n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del drivers
+    return size / n
+
+
+def access_time(cls, n):
+    drivers = make_drivers(cls, n)
+    return min(timeit.repeat(
+        lambda: [(d.Ts, d.Cas, d.Qts, d.Qes, d.xmax * d.Sd) for d in drivers],
+        number=1, repeat=5)) / n
+
+
+print("{0:>10} {1:>16} {2:>16}".format("layout", "bytes/driver", "access [ns]"))
+for name, cls in [("__dict__", UnslottedDriver), ("__slots__", Driver)]:
+    print("{0:>10} {1:16.0f} {2:16.1f}".format(
+        name, footprint(cls, N), 1e9 * access_time(cls, N)))
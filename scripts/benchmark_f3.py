@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import timeit
+import numpy as np
+from altai.lib import speaker
+
+# the per-speaker loop is extrapolated beyond this many quartics
+MAX_LOOP = 10000
+
+
+def random_coefficients(n, seed=0):
+    rng = np.random.default_rng(seed)
+    fs = rng.uniform(15.0, 80.0, n)
+    Vas = rng.uniform(0.01, 0.4, n)
+    Qts = rng.uniform(0.15, 0.9, n)
+    fb = rng.uniform(20.0, 80.0, n)
+    Vab = rng.uniform(0.01, 0.4, n)
+    Ql = rng.uniform(3.0, 100.0, n)
+    K = 1.293 * 331.5 ** 2
+    T_0, a, _ = speaker.vented_coefficients(
+        1 / (2 * np.pi * fs), Vas / K, Qts, 1 / (2 * np.pi * fb), Vab / K, Ql)
+    return speaker._f3_coefficients(a, T_0)
+
+
+def poly1d_loop(A1, A2, A3):
+    """The previous approach: one np.poly1d per speaker"""
+    result = np.empty(A1.shape)
+    for i in range(A1.shape[0]):
+        d_poly = np.poly1d([1.0, -A1[i], -A2[i], -A3[i], -1.0])
+        result[i] = np.sqrt(np.abs(d_poly.r[2]))
+    return result
+
+
+print("{0:>9} {1:>14} {2:>14} {3:>8}".format(
+    "N", "poly1d [s]", "solve_f_3 [s]", "speedup"))
+for n in [1, 1000, 1000000]:
+    A1, A2, A3 = random_coefficients(n)
+    m = min(n, MAX_LOOP)
+    repeat = max(1, 1000 // n)
+    t_loop = timeit.timeit(lambda: poly1d_loop(A1[:m], A2[:m], A3[:m]),
+                           number=repeat) / repeat * n / m
+    # a single system is passed as scalars, as VentedSpeaker.f_3 does
+    args = (A1[0], A2[0], A3[0]) if n == 1 else (A1, A2, A3)
+    t_vec = timeit.timeit(lambda: speaker.solve_f_3(*args),
+                          number=repeat) / repeat
+    note = " (loop extrapolated)" if m < n else ""
+    print("{0:9d} {1:14.3g} {2:14.3g} {3:8.1f}{4}".format(
+        n, t_loop, t_vec, t_loop / t_vec, note))
@@ -1,10 +1,29 @@
 """Unit tests for Altai."""
 import unittest
+import concurrent.futures
+import copy
 import filecmp
 import os
+import pickle
+import tempfile
+
+import numpy as np
 
 import context
-from altai.lib import driver_database, vented_box, speaker
+from altai.lib import driver_database, vented_box, speaker, simulation_cache
+from altai.lib import alignment, ranking, streaming, tolerance, air
+from altai.lib import sensitivity, driver_journal, driver_import, driver_sqlite
+
+def _add_drivers(fname, writer):
+    """Add drivers to a shared database from another process."""
+    driver_db = driver_database.DriverDB.from_file(fname)
+    journal = driver_journal.DriverJournal(driver_db, fname)
+    for i in range(20):
+        journal.add(driver_database.Driver.from_dict(
+            dict(driver_db[0].dict_representation(),
+                 manufacturer="Writer {0}".format(writer), model=str(i))))
+        if i % 7 == 6:
+            journal.compact()
 
 class DriverDataBaseTest(unittest.TestCase):
     """Testing the driver database."""
@@ -16,6 +35,359 @@ class DriverDataBaseTest(unittest.TestCase):
         self.assertTrue(filecmp.cmp(context.database_file, 'test.json'))
         os.remove('test.json')
 
+    def test_driver_round_trip(self):
+        """Slotted drivers copy, pickle and round-trip through dicts exactly."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        for driver in driver_db:
+            self.assertFalse(hasattr(driver, '__dict__'))
+            entry = driver.dict_representation()
+            self.assertEqual(driver_database.Driver.from_dict(entry)
+                             .dict_representation(), entry)
+            for other in (copy.deepcopy(driver), pickle.loads(pickle.dumps(driver))):
+                self.assertEqual(other.dict_representation(), entry)
+                self.assertEqual((other.Ts, other.ws, other.Cas),
+                                 (driver.Ts, driver.ws, driver.Cas))
+
+    def test_indexes(self):
+        """Lookups stay consistent when drivers are added and removed."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        for driver in driver_db:
+            self.assertIs(driver_db.get(driver.manufacturer, driver.model), driver)
+        self.assertEqual(driver_db.sorted_manufacturers,
+                         sorted({driver.manufacturer for driver in driver_db}))
+
+        new = driver_database.Driver("Acme", "W12")
+        driver_db.append(new)
+        self.assertIn("Acme", driver_db.manufacturers)
+        self.assertEqual(driver_db.drivers_of("Acme"), [new])
+        duplicate = driver_database.Driver("Acme", "W12")
+        driver_db.insert(0, duplicate)
+        self.assertIs(driver_db.get("Acme", "W12"), new)
+        driver_db.remove(new)
+        self.assertIs(driver_db.get("Acme", "W12"), duplicate)
+        del driver_db[0]
+        self.assertIsNone(driver_db.get("Acme", "W12"))
+        self.assertNotIn("Acme", driver_db.sorted_manufacturers)
+
+        first = driver_db[0]
+        driver_db[0] = new
+        self.assertIs(driver_db.get("Acme", "W12"), new)
+        self.assertNotIn(first, driver_db.drivers_of(first.manufacturer))
+        driver_db.pop(0)
+        driver_db.clear()
+        self.assertEqual(len(driver_db.manufacturers), 0)
+
+    def test_columns(self):
+        """Columns follow appends, selections are views on the database."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        columns = driver_db.columns
+        for name in ('fs', 'Vas', 'Cas', 'Ts', 'Vd'):
+            np.testing.assert_array_equal(
+                columns[name], [getattr(driver, name) for driver in driver_db])
+        new = driver_database.Driver("Acme", "W12")
+        new.fs = 20.0
+        for _ in range(40):
+            driver_db.append(new)
+        self.assertIs(driver_db.columns, columns)
+        self.assertEqual(len(columns), len(driver_db))
+        self.assertEqual(columns.fs[-1], 20.0)
+
+        selection = driver_db.select(columns.fs < 25.0)
+        self.assertEqual(len(selection), 40)
+        self.assertIs(selection[0], new)
+        self.assertEqual(len(selection.select(selection.Qts > 0)), 0)
+        del driver_db[-40:]
+        np.testing.assert_array_equal(
+            driver_db.columns.fs, [driver.fs for driver in driver_db])
+
+    def test_sort_codes(self):
+        """Codes of names sort like the names, also after appending."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        columns = driver_db.columns
+        columns.sort_codes('model')
+        for model in ("0", "Zzz", driver_db[0].model):
+            driver_db.append(driver_database.Driver("Acme", model))
+        for name in ('manufacturer', 'model'):
+            names = [getattr(driver, name) for driver in driver_db]
+            codes = columns.sort_codes(name)
+            self.assertEqual(np.argsort(codes, kind='stable').tolist(),
+                             sorted(range(len(names)), key=names.__getitem__))
+            self.assertEqual(len(set(codes.tolist())), len(set(names)))
+
+    def test_query(self):
+        """Range queries agree with a plain scan, also after appending."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        rng = np.random.default_rng(0)
+        for i in range(3000):
+            driver = driver_database.Driver("Acme", "W{0}".format(i))
+            driver.fs = float(rng.uniform(15.0, 80.0))
+            driver.Vas = float(rng.uniform(0.01, 0.4))
+            driver.Qts = float(rng.uniform(0.2, 0.8))
+            driver.diameter = int(rng.choice([10, 12, 15]))
+            driver_db.append(driver)
+            if i == 2000:
+                driver_db.query(fs=(None, 40.0))
+
+        def scan():
+            return [i for i, driver in enumerate(driver_db)
+                    if driver.diameter == 15 and 0.3 <= driver.Qts <= 0.45
+                    and driver.fs <= 40.0 and driver.Vas <= 0.2]
+        result = driver_db.query(diameter=15, Qts=(0.3, 0.45), fs=(None, 40.0),
+                                 Vas=(None, 0.2))
+        self.assertEqual(result.indexes.tolist(), scan())
+        self.assertTrue(all(driver.diameter == 15 for driver in result))
+        self.assertEqual(len(driver_db.query()), len(driver_db))
+        with self.assertRaises(KeyError):
+            driver_db.query(price=(None, 100))
+
+    def test_binary_cache(self):
+        """A database loads lazily from its cache, until the file changes."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname, cache=True)
+            cached = driver_database.DriverDB.from_file(fname, cache=True)
+            self.assertIsNotNone(cached._records)
+            self.assertEqual(cached.sorted_manufacturers,
+                             driver_db.sorted_manufacturers)
+            first = driver_db[0]
+            self.assertEqual(cached.get(first.manufacturer, first.model).model,
+                             first.model)
+            np.testing.assert_array_equal(cached.columns.Ts, driver_db.columns.Ts)
+            for name in ('manufacturer', 'model'):
+                np.testing.assert_array_equal(cached.columns.sort_codes(name),
+                                              driver_db.columns.sort_codes(name))
+            self.assertIsNotNone(cached._records)
+            self.assertEqual([driver.dict_representation() for driver in cached],
+                             [driver.dict_representation() for driver in driver_db])
+
+            driver_db.pop()
+            with open(fname, 'a') as f:
+                f.write(' ')
+            os.utime(fname, (0, 0))
+            stale = driver_database.DriverDB.from_file(fname, cache=True)
+            self.assertIsNone(stale._records)
+            driver_db.write_to_disk(fname, cache=True)
+            cached = driver_database.DriverDB.from_file(fname, cache=True)
+            self.assertEqual(len(cached), len(driver_db))
+            cached.append(driver_database.Driver("Acme", "W12"))
+            self.assertIsNone(cached._records)
+            self.assertEqual(cached.drivers_of("Acme")[0].model, "W12")
+
+            # not representable in the cache, but still written as JSON
+            driver_db.append(driver_database.Driver.from_dict(
+                dict(first.dict_representation(), model=None)))
+            driver_db.write_to_disk(fname, cache=True)
+            reloaded = driver_database.DriverDB.from_file(fname, cache=True)
+            self.assertIsNone(reloaded._records)
+            self.assertEqual(reloaded[-1].model, None)
+
+    def test_journal(self):
+        """Changes survive in the journal and are compacted exactly once."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname)
+            journal = driver_journal.DriverJournal(driver_db, fname)
+            new = driver_database.Driver.from_dict(
+                dict(driver_db[0].dict_representation(), model="W12"))
+            journal.add(new)
+            journal.edit(new, fs=30.0)
+            journal.delete(driver_db[1])
+            expected = [driver.dict_representation() for driver in driver_db]
+            # a crash in the middle of a line
+            with open(journal.journal_fname, 'ab') as f:
+                f.write(b'{"op": "add"')
+
+            reloaded = driver_database.DriverDB.from_file(fname)
+            self.assertEqual(driver_journal.DriverJournal(reloaded, fname).entries, 3)
+            self.assertEqual([driver.dict_representation() for driver in reloaded],
+                             expected)
+
+            journal.compact()
+            self.assertFalse(os.path.exists(journal.journal_fname))
+            reloaded = driver_database.DriverDB.from_file(fname)
+            self.assertEqual(driver_journal.DriverJournal(reloaded, fname).entries, 0)
+            self.assertEqual([driver.dict_representation() for driver in reloaded],
+                             expected)
+
+            # the header reuses the hash taken while writing the database,
+            # which still identifies it after it was only touched
+            self.assertEqual(driver_db.file_hash, driver_journal._file_hash(fname))
+            journal.delete(new)
+            stat = os.stat(fname)
+            os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            reloaded = driver_database.DriverDB.from_file(fname)
+            self.assertEqual(driver_journal.DriverJournal(reloaded, fname).entries, 1)
+            self.assertIsNone(reloaded.get(new.manufacturer, new.model))
+
+    def test_shared_journal(self):
+        """Processes sharing a database see and keep each other's changes."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname)
+            first = driver_journal.DriverJournal(
+                driver_database.DriverDB.from_file(fname), fname)
+            second = driver_journal.DriverJournal(
+                driver_database.DriverDB.from_file(fname), fname)
+            first.add(driver_database.Driver.from_dict(
+                dict(driver_db[0].dict_representation(), model="W12")))
+            self.assertTrue(second.changed())
+            self.assertTrue(second.refresh())
+            self.assertFalse(second.changed())
+            self.assertIsNotNone(second.driver_db.get(driver_db[0].manufacturer, "W12"))
+            # compacting picks up the changes of the other journal first
+            second.edit(driver_db[1], fs=30.0)
+            first.compact()
+            self.assertTrue(second.refresh())
+            self.assertEqual(second.driver_db.get(driver_db[1].manufacturer,
+                                                  driver_db[1].model).fs, 30.0)
+
+            with concurrent.futures.ProcessPoolExecutor(4) as executor:
+                list(executor.map(_add_drivers, [fname] * 4, range(4)))
+            reloaded = driver_database.DriverDB.from_file(fname)
+            driver_journal.DriverJournal(reloaded, fname)
+            for writer in range(4):
+                self.assertEqual(len(reloaded.drivers_of("Writer {0}".format(writer))), 20)
+            if os.name != 'nt':
+                self.assertFalse(os.path.exists(fname + '.lock'))
+
+    def test_import(self):
+        """Catalogs are converted to SI units; bad rows are only reported."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        existing = driver_db[0]
+        rows = ["Manufacturer,Model,fs,Qts,Qes,Vas,Sd,xmax",
+                "Acme,W12,30,0.4,0.45,80,500,6.5",
+                "Acme,W15,25,,0.5,120,850,8",
+                "Acme,W18,twenty,0.3,0.35,200,1200,10",
+                "{0},{1},30,0.4,0.45,80,500,6.5".format(existing.manufacturer,
+                                                        existing.model),
+                "Acme,W12,31,0.4,0.45,80,500,6.5"]
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'catalog.csv')
+            with open(fname, 'w') as f:
+                f.write("\n".join(rows) + "\n")
+            n = len(driver_db)
+            report = driver_import.import_drivers(driver_db, fname)
+        self.assertEqual([driver.model for driver in report.added], ["W12"])
+        self.assertEqual([error.row for error in report.errors], [3, 4])
+        self.assertEqual([row for row, _ in report.duplicates], [5, 6])
+        self.assertEqual(len(driver_db), n + 1)
+        new = driver_db.get("Acme", "W12")
+        self.assertAlmostEqual(new.xmax, 6.5e-3)
+        self.assertAlmostEqual(new.Sd, 500e-4)
+        self.assertAlmostEqual(new.Vas, 80e-3)
+        self.assertEqual(new.power, 0.0)
+
+    def test_import_through_journal(self):
+        """Drivers added by another process meanwhile are not imported again."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname)
+            journal = driver_journal.DriverJournal(
+                driver_database.DriverDB.from_file(fname), fname)
+            other = driver_journal.DriverJournal(
+                driver_database.DriverDB.from_file(fname), fname)
+            other.add(driver_database.Driver.from_dict(
+                dict(driver_db[0].dict_representation(),
+                     manufacturer="Acme", model="W15")))
+            catalog = os.path.join(directory, 'catalog.csv')
+            with open(catalog, 'w') as f:
+                f.write("Manufacturer,Model,fs,Qts,Vas\n"
+                        "Acme,W12,30,0.4,80\n"
+                        "Acme,W15,25,0.5,120\n")
+            report = driver_import.import_drivers(journal.driver_db, catalog,
+                                                  journal=journal)
+            self.assertEqual([driver.model for driver in report.added], ["W12"])
+            self.assertEqual(report.duplicates, [(3, ("Acme", "W15"))])
+            self.assertEqual(len(journal.driver_db.drivers_of("Acme")), 2)
+
+    def test_sqlite(self):
+        """The SQLite backend migrates a JSON database and round-trips it."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname)
+            sqlite_db = driver_sqlite.SQLiteDriverDB.from_file(fname)
+            self.assertEqual(sqlite_db.filename,
+                             driver_sqlite.database_filename(fname))
+            self.assertEqual([driver.dict_representation() for driver in sqlite_db],
+                             [driver.dict_representation() for driver in driver_db])
+            self.assertEqual(sqlite_db.sorted_manufacturers,
+                             driver_db.sorted_manufacturers)
+            driver = driver_db[-1]
+            self.assertEqual(sqlite_db[-1].dict_representation(),
+                             driver.dict_representation())
+            self.assertEqual(
+                sqlite_db.get(driver.manufacturer, driver.model).dict_representation(),
+                driver.dict_representation())
+            self.assertEqual(
+                [d.model for d in sqlite_db.drivers_of(driver.manufacturer)],
+                [d.model for d in driver_db.drivers_of(driver.manufacturer)])
+            self.assertEqual(
+                [d.model for d in sqlite_db.query(fs=(None, 40.0), Qts=(0.3, 0.5))],
+                [d.model for d in driver_db.query(fs=(None, 40.0), Qts=(0.3, 0.5))])
+            # rows are read as the results are consumed
+            woofers = sqlite_db.query(fs=(None, 40.0))
+            self.assertIs(iter(woofers), woofers)
+            np.testing.assert_array_equal(sqlite_db.columns.Ts, driver_db.columns.Ts)
+            np.testing.assert_array_equal(sqlite_db.columns.sort_codes('model'),
+                                          driver_db.columns.sort_codes('model'))
+
+            new = copy.deepcopy(driver)
+            new.manufacturer = "Acme"
+            sqlite_db.append(new)
+            sqlite_db.update(new, fs=30.0)
+            sqlite_db.close()
+            # the migrated file is used from now on
+            sqlite_db = driver_sqlite.SQLiteDriverDB.from_file(fname)
+            self.assertEqual(len(sqlite_db), len(driver_db) + 1)
+            self.assertEqual(sqlite_db.get("Acme", driver.model).fs, 30.0)
+            sqlite_db.remove(new)
+            self.assertNotIn("Acme", sqlite_db.manufacturers)
+            self.assertEqual(sqlite_db[-1].model, driver.model)
+            sqlite_db.close()
+
+    def test_sqlite_follows_json(self):
+        """The SQLite file is migrated again when the JSON database changes."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'drivers.json')
+            driver_db.write_to_disk(fname)
+            journal = driver_journal.DriverJournal(
+                driver_database.DriverDB.from_file(fname), fname)
+            journal.add(driver_database.Driver.from_dict(
+                dict(driver_db[0].dict_representation(), manufacturer="Acme")))
+            # pending journal entries are migrated as well
+            sqlite_db = driver_sqlite.SQLiteDriverDB.from_file(fname)
+            self.assertEqual(len(sqlite_db), len(driver_db) + 1)
+            self.assertEqual(sqlite_db[-1].manufacturer, "Acme")
+            self.assertEqual([d.model for d in sqlite_db[2:9:3]],
+                             [d.model for d in driver_db[2:9:3]])
+            self.assertEqual([d.model for d in sqlite_db[-3:-1]],
+                             [d.model for d in driver_db[-2:]])
+            sqlite_db.close()
+
+            journal.delete(journal.driver_db.get("Acme", driver_db[0].model))
+            journal.compact()
+            sqlite_db = driver_sqlite.SQLiteDriverDB.from_file(fname)
+            self.assertEqual(len(sqlite_db), len(driver_db))
+            self.assertNotIn("Acme", sqlite_db.manufacturers)
+
+            # touching the JSON file is no change
+            sqlite_db.append(driver_database.Driver("Acme", "W12"))
+            sqlite_db.close()
+            os.utime(fname, (0, 0))
+            sqlite_db = driver_sqlite.SQLiteDriverDB.from_file(fname)
+            self.assertEqual(len(sqlite_db), len(driver_db) + 1)
+            sqlite_db.close()
+            # but changes to both sides are not merged
+            journal.add(driver_database.Driver("Acme", "W15"))
+            with self.assertRaises(ValueError):
+                driver_sqlite.SQLiteDriverDB.from_file(fname)
+
 class SpeakerComputationTests(unittest.TestCase):
 
     def test_cutoff_calculation(self):
@@ -25,5 +397,448 @@ class SpeakerComputationTests(unittest.TestCase):
         ls = speaker.VentedSpeaker(driver, box)
         self.assertAlmostEqual(ls.f_3(), 39.28176248051)
 
+    def test_cutoff_is_minus_three_db(self):
+        """The response is exactly -3 dB at f_3, for every driver."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=43.0, Ql=20.0)
+        for driver in driver_db:
+            ls = speaker.VentedSpeaker(driver, box)
+            w = 2 * np.pi * ls.f_3()
+            _, h = ls._system.freqresp(w=[w])
+            self.assertAlmostEqual(20 * np.log10(np.abs(h[0])), -3.0103, 4)
+
+    def test_cutoff_ignores_passband_sag(self):
+        """A passband sagging just below -3 dB does not move f_3 up."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        ls = speaker.VentedSpeaker(driver_db[0], box)
+        freqs, amplitude = ls.frequency_response(10.0, 300.0)
+        self.assertLess(amplitude[freqs > 60.0].min(), -3.0103)
+        first_crossing = freqs[np.argmax(amplitude > -3.0103)]
+        self.assertLess(ls.f_3(), first_crossing)
+        self.assertGreater(ls.f_3(), 0.9 * first_crossing)
+
+    def test_solve_f_3_shapes(self):
+        """solve_f_3 keeps the shape of its inputs."""
+        A1 = np.array([[1.0, 2.0, 3.0], [0.5, -1.0, 4.0]])
+        f3 = speaker.solve_f_3(A1, 2.0, 1.0, f_0=50.0)
+        self.assertEqual(f3.shape, (2, 3))
+        for i, j in np.ndindex(f3.shape):
+            d = (f3[i, j] / 50.0) ** 2
+            residual = d ** 4 - A1[i, j] * d ** 3 - 2.0 * d ** 2 - d - 1.0
+            self.assertAlmostEqual(residual, 0.0, 9)
+            # a single system takes another path, with the same result
+            self.assertAlmostEqual(
+                speaker.solve_f_3(A1[i, j], 2.0, 1.0, f_0=50.0), f3[i, j], 9)
+        self.assertEqual(np.shape(speaker.solve_f_3(1.0, 2.0, 3.0)), ())
+
+    def test_cache_follows_box_and_driver(self):
+        """Cached quantities are recomputed when driver or box change."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=43.0, Ql=20.0)
+        ls = speaker.VentedSpeaker(driver_db[0], box)
+        self.assertIs(ls.frequency_response()[1], ls.frequency_response()[1])
+        f3 = ls.f_3()
+        box.fb = 35.0
+        self.assertNotAlmostEqual(ls.f_3(), f3)
+        self.assertAlmostEqual(
+            ls.f_3(), speaker.VentedSpeaker(driver_db[0], box).f_3())
+        ls.driver = driver_db[1]
+        self.assertAlmostEqual(
+            ls.f_3(), speaker.VentedSpeaker(driver_db[1], box).f_3())
+        with self.assertRaises(ValueError):
+            ls.frequency_response()[1][0] = 0.0
+
+    def test_direct_backend_matches_scipy(self):
+        """Direct evaluation agrees with the scipy.signal reference path."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=43.0, Ql=20.0)
+        for driver in driver_db:
+            direct = speaker.VentedSpeaker(driver, box)
+            reference = speaker.VentedSpeaker(driver, box)
+            reference.backend = "scipy"
+            for method in ("frequency_response", "displacement"):
+                freqs, values = getattr(direct, method)()
+                ref_freqs, ref_values = getattr(reference, method)()
+                np.testing.assert_allclose(freqs, ref_freqs)
+                np.testing.assert_allclose(values, ref_values,
+                                           rtol=1e-9, atol=1e-9)
+
+    def test_group_delay(self):
+        """Group delay is the negative derivative of the phase."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=43.0, Ql=20.0)
+        ls = speaker.VentedSpeaker(driver_db[0], box)
+        freqs, _, phase, group_delay = ls.full_frequency_response()
+        w = 2 * np.pi * freqs
+        numerical = -np.gradient(phase, w)
+        np.testing.assert_allclose(group_delay[1:-1], numerical[1:-1],
+                                   rtol=2e-2)
+
+    def test_adaptive_frequency_grid(self):
+        """The adaptive grid is accurate with fewer points."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        ls = speaker.VentedSpeaker(driver_db[0], box)
+        freqs, amplitude = ls.frequency_response(adaptive=True, tol=0.1)
+        self.assertLess(len(freqs), 100)
+        self.assertAlmostEqual(freqs[0], speaker.F_MIN)
+        self.assertAlmostEqual(freqs[-1], speaker.F_MAX)
+        fine = np.geomspace(speaker.F_MIN, speaker.F_MAX, 2000)
+        _, exact = ls.frequency_response(frequencies=fine)
+        interpolated = np.interp(np.log(fine), np.log(freqs), amplitude)
+        self.assertLess(np.abs(interpolated - exact).max(), 0.1)
+
+        freqs, _ = ls.displacement(adaptive=True)
+        self.assertTrue(np.any(np.isclose(freqs, box.fb)))
+
+    def test_fixed_frequency_grid(self):
+        """Responses on a given grid can be stacked with batch results."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        frequencies = np.array([25.0, 40.0, 63.0, 100.0])
+        batch = speaker.VentedSpeakerBatch.from_speakers(driver_db, [box] * 3)
+        freqs, amplitude = batch.frequency_response(frequencies=frequencies)
+        _, displacement = batch.displacement(frequencies=frequencies)
+        np.testing.assert_allclose(freqs, frequencies)
+        for i, driver in enumerate(driver_db):
+            ls = speaker.VentedSpeaker(driver, box)
+            np.testing.assert_allclose(
+                ls.frequency_response(frequencies=frequencies)[1], amplitude[i])
+            np.testing.assert_allclose(
+                ls.displacement(frequencies=frequencies)[1], displacement[i])
+
+    def test_analytic_step_response(self):
+        """Analytic step and impulse responses agree with scipy."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=43.0, Ql=20.0)
+        for driver in driver_db:
+            direct = speaker.VentedSpeaker(driver, box)
+            reference = speaker.VentedSpeaker(driver, box)
+            reference.backend = "scipy"
+            for method in ("step_response", "impulse_response"):
+                t, values = getattr(direct, method)()
+                ref_t, ref_values = getattr(reference, method)()
+                np.testing.assert_allclose(t, ref_t)
+                np.testing.assert_allclose(values, ref_values, atol=1e-9 *
+                                           np.abs(ref_values).max())
+            t = np.linspace(0.0, 0.1, 50)
+            np.testing.assert_allclose(direct.step_response(t)[1],
+                                       reference.step_response(t)[1],
+                                       atol=1e-9)
+
+    def test_maximum_spl(self):
+        """Maximum SPL is the envelope of excursion and thermal limits."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        driver = driver_db[0]
+        ls = speaker.VentedSpeaker(driver, box)
+        freqs, spl, spl_excursion, spl_thermal = ls.maximum_spl(
+            frequencies=[30.0, 40.0, 1e4])
+        np.testing.assert_allclose(spl, np.minimum(spl_excursion, spl_thermal))
+        # far in the passband, the excursion limit is rho Vd w^2 / (2 pi)
+        w = 2 * np.pi * freqs[-1]
+        p = 1.293 * driver.Vd * w ** 2 / (2 * np.pi) / np.sqrt(2)
+        self.assertAlmostEqual(spl_excursion[-1], 20 * np.log10(p / 20e-6), 2)
+        # the cone barely moves at the tuning frequency
+        self.assertGreater(spl_excursion[1], spl_excursion[0] + 20)
+
+        batch = speaker.VentedSpeakerBatch.from_speakers(driver_db, [box] * 3)
+        _, batch_spl, _, _ = batch.maximum_spl(
+            [d.Sd for d in driver_db], [d.xmax for d in driver_db],
+            [d.power for d in driver_db], [d.Qes for d in driver_db])
+        for i, driver in enumerate(driver_db):
+            np.testing.assert_allclose(
+                batch_spl[i], speaker.VentedSpeaker(driver, box).maximum_spl()[1])
+
+class VentedSpeakerBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.driver_db = driver_database.DriverDB.from_file(context.database_file)
+        self.boxes = [vented_box.VentedBox(Vab=Vab, fb=fb, Ql=Ql)
+                      for Vab, fb, Ql in [(0.09, 43.0, 20.0), (0.05, 35.0, 7.0),
+                                          (0.2, 30.0, 15.0)]]
+        self.pairs = [(driver, box) for driver in self.driver_db
+                      for box in self.boxes]
+        self.batch = speaker.VentedSpeakerBatch.from_speakers(
+            [driver for driver, _ in self.pairs],
+            [box for _, box in self.pairs])
+
+    def test_matches_scalar_speaker(self):
+        """Batched results agree with one VentedSpeaker per combination."""
+        f3 = self.batch.f_3()
+        freqs, amplitude = self.batch.frequency_response()
+        _, displacement = self.batch.displacement()
+        t = np.linspace(0.0, 0.1, 100)
+        step = self.batch.step_response(t)
+        for i, (driver, box) in enumerate(self.pairs):
+            ls = speaker.VentedSpeaker(driver, box)
+            self.assertAlmostEqual(f3[i], ls.f_3())
+            scalar_freqs, scalar_amplitude = ls.frequency_response()
+            np.testing.assert_allclose(freqs, scalar_freqs)
+            np.testing.assert_allclose(amplitude[i], scalar_amplitude,
+                                       atol=1e-9)
+            _, scalar_displacement = ls.displacement()
+            np.testing.assert_allclose(displacement[i], scalar_displacement,
+                                       rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(step[i], ls.step_response(t)[1],
+                                       atol=1e-12)
+
+    def test_broadcasting(self):
+        """A single driver can be combined with an array of boxes."""
+        driver = self.driver_db[0]
+        Vab = np.linspace(0.05, 0.2, 7)
+        box = vented_box.VentedBox(Vab=Vab, fb=40.0, Ql=20.0)
+        batch = speaker.VentedSpeakerBatch(driver.Ts, driver.Cas, driver.Qts,
+                                           box.Tb, box.Cab, box.Ql)
+        self.assertEqual(len(batch), 7)
+        self.assertEqual(batch.frequency_response()[1].shape, (7, 100))
+
+class SimulationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.driver_db = driver_database.DriverDB.from_file(context.database_file)
+
+    def test_hits_and_eviction(self):
+        """Equal parameters hit the cache, old entries get evicted."""
+        cache = simulation_cache.SimulationCache(max_entries=2)
+        driver = self.driver_db[0]
+        results = cache.simulate(driver, vented_box.VentedBox(0.09, 40.0, 20.0))
+        same = cache.simulate(driver, vented_box.VentedBox(0.09, 40.0, 20.0))
+        self.assertIs(results, same)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        ls = speaker.VentedSpeaker(driver, vented_box.VentedBox(0.09, 40.0, 20.0))
+        self.assertAlmostEqual(results['f_3'], ls.f_3())
+        np.testing.assert_allclose(results['amplitude'],
+                                   ls.frequency_response()[1])
+
+        cache.simulate(driver, vented_box.VentedBox(0.05, 40.0, 20.0))
+        cache.simulate(driver, vented_box.VentedBox(0.07, 40.0, 20.0))
+        self.assertEqual(len(cache), 2)
+        cache.simulate(driver, vented_box.VentedBox(0.09, 40.0, 20.0))
+        self.assertEqual(cache.misses, 4)
+
+    def test_disk_tier(self):
+        """Results survive in the on-disk tier across cache instances."""
+        driver = self.driver_db[1]
+        box = vented_box.VentedBox(0.09, 40.0, 20.0)
+        with tempfile.TemporaryDirectory() as directory:
+            first = simulation_cache.SimulationCache(directory=directory)
+            results = first.simulate(driver, box)
+            second = simulation_cache.SimulationCache(directory=directory)
+            loaded = second.simulate(driver, box)
+            self.assertEqual((second.disk_hits, second.misses), (1, 0))
+            self.assertAlmostEqual(loaded['f_3'], results['f_3'])
+            np.testing.assert_array_equal(loaded['step_response'],
+                                          results['step_response'])
+
+    def test_disk_tier_pruning(self):
+        """The least recently used files are deleted from the on-disk tier."""
+        driver = self.driver_db[1]
+        boxes = [vented_box.VentedBox(Vab, 40.0, 20.0) for Vab in (0.05, 0.07, 0.09)]
+        with tempfile.TemporaryDirectory() as directory:
+            first = simulation_cache.SimulationCache(directory=directory,
+                                                     max_disk_entries=2)
+            paths = []
+            for age, box in zip((1000, 2000), boxes):
+                first.simulate(driver, box)
+                paths.append(first._path(first.key(driver, box)))
+                os.utime(paths[-1], ns=(age * 10**9, age * 10**9))
+            # loading the older file makes the other one least recently used
+            second = simulation_cache.SimulationCache(directory=directory,
+                                                      max_disk_entries=2)
+            second.simulate(driver, boxes[0])
+            second.simulate(driver, boxes[2])
+            self.assertEqual(second.disk_hits, 1)
+            self.assertTrue(os.path.exists(paths[0]))
+            self.assertFalse(os.path.exists(paths[1]))
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_disk_tier_damage(self):
+        """Corrupt files are recomputed, files left by crashes removed."""
+        driver = self.driver_db[1]
+        box = vented_box.VentedBox(0.09, 40.0, 20.0)
+        with tempfile.TemporaryDirectory() as directory:
+            first = simulation_cache.SimulationCache(directory=directory)
+            results = first.simulate(driver, box)
+            path = first._path(first.key(driver, box))
+            size = os.path.getsize(path)
+            first._write(first.key(driver, box), results)
+            self.assertEqual((first._disk_entries, first._disk_bytes), (1, size))
+            with open(path, 'r+b') as f:
+                f.truncate(size // 2)
+            orphan = os.path.join(directory, 'crashed.tmp')
+            open(orphan, 'wb').close()
+            os.utime(orphan, (0, 0))
+            second = simulation_cache.SimulationCache(directory=directory)
+            self.assertFalse(os.path.exists(orphan))
+            second.simulate(driver, box)
+            self.assertEqual((second.disk_hits, second.misses), (0, 1))
+            self.assertEqual(os.path.getsize(path), size)
+
+class AlignmentTests(unittest.TestCase):
+
+    def test_find_alignments(self):
+        """Alignments are feasible, Pareto-optimal and correctly evaluated."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        driver = driver_db[0]
+        alignments = alignment.find_alignments(driver, max_volume=0.2,
+                                               max_ripple=0.5, Ql=[7.0, 15.0])
+        self.assertTrue(alignments)
+        for smaller, larger in zip(alignments, alignments[1:]):
+            self.assertLess(smaller.Vab, larger.Vab)
+            self.assertGreater(smaller.f_3, larger.f_3)
+        for result in alignments:
+            self.assertLessEqual(result.Vab, 0.2 + 1e-12)
+            self.assertLessEqual(result.ripple, 0.5)
+            ls = speaker.VentedSpeaker(driver, result.box())
+            self.assertAlmostEqual(ls.f_3(), result.f_3)
+
+        low = alignment.find_alignments(driver, max_volume=0.2,
+                                        target_f3=45.0)
+        self.assertTrue(all(result.f_3 <= 45.0 for result in low))
+
+class RankingTests(unittest.TestCase):
+
+    def test_rank_drivers(self):
+        """Ranking agrees with the scalar speaker, in every chunking."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        expected = sorted(driver_db, key=lambda driver: speaker.VentedSpeaker(
+            driver, box).reference_efficiency(), reverse=True)
+        for chunk_size in (1, 2, 100):
+            scores = ranking.rank_drivers(driver_db, box, k=2, chunk_size=chunk_size,
+                                          by='reference_efficiency')
+            self.assertEqual([score.driver for score in scores], expected[:2])
+        for score in ranking.rank_drivers(driver_db, box, k=10):
+            ls = speaker.VentedSpeaker(score.driver, box)
+            self.assertAlmostEqual(score.f_3, ls.f_3())
+            self.assertAlmostEqual(score.displacement_limited_output,
+                                   ls.displacement_limited_output())
+        with self.assertRaises(ValueError):
+            ranking.rank_drivers(driver_db, box, by='price')
+
+class StreamingTests(unittest.TestCase):
+
+    def setUp(self):
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        self.speaker = speaker.VentedSpeaker(
+            driver_db[0], vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0))
+        self.sample_rate = 8000
+
+    def test_blocks_match_one_pass(self):
+        """Filtering in blocks gives the same signal as in one go."""
+        x = np.random.RandomState(0).uniform(-1, 1, 5000)
+        simulator = streaming.StreamingSimulator(self.speaker, self.sample_rate)
+        pressure, excursion = simulator.process(x)
+        peak = simulator.peak_excursion
+        simulator.reset()
+        blocks = [simulator.process(block) for block in np.array_split(x, 7)]
+        np.testing.assert_allclose(np.concatenate([b[0] for b in blocks]), pressure)
+        np.testing.assert_allclose(np.concatenate([b[1] for b in blocks]), excursion)
+        self.assertEqual(simulator.peak_excursion, peak)
+        self.assertEqual(simulator.samples, x.size)
+
+    def test_sine_amplitude(self):
+        """A steady sine comes out with the amplitude of the analog response."""
+        f = 50.0
+        simulator = streaming.StreamingSimulator(self.speaker, self.sample_rate)
+        t = np.arange(4 * self.sample_rate) / self.sample_rate
+        pressure, excursion = simulator.process(np.sin(2 * np.pi * f * t))
+        _, amplitude = self.speaker.frequency_response(frequencies=[f])
+        passband = np.max(np.abs(pressure[-self.sample_rate:]))
+        self.assertAlmostEqual(20 * np.log10(passband / simulator._pressure_scale),
+                               amplitude[0], 1)
+        X = np.polyval(self.speaker._displacement_coefficients(), 2j * np.pi * f) / \
+            np.polyval(self.speaker._a, 2j * np.pi * f)
+        self.assertAlmostEqual(np.max(np.abs(excursion[-self.sample_rate:])) /
+                               simulator._excursion_scale / np.abs(X), 1.0, 2)
+
+class ToleranceTests(unittest.TestCase):
+
+    def setUp(self):
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        self.driver = driver_db[0]
+        self.box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+
+    def test_sampling(self):
+        """Samples stay within the tolerance and follow the correlations."""
+        samples = tolerance.sample_parameters(
+            self.driver, 20000, tolerance={'fs': 0.15, 'Qts': 0.1},
+            correlation=[[1.0, 0.8, 0.0], [0.8, 1.0, 0.0], [0.0, 0.0, 1.0]],
+            random_state=0)
+        self.assertLessEqual(np.max(np.abs(samples['fs'] / self.driver.fs - 1)), 0.15)
+        self.assertLessEqual(np.max(np.abs(samples['Qts'] / self.driver.Qts - 1)), 0.1)
+        np.testing.assert_array_equal(samples['Vas'], self.driver.Vas)
+        self.assertAlmostEqual(np.corrcoef(samples['fs'], samples['Qts'])[0, 1],
+                               0.8, 1)
+        with self.assertRaises(ValueError):
+            tolerance.sample_parameters(self.driver, 10, tolerance={'Sd': 0.1})
+
+    def test_percentiles_match_direct_evaluation(self):
+        """Chunked histograms give the percentiles of all curves."""
+        n = 3000
+        result = tolerance.tolerance_analysis(self.driver, self.box, n=n,
+                                              chunk_size=700, random_state=1)
+        samples = tolerance.sample_parameters(self.driver, n, random_state=1)
+        batch = speaker.VentedSpeakerBatch(
+            1 / (2 * np.pi * samples['fs']), samples['Vas'] / (air.RHO * air.C ** 2),
+            samples['Qts'], self.box.Tb, self.box.Cab, self.box.Ql)
+        _, amplitude = batch.frequency_response()
+        np.testing.assert_allclose(
+            result.amplitude, np.percentile(amplitude, result.percentiles, axis=0),
+            atol=0.02)
+        np.testing.assert_allclose(
+            result.f_3, np.percentile(batch.f_3(), result.percentiles), rtol=2e-3)
+        self.assertEqual(np.sum(result.f_3_histogram[0]), n)
+        with self.assertRaises(ValueError):
+            tolerance.tolerance_analysis(self.driver, self.box, n=0)
+
+    def test_low_levels(self):
+        """Levels far below the passband are not clamped."""
+        box = vented_box.VentedBox(Vab=0.01, fb=120.0, Ql=20.0)
+        result = tolerance.tolerance_analysis(self.driver, box, n=2000, f_min=5.0,
+                                              random_state=2)
+        samples = tolerance.sample_parameters(self.driver, 2000, random_state=2)
+        batch = speaker.VentedSpeakerBatch(
+            1 / (2 * np.pi * samples['fs']), samples['Vas'] / (air.RHO * air.C ** 2),
+            samples['Qts'], box.Tb, box.Cab, box.Ql)
+        _, amplitude = batch.frequency_response(f_min=5.0)
+        self.assertLess(np.min(amplitude), -60.0)
+        np.testing.assert_allclose(
+            result.amplitude, np.percentile(amplitude, result.percentiles, axis=0),
+            atol=0.02)
+
+class SensitivityTests(unittest.TestCase):
+
+    def test_matches_finite_differences(self):
+        """Analytic derivatives agree with central differences."""
+        driver_db = driver_database.DriverDB.from_file(context.database_file)
+        driver = driver_db[0]
+        box = vented_box.VentedBox(Vab=0.09, fb=40.0, Ql=20.0)
+        result = sensitivity.sensitivities(driver, box)
+
+        def evaluate(parameter, value):
+            perturbed_driver = copy.deepcopy(driver)
+            perturbed_box = vented_box.VentedBox(box.Vab, box.fb, box.Ql)
+            if parameter in ('Vab', 'fb', 'Ql'):
+                setattr(perturbed_box, parameter, value)
+            else:
+                setattr(perturbed_driver, parameter, value)
+            ls = speaker.VentedSpeaker(perturbed_driver, perturbed_box)
+            _, amplitude = ls.frequency_response(frequencies=result.freqs)
+            _, displacement = ls.displacement(frequencies=result.freqs)
+            return amplitude, displacement, ls.f_3()
+
+        for parameter in sensitivity.PARAMETERS:
+            value = getattr(box if parameter in ('Vab', 'fb', 'Ql') else driver,
+                            parameter)
+            h = 1e-6 * value
+            upper = evaluate(parameter, value + h)
+            lower = evaluate(parameter, value - h)
+            for analytic, high, low in zip(result[parameter], upper, lower):
+                np.testing.assert_allclose(analytic[0], (high - low) / (2 * h),
+                                           rtol=1e-5, atol=1e-7 * np.max(np.abs(analytic)))
+
 if __name__ == '__main__':
     unittest.main()